@@ -1,29 +1,105 @@
 import os
-import uuid
+import time
 import logging
-from typing import List, Dict, Any, Optional
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, Dict, Any, Optional
 from datetime import datetime, timezone
 
-from utils.parser import parse_document
-from utils.embedding import get_embeddings
-from utils.vector_store import save_embeddings
+from utils.parser import iter_document_chunks
+from utils.embedding_engine import EmbeddingEngine, get_engine
+from utils.fingerprint import compute_doc_id
+from utils.vector_store import RESCORE, VECTOR_CODEC, StoreWriter, delete_document, get_store_header
+from utils.tracing import record, span, trace_context
 
 logger = logging.getLogger(__name__)
 
+# progress_callback(stage, done, total) — total is None when not known up front
+ProgressCallback = Callable[[str, int, Optional[int]], None]
+
+
+def _batched(items: Iterable[str], size: int) -> Iterator[List[str]]:
+    it = iter(items)
+    while batch := list(islice(it, size)):
+        yield batch
+
+
 class IngestionAgent:
     """
     Handles document ingestion with detailed diagnostics.
+
+    Parsing, chunking, embedding and index writing are streamed: pages flow
+    into the chunker, fixed-size chunk batches go to the embedder and are
+    appended to the store on disk, so memory does not grow with the length
+    of the document (only the final FAISS index holds every vector).
     """
 
     def __init__(
         self,
         default_chunk_size: int = 1000,
         default_chunk_overlap: int = 180,
+        pipeline_batch_size: int = 256,
+        progress_callback: Optional[ProgressCallback] = None,
+        engine: Optional[EmbeddingEngine] = None,
     ):
         self.chunk_size = default_chunk_size
         self.chunk_overlap = default_chunk_overlap
+        self.pipeline_batch_size = pipeline_batch_size
+        self.progress_callback = progress_callback
+        self.engine = engine or get_engine()
+
+    def _reporter(self, callback: Optional[ProgressCallback]) -> ProgressCallback:
+        callback = callback or self.progress_callback
+
+        def report(stage: str, done: int, total: Optional[int]) -> None:
+            if callback is not None:
+                try:
+                    callback(stage, done, total)
+                except Exception:
+                    logger.exception("Progress callback failed")
 
-    def handle_message(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        return report
+
+    def warmup(self) -> None:
+        """Load the embedding model ahead of the first document"""
+        self.engine.load()
+        self.engine.encode(["warmup"])
+
+    def handle_message(
+        self,
+        message: Dict[str, Any],
+        progress_callback: Optional[ProgressCallback] = None,
+    ) -> Dict[str, Any]:
+        """
+        progress_callback overrides the agent-level one for this message only,
+        so one long-lived agent can serve many concurrent uploads.
+        """
+        with trace_context(message.get("trace_id")), span("ingest") as root:
+            result = self._ingest(message, self._reporter(progress_callback))
+            root.set(status=result["status"], doc_id=result.get("doc_id"), chunks=result.get("chunk_count"))
+            return result
+
+    @staticmethod
+    def _doc_id_extra(
+        index_type: str,
+        metadata: Dict[str, Any],
+        vector_codec: Optional[str] = None,
+        rescore: Optional[bool] = None,
+    ) -> Dict[str, Any]:
+        """Payload settings that change the stored index, so they are part of the dedup key"""
+        extra: Dict[str, Any] = {}
+        if index_type != "auto":
+            extra["index_type"] = index_type
+        if metadata:
+            extra["metadata"] = metadata
+        # Effective storage settings (payload, else RAG_VECTOR_CODEC / RAG_RESCORE)
+        codec = vector_codec or VECTOR_CODEC
+        if codec != "float32":
+            extra["vector_codec"] = codec
+        if (RESCORE if rescore is None else rescore):
+            extra["rescore"] = True
+        return extra
+
+    def _ingest(self, message: Dict[str, Any], report: ProgressCallback) -> Dict[str, Any]:
         payload = message.get("payload", {})
         file_path = payload.get("file_path")
 
@@ -37,83 +113,135 @@ class IngestionAgent:
             chunk_size = payload.get("chunk_size", self.chunk_size)
             chunk_overlap = payload.get("chunk_overlap", self.chunk_overlap)
             extra_metadata = payload.get("metadata", {})
+            index_type = payload.get("index_type", "auto")
+            vector_codec = payload.get("vector_codec")         # None → RAG_VECTOR_CODEC
+            rescore = payload.get("rescore")                   # None → RAG_RESCORE
+            force_reindex = payload.get("force_reindex", False)
+            pdf_workers = payload.get("pdf_workers")      # None → RAG_PDF_WORKERS / cpu count
+            previous_doc_id = payload.get("previous_doc_id")     # earlier version of this document
 
             print(f"[Ingestion] Starting | file={os.path.basename(file_path)}")
 
-            # 1. Parse
-            print("[Ingestion] Parsing document...")
-            chunks: List[str] = parse_document(
+            # 0. Content-addressed doc ID – identical bytes + settings → same doc_id
+            started = time.perf_counter()
+            doc_id = compute_doc_id(
                 file_path,
                 chunk_size=chunk_size,
                 chunk_overlap=chunk_overlap,
+                embedding_model=self.engine.model_id,
+                extra=self._doc_id_extra(index_type=index_type, metadata=extra_metadata,
+                                         vector_codec=vector_codec, rescore=rescore),
             )
-            print(f"[Ingestion] Extracted {len(chunks)} chunks")
+            print(f"[Ingestion] doc_id = {doc_id}")
 
-            if not chunks:
-                return self._error_response("No text chunks extracted from document")
+            existing = None if force_reindex else get_store_header(doc_id)
+            if existing is not None:
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                print(f"[Ingestion] Already indexed – reusing existing store ({elapsed_ms:.1f} ms)")
+                # Re-uploaded bytes of an indexed version still replace the earlier one
+                if previous_doc_id and previous_doc_id != doc_id and delete_document(previous_doc_id):
+                    print(f"[Ingestion] Retired previous version {previous_doc_id}")
+                return {
+                    "status": "success",
+                    "doc_id": doc_id,
+                    "chunk_count": existing.get("count"),
+                    "file_name": os.path.basename(file_path),
+                    "deduplicated": True,
+                    "message": f"Document already indexed ({existing.get('count')} chunks)"
+                }
 
-            # 2. Embed
-            print("[Ingestion] Generating embeddings...")
-            embeddings: List[List[float]] = get_embeddings(
-                chunks=chunks,
-                batch_size=32,
-                show_progress=True
-            )
-            print(f"[Ingestion] Created {len(embeddings)} embeddings")
-
-            if len(embeddings) != len(chunks):
-                return self._error_response(
-                    f"Embedding/chunk mismatch: {len(embeddings)} vs {len(chunks)}"
-                )
-
-            # 3. Doc ID
-            doc_id = str(uuid.uuid4())
-            print(f"[Ingestion] Generated doc_id = {doc_id}")
-
-            # 4. Metadata
-            print("[Ingestion] Preparing metadata...")
+            # 1. Metadata (document level → header; per chunk → columnar metadata store)
             base_metadata = {
                 "file_name": os.path.basename(file_path),
                 "file_path": file_path,
                 "ingested_at": datetime.now(timezone.utc).isoformat(),
                 "source": "ingestion_agent",
-                "embedding_model": "all-MiniLM-L6-v2",
+                "embedding_model": self.engine.model_id,
                 **extra_metadata
             }
 
-            chunk_metadata_list = []
-            for i, chunk in enumerate(chunks):
-                chunk_meta = base_metadata.copy()
-                chunk_meta.update({
-                    "chunk_index": i,
-                    "chunk_length": len(chunk),
-                })
-                chunk_metadata_list.append(chunk_meta)
-            print(f"[Ingestion] Created {len(chunk_metadata_list)} metadata entries")
-
-            # 5. Save – this is the most suspicious part
-            print("[Ingestion] Saving to vector store...")
-            try:
-                save_embeddings(
-                    doc_id=doc_id,
-                    chunks=chunks,
-                    embeddings=embeddings,
-                    metadatas=chunk_metadata_list,
-                )
-                print("[Ingestion] save_embeddings completed successfully")
-            except Exception as save_exc:
-                print(f"[Ingestion] ERROR in save_embeddings: {type(save_exc).__name__}: {save_exc}")
-                logger.exception("save_embeddings failed")
-                return self._error_response(f"Vector store save failed: {str(save_exc)}", doc_id=doc_id)
+            # 2. Parse → chunk → embed → append, one batch at a time
+            print("[Ingestion] Streaming parse → embed → index...")
+            chunk_iter = iter_document_chunks(
+                file_path,
+                chunk_size=chunk_size,
+                chunk_overlap=chunk_overlap,
+                on_progress=lambda done, total: report("parse", done, total),
+                pdf_workers=pdf_workers,
+            )
+
+            chunk_count = reused = embedded = embedded_tokens = 0
+            embed_seconds = 0.0
+            embed_wall_s = write_wall_s = 0.0          # stage totals for tracing
+            with StoreWriter(
+                doc_id,
+                index_type=index_type,
+                codec=vector_codec,
+                rescore=rescore,
+                replaces=previous_doc_id,
+                metadata=base_metadata,
+            ) as writer:
+                for batch in _batched(chunk_iter, self.pipeline_batch_size):
+                    t0 = time.perf_counter()
+                    vectors, embed_stats = self.engine.embed_chunks(batch)
+                    t1 = time.perf_counter()
+                    metadatas = [
+                        {"chunk_index": chunk_count + i, "chunk_length": len(chunk)}
+                        for i, chunk in enumerate(batch)
+                    ]
+                    writer.add(batch, vectors, metadatas)
+                    embed_wall_s += t1 - t0
+                    write_wall_s += time.perf_counter() - t1
+
+                    chunk_count += len(batch)
+                    reused += embed_stats["reused"]
+                    embedded += embed_stats["embedded"]
+                    embedded_tokens += embed_stats["tokens"]
+                    embed_seconds += embed_stats["seconds"]
+                    report("embed", chunk_count, None)
+
+                tokens_per_s = embedded_tokens / embed_seconds if embed_seconds else 0.0
+                record("embed", embed_wall_s * 1000, chunks=chunk_count, embedded=embedded,
+                       reused=reused, tokens=embedded_tokens)
+                print(f"[Ingestion] Embedded {chunk_count} chunks (reused={reused}, embedded={embedded}, "
+                      f"{embedded_tokens} tokens @ {tokens_per_s:.0f} tokens/s)")
+
+                if chunk_count == 0:
+                    return self._error_response("No text chunks extracted from document")
+
+                # 3. Build index + publish
+                print("[Ingestion] Building index and saving to vector store...")
+                report("index", 0, 1)
+                commit_started = time.perf_counter()
+                try:
+                    writer.commit()
+                    print("[Ingestion] Vector store commit completed successfully")
+                    # spooling batches to disk + building / writing the index
+                    record("index_write", (write_wall_s + time.perf_counter() - commit_started) * 1000,
+                           chunks=chunk_count, index_type=index_type)
+                except Exception as save_exc:
+                    record("index_write", (write_wall_s + time.perf_counter() - commit_started) * 1000,
+                           status="error", chunks=chunk_count, index_type=index_type)
+                    print(f"[Ingestion] ERROR in vector store commit: {type(save_exc).__name__}: {save_exc}")
+                    logger.exception("Vector store commit failed")
+                    return self._error_response(f"Vector store save failed: {str(save_exc)}", doc_id=doc_id)
+                report("index", 1, 1)
 
             # Success
             print("[Ingestion] Ingestion completed successfully")
             return {
                 "status": "success",
                 "doc_id": doc_id,
-                "chunk_count": len(chunks),
+                "chunk_count": chunk_count,
                 "file_name": os.path.basename(file_path),
-                "message": f"Document indexed successfully ({len(chunks)} chunks)"
+                "deduplicated": False,
+                "reused_chunks": reused,
+                "embedded_chunks": embedded,
+                "embedded_tokens": embedded_tokens,
+                "tokens_per_s": round(tokens_per_s, 1),
+                # previous version's index updated in place rather than rebuilt
+                "index_reused_vectors": (writer.index_info or {}).get("reused_vectors", 0),
+                "message": f"Document indexed successfully ({chunk_count} chunks)"
             }
 
         except Exception as e:
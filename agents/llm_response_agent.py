@@ -1,14 +1,45 @@
 import os
-import streamlit as st
+import time
+import hashlib
 import logging
-from typing import Dict, Any, List, Optional
-import google.generativeai as genai
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+from utils.context_packer import CONTEXT_TOKEN_BUDGET, pack_context
+from utils.llm_client import get_generative_model
+from utils.mcp import has_chunk_refs
+from utils.tracing import span, trace_context
 
 logger = logging.getLogger(__name__)
 
+# "gemini" → Google Generative AI; "stub" → utils.llm_stub (local, no API key)
+LLM_BACKEND = os.environ.get("RAG_LLM_BACKEND", "gemini")
+
+SYSTEM_PROMPT = """You are a precise, helpful RAG assistant.
+Answer ONLY using the provided context.
+If the context does not contain enough information to answer, say so clearly.
+Use markdown formatting when helpful (lists, bold, code blocks).
+Be concise unless the user asks for detailed explanation."""
+
+USER_PROMPT_TEMPLATE = """Context:
+{context}
+
+User question:
+{query}
+
+Answer:"""
+
+# Identifies the prompt wording — cached answers are only reused under the same template
+PROMPT_TEMPLATE_ID = hashlib.sha256(f"{SYSTEM_PROMPT}\n{USER_PROMPT_TEMPLATE}".encode("utf-8")).hexdigest()[:12]
+
+NO_ANSWER = "I'm sorry, but I don't have enough information in the provided context to answer this question."
+
+
 class LLMResponseAgent:
     """
     Handles final answer generation using Gemini + retrieved context (RAG)
+
+    handle_message returns the whole answer at once; handle_message_stream
+    yields it incrementally (see there) for time-to-first-token sensitive UIs.
     """
 
     def __init__(
@@ -18,12 +49,13 @@ class LLMResponseAgent:
         max_output_tokens: int = 2048,
         top_p: float = 0.95,
         top_k: int = 40,
+        backend: str = LLM_BACKEND,
+        context_token_budget: int = CONTEXT_TOKEN_BUDGET,
     ):
-        api_key = st.secrets["GOOGLE_API_KEY"]
-        if not api_key:
-            raise ValueError("GOOGLE_API_KEY environment variable is not set")
-
-        genai.configure(api_key=api_key)
+        if backend not in ("gemini", "stub"):
+            raise ValueError(f"Unknown LLM backend '{backend}' (expected 'gemini' or 'stub')")
+        self.backend = backend
+        self.context_token_budget = context_token_budget
 
         self.model_name = model_name
         self.generation_config = {
@@ -41,9 +73,82 @@ class LLMResponseAgent:
             {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
         ]
 
+    def _get_model(self):
+        # Pooled: genai is configured and the model object built once per process
+        return get_generative_model(
+            self.model_name,
+            generation_config=self.generation_config,
+            safety_settings=self.safety_settings,
+            backend=self.backend,
+        )
+
+    def warmup(self) -> None:
+        """Configure the client and build the model object ahead of the first question"""
+        self._get_model()
+
+    @staticmethod
+    def _request(message: Dict[str, Any]) -> Dict[str, Any]:
+        # Accept both an MCP envelope and its bare payload
+        payload = message.get("payload")
+        return payload if isinstance(payload, dict) else message
+
+    @staticmethod
+    def _chunks(request: Dict[str, Any]) -> List[Any]:
+        chunks = request.get("chunks", []) or request.get("source_chunks", [])
+        if has_chunk_refs(chunks):
+            # sent by reference (MCPMessage.to_bytes(by_reference=True)) – read texts from the store
+            from utils.vector_store import resolve_chunk_refs
+            chunks = resolve_chunk_refs(chunks)
+        return chunks
+
+    def _build_prompt(self, query: str, chunks: List[Any]) -> Tuple[str, str, Dict[str, Any]]:
+        """Returns (full_prompt, context_str, packing stats)"""
+        # ── Build context ────────────────────────────────────────
+        # Merge neighbouring / overlapping chunks, drop repeats, fit the token budget
+        with span("prompt_build", chunks=len(chunks)) as build_span:
+            passages, packing = pack_context(chunks, token_budget=self.context_token_budget)
+            build_span.set(passages=packing["passages"], packed_tokens=packing["packed_tokens"])
+        logger.info(
+            f"Context packed | {packing['raw_chunks']} chunks → {packing['passages']} passages | "
+            f"~{packing['raw_tokens']} → ~{packing['packed_tokens']} tokens"
+        )
+
+        context_parts = []
+        for i, passage in enumerate(passages, 1):
+            meta = passage["metadata"]
+            if meta:
+                indexes = meta.get("chunk_indexes")
+                where = f"chunks {indexes[0]}–{indexes[-1]}" if indexes else f"chunk {meta.get('chunk_index', '?')}"
+                source_info = f"[{i}] {meta.get('file_name', 'unknown')} • {where}"
+                context_parts.append(f"{source_info}\n{passage['text']}")
+            else:
+                # plain string
+                context_parts.append(f"[chunk {i}]\n{passage['text']}")
+
+        context_str = "\n\n".join(context_parts)
+
+        # ── System + user prompt ─────────────────────────────────
+        user_prompt = USER_PROMPT_TEMPLATE.format(context=context_str, query=query)
+
+        return f"{SYSTEM_PROMPT}\n\n{user_prompt}", context_str, packing
+
+    @property
+    def template_id(self) -> str:
+        """Prompt template + model identity (answer cache scope)"""
+        return f"{PROMPT_TEMPLATE_ID}:{self.backend}:{self.model_name}:{self.context_token_budget}"
+
+    @staticmethod
+    def _token_usage(response) -> Dict[str, Optional[int]]:
+        usage = getattr(response, "usage_metadata", None)
+        return {
+            "prompt": getattr(usage, "prompt_token_count", None),
+            "completion": getattr(usage, "candidates_token_count", None),
+        }
+
     def handle_message(self, message: Dict[str, Any]) -> Dict[str, Any]:
         """
-        Expected incoming message structure (from RetrievalAgent):
+        Expected incoming message structure (from RetrievalAgent), either bare
+        or as the payload of an MCP message:
         {
             "query": str,
             "chunks": List[str],              # raw text chunks
@@ -61,12 +166,21 @@ class LLMResponseAgent:
             "status": "success" | "error",
             "error": str | None,
             "used_context_length": int | None,
-            "model": str
+            "context_tokens": Dict,          # packed vs raw token estimate (utils.context_packer)
+            "model": str,
+            "latency_ms": float
         }
         """
+        with trace_context(message.get("trace_id")), span("answer") as root:
+            result = self._answer(message)
+            root.set(status=result["status"])
+            return result
+
+    def _answer(self, message: Dict[str, Any]) -> Dict[str, Any]:
         try:
-            query = message.get("query", "").strip()
-            chunks = message.get("chunks", []) or message.get("source_chunks", [])
+            request = self._request(message)
+            query = request.get("query", "").strip()
+            chunks = self._chunks(request)
 
             if not query:
                 return self._error_response("No user query provided")
@@ -74,53 +188,21 @@ class LLMResponseAgent:
             if not chunks:
                 return self._error_response("No context chunks received – cannot answer")
 
-            # ── Build context ────────────────────────────────────────
-            # You can improve this part later (sorting, relevance re-ranking, etc.)
-            context_parts = []
-            for i, chunk in enumerate(chunks, 1):
-                # If chunk is dict with metadata → format nicely
-                if isinstance(chunk, dict):
-                    text = chunk.get("text", chunk.get("content", ""))
-                    meta = chunk.get("metadata", {})
-                    source_info = f"[{i}] {meta.get('file_name', 'unknown')} • chunk {meta.get('chunk_index', '?')}"
-                    context_parts.append(f"{source_info}\n{text}")
-                else:
-                    # plain string
-                    context_parts.append(f"[chunk {i}]\n{chunk}")
-
-            context_str = "\n\n".join(context_parts)
-
-            # ── System + user prompt ─────────────────────────────────
-            system_prompt = """You are a precise, helpful RAG assistant.
-Answer ONLY using the provided context.
-If the context does not contain enough information to answer, say so clearly.
-Use markdown formatting when helpful (lists, bold, code blocks).
-Be concise unless the user asks for detailed explanation."""
-
-            user_prompt = f"""Context:
-{context_str}
-
-User question:
-{query}
-
-Answer:"""
-
-            full_prompt = f"{system_prompt}\n\n{user_prompt}"
+            full_prompt, context_str, packing = self._build_prompt(query, chunks)
 
             # ── Call Gemini ──────────────────────────────────────────
-            model = genai.GenerativeModel(
-                model_name=self.model_name,
-                generation_config=self.generation_config,
-                safety_settings=self.safety_settings,
-            )
+            started = time.perf_counter()
+            model = self._get_model()
 
-            response = model.generate_content(full_prompt)
+            with span("llm_generate", backend=self.backend, model=self.model_name) as llm_span:
+                response = model.generate_content(full_prompt)
+                llm_span.set(**{f"{k}_tokens": v for k, v in self._token_usage(response).items()})
 
             answer_text = response.text.strip()
 
             # Optional: handle cases where model refuses or returns empty
             if not answer_text or "I cannot" in answer_text[:60].lower():
-                answer_text = answer_text or "I'm sorry, but I don't have enough information in the provided context to answer this question."
+                answer_text = answer_text or NO_ANSWER
 
             return {
                 "status": "success",
@@ -128,16 +210,95 @@ Answer:"""
                 "source_chunks": chunks,           # return original chunks (with metadata if present)
                 "model": self.model_name,
                 "used_context_length": len(context_str),
-                "token_usage": {
-                    "prompt": response.usage_metadata.prompt_token_count if hasattr(response, "usage_metadata") else None,
-                    "completion": response.usage_metadata.candidates_token_count if hasattr(response, "usage_metadata") else None,
-                }
+                "context_tokens": packing,
+                "token_usage": self._token_usage(response),
+                "latency_ms": (time.perf_counter() - started) * 1000,
             }
 
         except Exception as e:
             logger.exception("LLM generation failed")
             return self._error_response(str(e))
 
+    def handle_message_stream(self, message: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """
+        Streaming variant of handle_message. Yields events:
+
+            {"type": "delta", "text": str}          as partial text arrives
+            {"type": "done", **result}              once, at the end — result as in
+                                                    handle_message plus "ttft_ms" / "total_ms"
+            {"type": "error", **error_response}     instead of "done" on failure
+
+        ttft_ms is time-to-first-token: from the request to the first non-empty delta.
+        """
+        with trace_context(message.get("trace_id")), span("answer", stream=True) as root:
+            for event in self._answer_stream(message):
+                if event["type"] != "delta":
+                    root.set(status=event.get("status"))
+                yield event
+
+    def _answer_stream(self, message: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        try:
+            request = self._request(message)
+            query = request.get("query", "").strip()
+            chunks = self._chunks(request)
+
+            if not query:
+                yield {"type": "error", **self._error_response("No user query provided")}
+                return
+            if not chunks:
+                yield {"type": "error", **self._error_response("No context chunks received – cannot answer")}
+                return
+
+            full_prompt, context_str, packing = self._build_prompt(query, chunks)
+
+            started = time.perf_counter()
+            ttft_ms = None
+            parts: List[str] = []
+
+            with span("llm_generate", backend=self.backend, model=self.model_name, stream=True) as llm_span:
+                response = self._get_model().generate_content(full_prompt, stream=True)
+                for piece in response:
+                    try:
+                        text = piece.text
+                    except ValueError:             # e.g. a chunk carrying only safety / finish info
+                        continue
+                    if not text:
+                        continue
+                    if ttft_ms is None:
+                        ttft_ms = (time.perf_counter() - started) * 1000
+                    parts.append(text)
+                    yield {"type": "delta", "text": text}
+                llm_span.set(ttft_ms=ttft_ms, **{f"{k}_tokens": v for k, v in self._token_usage(response).items()})
+
+            total_ms = (time.perf_counter() - started) * 1000
+            answer_text = "".join(parts).strip()
+            if not answer_text:
+                answer_text = NO_ANSWER
+                yield {"type": "delta", "text": answer_text}
+
+            # usage_metadata is complete only after the stream has been drained
+            token_usage = self._token_usage(response)
+            logger.info(
+                f"LLM stream finished | ttft={ttft_ms if ttft_ms is not None else float('nan'):.0f} ms | "
+                f"total={total_ms:.0f} ms | tokens={token_usage}"
+            )
+            yield {
+                "type": "done",
+                "status": "success",
+                "answer": answer_text,
+                "source_chunks": chunks,
+                "model": self.model_name,
+                "used_context_length": len(context_str),
+                "context_tokens": packing,
+                "token_usage": token_usage,
+                "ttft_ms": ttft_ms,
+                "total_ms": total_ms,
+            }
+
+        except Exception as e:
+            logger.exception("LLM streaming generation failed")
+            yield {"type": "error", **self._error_response(str(e))}
+
     def _error_response(self, msg: str) -> Dict[str, Any]:
         return {
             "status": "error",
@@ -0,0 +1,92 @@
+import time
+import threading
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _default_factories() -> Dict[str, Callable[[], Any]]:
+    # Imported lazily so the registry module itself stays cheap to import
+    from agents.ingestion_agent import IngestionAgent
+    from agents.retrieval_agent import RetrievalAgent
+    from agents.llm_response_agent import LLMResponseAgent
+
+    return {
+        "IngestionAgent": IngestionAgent,
+        "RetrievalAgent": RetrievalAgent,
+        "LLMResponseAgent": LLMResponseAgent,
+    }
+
+
+class AgentRegistry:
+    """
+    Process-lifetime agent instances, looked up by name (the MCP receiver).
+
+    Agents are built once, on first use or by warmup(), and shared by every
+    session and request; they keep no per-request state.
+    """
+
+    def __init__(self, factories: Optional[Dict[str, Callable[[], Any]]] = None):
+        self._factories = factories if factories is not None else _default_factories()
+        self._agents: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self.warmup_ms: Dict[str, float] = {}
+
+    def register(self, name: str, factory: Callable[[], Any]) -> None:
+        with self._lock:
+            self._factories[name] = factory
+            self._agents.pop(name, None)
+
+    def get(self, name: str) -> Any:
+        agent = self._agents.get(name)
+        if agent is not None:
+            return agent
+        with self._lock:
+            agent = self._agents.get(name)
+            if agent is None:
+                factory = self._factories.get(name)
+                if factory is None:
+                    raise KeyError(f"No agent registered as '{name}'")
+                agent = self._agents[name] = factory()
+                logger.info(f"Agent created: {name}")
+            return agent
+
+    def names(self) -> List[str]:
+        return list(self._factories)
+
+    def dispatch(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """Route an MCP message to its receiver's handle_message"""
+        return self.get(message["receiver"]).handle_message(message)
+
+    def warmup(self, names: Optional[List[str]] = None) -> Dict[str, float]:
+        """
+        Build the agents and let each load its models / clients now, so the
+        first user request only pays for its own work. Failures are logged,
+        not raised (e.g. a missing API key should not block ingestion).
+        Returns milliseconds spent per agent.
+        """
+        for name in names or self.names():
+            started = time.perf_counter()
+            try:
+                agent = self.get(name)
+                if hasattr(agent, "warmup"):
+                    agent.warmup()
+            except Exception:
+                logger.exception(f"Warmup failed for {name}")
+            self.warmup_ms[name] = (time.perf_counter() - started) * 1000
+        logger.info(f"Agent warmup: { {k: round(v) for k, v in self.warmup_ms.items()} } ms")
+        return dict(self.warmup_ms)
+
+
+_default_registry: Optional[AgentRegistry] = None
+_default_registry_guard = threading.Lock()
+
+
+def get_registry() -> AgentRegistry:
+    """Process-wide registry"""
+    global _default_registry
+    with _default_registry_guard:
+        if _default_registry is None:
+            _default_registry = AgentRegistry()
+        return _default_registry
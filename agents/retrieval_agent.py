@@ -1,14 +1,22 @@
 import logging
 from typing import Dict, Any, List, Optional
 
-from utils.vector_store import search_similar_chunks
+from utils.embedding_engine import get_engine
+from utils.vector_store import (
+    search_similar_chunks,
+    search_similar_chunks_batch,
+    search_collection,
+    search_collection_batch,
+    sync_collection,
+)
+from utils.tracing import span, trace_context
 
 logger = logging.getLogger(__name__)
 
 class RetrievalAgent:
     """
-    Responsible for retrieving the most relevant context chunks for a given query
-    filtered to a specific document (doc_id).
+    Responsible for retrieving the most relevant context chunks for a given query,
+    either within a specific document (doc_id) or across the whole collection.
     """
 
     def __init__(
@@ -27,17 +35,27 @@ class RetrievalAgent:
         self.min_score_threshold = min_score_threshold
         self.score_field = score_field
 
+    def warmup(self) -> None:
+        """Load the embedding model, start the query batcher and open the collection"""
+        get_engine().embed_query("warmup")
+        sync_collection()
+
     def handle_message(self, message: Dict[str, Any]) -> Dict[str, Any]:
         """
         Expected message format (from Streamlit / user):
         {
             "payload": {
                 "query": str,
-                "doc_id": str,
                 # optional:
+                "doc_id": str | None,       # omit to search every ingested document
+                "doc_ids": List[str] | None,  # restrict corpus search to these documents
                 "k": int | None,
                 "min_score": float | None,
-                "filter": dict | None,      # e.g. {"file_name": "...", "chunk_index": ...}
+                "filter": dict | None,      # e.g. {"file_name": "...", "chunk_index": {"$lt": 20}}
+                                            # (syntax: utils.metadata_store)
+                "nprobe": int | None,       # ANN knobs, only used by IVF / HNSW indexes
+                "ef_search": int | None,
+                "include_raw": bool,        # also return raw_results (default False)
             },
             ...
         }
@@ -47,99 +65,78 @@ class RetrievalAgent:
             "status":        "success" | "error",
             "query":         str,
             "chunks":        List[Dict],           # best format for downstream LLM
-            "raw_results":   List[Dict] | List,    # original return value (for debugging)
+            "raw_results":   List[Dict] | List,    # original return value (only with include_raw)
             "retrieved_count": int,
             "message":       str | None,
             "error":         str | None
         }
+
+        RETRIEVE_BATCH_REQUEST messages are handled by _retrieve_batch (see there).
         """
+        if message.get("type") == "RETRIEVE_BATCH_REQUEST":
+            with trace_context(message.get("trace_id")), span("retrieve_batch") as root:
+                result = self._retrieve_batch(message)
+                root.set(status=result["status"], queries=result.get("query_count"),
+                         retrieved=result.get("retrieved_count"))
+                return result
+
+        with trace_context(message.get("trace_id")), span("retrieve") as root:
+            result = self._retrieve(message)
+            root.set(status=result["status"], retrieved=result.get("retrieved_count"))
+            return result
+
+    def _retrieve(self, message: Dict[str, Any]) -> Dict[str, Any]:
         try:
             payload = message.get("payload", {})
             query = payload.get("query", "").strip()
             doc_id = payload.get("doc_id")
+            doc_ids = payload.get("doc_ids")
 
             if not query:
                 return self._error_response("No query provided")
 
-            if not doc_id:
-                return self._error_response("No doc_id provided — retrieval must be document-specific")
-
             # Allow overriding defaults per request
             k = payload.get("k", self.default_k)
             min_score = payload.get("min_score", self.min_score_threshold)
             metadata_filter = payload.get("filter", None)
+            # raw search results duplicate every chunk text; only on request
+            include_raw = payload.get("include_raw", False)
 
-            logger.info(f"Retrieval started | doc_id={doc_id[:8]}... | query='{query[:60]}...' | k={k}")
+            scope = doc_id[:8] + "..." if doc_id else f"collection({len(doc_ids) if doc_ids else 'all'})"
+            logger.info(f"Retrieval started | scope={scope} | query='{query[:60]}...' | k={k}")
 
             # ── Perform vector search ────────────────────────────────────────
-            search_result = search_similar_chunks(
-                doc_id=doc_id,
-                query=query,
-                k=k,
-                # pass filter if your vector store supports metadata filtering
-                # filter=metadata_filter,
-            )
-
-            # ── Normalize result format ──────────────────────────────────────
-            # We want downstream (LLM) to receive clean list of dicts
-            formatted_chunks = []
-
-            # Handle different possible return shapes from search_similar_chunks
-            if isinstance(search_result, list):
-                for item in search_result:
-
-                    # Case 1: returns plain strings
-                    if isinstance(item, str):
-                        formatted_chunks.append({
-                            "text": item,
-                            "score": None,
-                            "metadata": {}
-                        })
-
-                    # Case 2: returns tuples (text, score)
-                    elif isinstance(item, tuple) and len(item) >= 2:
-                        text, score = item[:2]
-                        meta = item[2] if len(item) > 2 else {}
-                        formatted_chunks.append({
-                            "text": text,
-                            "score": score,
-                            "metadata": meta or {}
-                        })
-
-                    # Case 3: returns dicts (most common with Chroma, Qdrant, etc.)
-                    elif isinstance(item, dict):
-                        text = (
-                            item.get("text")
-                            or item.get("content")
-                            or item.get("page_content")
-                            or item.get("document", "")
-                        )
-                        score = item.get(self.score_field) or item.get("score") or item.get("distance")
-                        meta = item.get("metadata", {}) or {}
-                        formatted_chunks.append({
-                            "text": text,
-                            "score": score,
-                            "metadata": meta
-                        })
-
-            # Filter by minimum score if applicable
-            if min_score is not None and any(c["score"] is not None for c in formatted_chunks):
-                if self.score_field.lower() in ["distance", "dist"]:  # lower = better
-                    formatted_chunks = [c for c in formatted_chunks if c["score"] is None or c["score"] <= min_score]
-                else:  # similarity / cosine (higher = better)
-                    formatted_chunks = [c for c in formatted_chunks if c["score"] is None or c["score"] >= min_score]
+            if doc_id:
+                search_result = search_similar_chunks(
+                    doc_id=doc_id,
+                    query=query,
+                    k=k,
+                    nprobe=payload.get("nprobe"),
+                    ef_search=payload.get("ef_search"),
+                    metadata_filter=metadata_filter,
+                    with_metadata=True,
+                )
+            else:
+                search_result = search_collection(
+                    query=query,
+                    k=k,
+                    doc_ids=doc_ids,
+                    metadata_filter=metadata_filter,
+                )
+
+            formatted_chunks = self._format_chunks(search_result, min_score)
 
             retrieved_count = len(formatted_chunks)
 
             if retrieved_count == 0:
-                logger.warning(f"No relevant chunks found for query in doc {doc_id[:8]}")
+                logger.warning(f"No relevant chunks found for query in {scope}")
                 return {
                     "status": "warning",
                     "query": query,
                     "chunks": [],
                     "retrieved_count": 0,
                     "message": "No relevant context found in the document for this question.",
-                    "raw_results": search_result
+                    **({"raw_results": search_result} if include_raw else {}),
                 }
 
             logger.info(f"Retrieval successful | retrieved {retrieved_count} chunks")
@@ -149,7 +146,7 @@ class RetrievalAgent:
                 "query": query,
                 "chunks": formatted_chunks,          # ← preferred format for LLM agent
                 "retrieved_count": retrieved_count,
-                "raw_results": search_result,        # useful for debugging
+                **({"raw_results": search_result} if include_raw else {}),     # debugging only
                 "doc_id": doc_id
             }
 
@@ -157,6 +154,154 @@ class RetrievalAgent:
             logger.exception("Retrieval failed")
             return self._error_response(str(e))
 
+    def _retrieve_batch(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Many queries in one message (evaluation runs, query expansion, FAQ pre-answering):
+        {
+            "type": "RETRIEVE_BATCH_REQUEST",
+            "payload": {
+                "queries": List[str],
+                # optional, applied to every query – same meaning as in RETRIEVE_REQUEST:
+                "doc_id", "doc_ids", "k", "min_score", "filter", "nprobe", "ef_search", "include_raw"
+            },
+        }
+
+        The queries are embedded in one batch and searched with one matrix
+        search per index (the document's own index with doc_id, otherwise each
+        collection shard holding the doc_ids / all documents).
+
+        Returns:
+        {
+            "status":          "success" | "warning" | "error",
+            "results":         List[Dict],   # per query, in order – each shaped like a
+                                             # RETRIEVE_REQUEST response (usable as CONTEXT_RESPONSE)
+            "query_count":     int,
+            "retrieved_count": int,          # chunks over all queries
+            "error":           str | None
+        }
+        """
+        try:
+            payload = message.get("payload", {})
+            queries = [(q or "").strip() for q in payload.get("queries") or []]
+            doc_id = payload.get("doc_id")
+            doc_ids = payload.get("doc_ids")
+
+            if not any(queries):
+                return self._batch_error_response("No queries provided")
+
+            k = payload.get("k", self.default_k)
+            min_score = payload.get("min_score", self.min_score_threshold)
+            metadata_filter = payload.get("filter", None)
+            include_raw = payload.get("include_raw", False)
+
+            # Empty queries get an error entry; the rest are searched together
+            searched = [q for q in queries if q]
+            scope = doc_id[:8] + "..." if doc_id else f"collection({len(doc_ids) if doc_ids else 'all'})"
+            logger.info(f"Batch retrieval started | scope={scope} | queries={len(searched)} | k={k}")
+
+            if doc_id:
+                search_results = search_similar_chunks_batch(
+                    doc_id=doc_id,
+                    queries=searched,
+                    k=k,
+                    nprobe=payload.get("nprobe"),
+                    ef_search=payload.get("ef_search"),
+                    metadata_filter=metadata_filter,
+                    with_metadata=True,
+                )
+            else:
+                search_results = search_collection_batch(
+                    queries=searched,
+                    k=k,
+                    doc_ids=doc_ids,
+                    metadata_filter=metadata_filter,
+                )
+            by_query = iter(search_results)
+
+            results = []
+            for query in queries:
+                if not query:
+                    results.append({**self._error_response("No query provided"), "query": query})
+                    continue
+                search_result = next(by_query)
+                chunks = self._format_chunks(search_result, min_score)
+                results.append({
+                    "status": "success" if chunks else "warning",
+                    "query": query,
+                    "chunks": chunks,
+                    "retrieved_count": len(chunks),
+                    "message": None if chunks else "No relevant context found in the document for this question.",
+                    **({"raw_results": search_result} if include_raw else {}),
+                    "doc_id": doc_id,
+                })
+
+            retrieved_count = sum(r["retrieved_count"] for r in results)
+            logger.info(f"Batch retrieval finished | {len(results)} queries | {retrieved_count} chunks")
+
+            return {
+                "status": "success" if retrieved_count else "warning",
+                "results": results,
+                "query_count": len(results),
+                "retrieved_count": retrieved_count,
+                "doc_id": doc_id,
+            }
+
+        except Exception as e:
+            logger.exception("Batch retrieval failed")
+            return self._batch_error_response(str(e))
+
+    def _format_chunks(self, search_result: Any, min_score: Optional[float]) -> List[Dict[str, Any]]:
+        """Normalize one query's search results to {"text", "score", "metadata"} dicts and apply min_score"""
+        # We want downstream (LLM) to receive clean list of dicts
+        formatted_chunks = []
+
+        # Handle different possible return shapes from search_similar_chunks
+        if isinstance(search_result, list):
+            for item in search_result:
+
+                # Case 1: returns plain strings
+                if isinstance(item, str):
+                    formatted_chunks.append({
+                        "text": item,
+                        "score": None,
+                        "metadata": {}
+                    })
+
+                # Case 2: returns tuples (text, score)
+                elif isinstance(item, tuple) and len(item) >= 2:
+                    text, score = item[:2]
+                    meta = item[2] if len(item) > 2 else {}
+                    formatted_chunks.append({
+                        "text": text,
+                        "score": score,
+                        "metadata": meta or {}
+                    })
+
+                # Case 3: returns dicts (most common with Chroma, Qdrant, etc.)
+                elif isinstance(item, dict):
+                    text = (
+                        item.get("text")
+                        or item.get("content")
+                        or item.get("page_content")
+                        or item.get("document", "")
+                    )
+                    score = item.get(self.score_field) or item.get("score") or item.get("distance")
+                    meta = item.get("metadata", {}) or {}
+                    formatted_chunks.append({
+                        "text": text,
+                        "score": score,
+                        "metadata": meta
+                    })
+
+        # Filter by minimum score if applicable
+        if min_score is not None and any(c["score"] is not None for c in formatted_chunks):
+            if self.score_field.lower() in ["distance", "dist"]:  # lower = better
+                formatted_chunks = [c for c in formatted_chunks if c["score"] is None or c["score"] <= min_score]
+            else:  # similarity / cosine (higher = better)
+                formatted_chunks = [c for c in formatted_chunks if c["score"] is None or c["score"] >= min_score]
+
+        return formatted_chunks
+
     def _error_response(self, msg: str) -> Dict[str, Any]:
         return {
             "status": "error",
@@ -166,3 +311,13 @@ class RetrievalAgent:
             "error": msg,
             "message": "Failed to retrieve context from document"
         }
+
+    def _batch_error_response(self, msg: str) -> Dict[str, Any]:
+        return {
+            "status": "error",
+            "results": [],
+            "query_count": 0,
+            "retrieved_count": 0,
+            "error": msg,
+            "message": "Failed to retrieve context for the queries"
+        }
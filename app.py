@@ -1,9 +1,13 @@
 import os
+import time
 import streamlit as st
-from agents.ingestion_agent import IngestionAgent
-from agents.retrieval_agent import RetrievalAgent
-from agents.llm_response_agent import LLMResponseAgent
-from utils.mcp import create_message, generate_trace_id
+from agents.registry import AgentRegistry, get_registry
+from utils.bus import MessageBus, get_bus
+from utils.jobs import IngestionJobQueue, get_job_queue
+from utils.tracing import METRICS_PORT, start_metrics_server, tracing_enabled
+from utils.mcp import create_message
+from utils.answer_cache import ANSWER_CACHE_ENABLED, get_answer_cache
+from utils.vector_store import get_index_version
 
 # ────────────────────────────────────────────────
 #  Folders
@@ -22,6 +26,35 @@ st.set_page_config(
 
 st.title("Agentic RAG Chatbot (with MCP)")
 
+# ────────────────────────────────────────────────
+#  Agents – built and warmed up once per process, shared by all sessions
+# ────────────────────────────────────────────────
+@st.cache_resource(show_spinner="Warming up models…")
+def get_agents() -> AgentRegistry:
+    registry = get_registry()
+    registry.warmup()
+    if tracing_enabled() and METRICS_PORT:
+        start_metrics_server(METRICS_PORT)      # Prometheus scrape target for the stage spans
+    return registry
+
+
+@st.cache_resource
+def get_message_bus() -> MessageBus:
+    # Agents run on the bus's worker pools, so requests from several sessions overlap
+    get_agents()
+    return get_bus()
+
+
+@st.cache_resource
+def get_ingest_jobs() -> IngestionJobQueue:
+    # Worker processes are shared by all sessions
+    return get_job_queue()
+
+
+agents = get_agents()
+bus = get_message_bus()
+ingest_jobs = get_ingest_jobs()
+
 # ────────────────────────────────────────────────
 #  Initialize session state
 # ────────────────────────────────────────────────
@@ -40,6 +73,18 @@ if "last_uploaded_filename" not in st.session_state:
 if "ingestion_done" not in st.session_state:
     st.session_state.ingestion_done = False
 
+if "indexed_files" not in st.session_state:
+    st.session_state.indexed_files = {}     # file name → doc_id of its latest indexed version
+
+if "ingest_jobs" not in st.session_state:
+    st.session_state.ingest_jobs = {}       # file name → id of its running ingestion job
+
+if "active_job" not in st.session_state:
+    st.session_state.active_job = None      # last submitted job – its document becomes active
+
+if "ingest_notice" not in st.session_state:
+    st.session_state.ingest_notice = None
+
 # ────────────────────────────────────────────────
 #  Sidebar – Document status
 # ────────────────────────────────────────────────
@@ -56,6 +101,23 @@ with st.sidebar:
     else:
         st.info("No document processed yet")
 
+    if ANSWER_CACHE_ENABLED:
+        cache_stats = get_answer_cache().stats()
+        if cache_stats["lookups"]:
+            st.caption(
+                f"Answer cache: {cache_stats['hit_rate']:.0%} hit rate "
+                f"({cache_stats['hits']}/{cache_stats['lookups']}) · "
+                f"saved {cache_stats['saved_latency_ms'] / 1000:.1f} s"
+            )
+
+    with st.expander("Agent queues", expanded=False):
+        for msg_type, m in bus.metrics().items():
+            latency = f" · p95 {m['service_ms_p95']:.0f} ms" if m["service_ms_p95"] is not None else ""
+            st.caption(
+                f"**{msg_type}**: {m['depth']}/{m['capacity']} queued · "
+                f"{m['in_flight']}/{m['concurrency']} running · {m['processed']} done{latency}"
+            )
+
 # ────────────────────────────────────────────────
 #  File uploader
 # ────────────────────────────────────────────────
@@ -79,36 +141,89 @@ if uploaded_file is not None:
         st.info(f"Using already saved file: **{uploaded_file.name}**")
 
     # ── Process button ─────────────────────────────
-    if not st.session_state.ingestion_done or st.session_state.last_uploaded_filename != uploaded_file.name:
+    # Indexing runs as a background job (utils.jobs): this session – and every
+    # other one – stays responsive, and a rerun does not restart the work
+    if uploaded_file.name in st.session_state.ingest_jobs:
+        st.caption("Indexing in the background – you can keep chatting meanwhile.")
+    elif not st.session_state.ingestion_done or st.session_state.last_uploaded_filename != uploaded_file.name:
         if st.button("📄 Process & Index Document", type="primary", use_container_width=True):
-            with st.spinner("Ingesting document... (may take a while for large files)"):
-                try:
-                    ingestor = IngestionAgent()
-                    trace = generate_trace_id()
-
-                    msg = create_message(
-                        sender="User",
-                        receiver="IngestionAgent",
-                        msg_type="INGEST_REQUEST",
-                        trace_id=trace,
-                        payload={"file_path": save_path}
-                    )
+            try:
+                job_id = ingest_jobs.submit(
+                    save_path,
+                    # lets an edited re-upload replace the old version in place
+                    previous_doc_id=st.session_state.indexed_files.get(uploaded_file.name),
+                )
+                st.session_state.ingest_jobs[uploaded_file.name] = job_id
+                st.session_state.active_job = job_id
+                st.rerun()
+            except Exception as e:
+                st.error(f"Could not queue ingestion\n{str(e)}")
 
-                    response = ingestor.handle_message(msg)
 
-                    if "doc_id" in response and response["doc_id"]:
-                        st.session_state.doc_id = response["doc_id"]
-                        st.session_state.trace = trace
-                        st.session_state.ingestion_done = True
-                        st.session_state.last_uploaded_filename = uploaded_file.name
-                        st.success(f"Document indexed successfully\n**doc_id:** {response['doc_id']}")
-                    else:
-                        st.error("Ingestion did not return a valid doc_id")
+def on_ingestion_finished(file_name: str, job: dict) -> None:
+    response = job.get("result") or {}
+    if job["status"] != "succeeded" or not response.get("doc_id"):
+        st.session_state.ingest_notice = ("error", f"Ingestion of **{file_name}** failed\n{job.get('error') or ''}")
+        return
 
-                except Exception as e:
-                    st.error(f"Ingestion failed\n{str(e)}")
-                    import traceback
-                    st.code(traceback.format_exc(), language="python")
+    previous_doc_id = st.session_state.indexed_files.get(file_name)
+    if ANSWER_CACHE_ENABLED and previous_doc_id and previous_doc_id != response["doc_id"]:
+        get_answer_cache().invalidate(previous_doc_id)     # answers about the old version
+    st.session_state.indexed_files[file_name] = response["doc_id"]
+
+    # The most recently submitted document becomes the active one
+    if st.session_state.active_job == job["job_id"] or not st.session_state.doc_id:
+        st.session_state.doc_id = response["doc_id"]
+        st.session_state.trace = job["job_id"]           # the job id is the ingestion trace id
+        st.session_state.ingestion_done = True
+        st.session_state.last_uploaded_filename = file_name
+
+    details = []
+    if response.get("deduplicated"):
+        details.append("Identical document was already indexed – reused existing index")
+    elif response.get("reused_chunks"):
+        details.append(
+            f"Reused {response['reused_chunks']} cached chunk embeddings, "
+            f"embedded {response['embedded_chunks']} new chunks"
+        )
+    if response.get("tokens_per_s"):
+        details.append(f"Embedding throughput: {response['tokens_per_s']:,.0f} tokens/s")
+    st.session_state.ingest_notice = (
+        "success", f"**{file_name}** indexed successfully\n**doc_id:** {response['doc_id']}", details,
+    )
+
+
+@st.fragment(run_every=1.0)
+def show_ingestion_jobs():
+    """Polls this session's jobs; reruns the whole page once one has finished"""
+    finished = False
+    for file_name, job_id in list(st.session_state.ingest_jobs.items()):
+        job = ingest_jobs.status(job_id)
+        if job is None or job["status"] not in ("queued", "running"):
+            del st.session_state.ingest_jobs[file_name]
+            if job is not None:
+                on_ingestion_finished(file_name, job)
+            finished = True
+            continue
+        if job["status"] == "queued":
+            st.progress(0.0, text=f"{file_name}: waiting for a worker…")
+        elif job["total"]:
+            st.progress(min(job["done"] / job["total"], 1.0), text=f"{file_name} – {job['stage']}: {job['done']}/{job['total']}")
+        else:
+            st.progress(0.5, text=f"{file_name} – {job['stage'] or 'starting'}: {job['done'] or 0} chunks")
+    if finished:
+        st.rerun()
+
+
+if st.session_state.ingest_jobs:
+    show_ingestion_jobs()
+
+if st.session_state.ingest_notice:
+    kind, text, *details = st.session_state.ingest_notice
+    (st.success if kind == "success" else st.error)(text)
+    for line in (details[0] if details else []):
+        st.caption(line)
+    st.session_state.ingest_notice = None
 
 # ────────────────────────────────────────────────
 #  Chat interface – only shown when we have a doc
@@ -127,26 +242,47 @@ if st.session_state.doc_id:
             st.markdown(prompt)
 
         with st.chat_message("assistant"):
-            with st.spinner("Searching document → Generating answer…"):
-                try:
-                    retriever = RetrievalAgent()
-                    responder = LLMResponseAgent()
+            try:
+                responder = agents.get("LLMResponseAgent")
+                started = time.perf_counter()
 
-                    # 1. Retrieve
-                    retrieve_msg = create_message(
-                        sender="User",
-                        receiver="RetrievalAgent",
-                        msg_type="RETRIEVE_REQUEST",
-                        trace_id=st.session_state.trace,
-                        payload={
-                            "query": prompt,
-                            "doc_id": st.session_state.doc_id
-                        }
+                # 0. Semantic answer cache – near-duplicate questions skip retrieval + LLM
+                answer_cache = get_answer_cache() if ANSWER_CACHE_ENABLED else None
+                cache_scope = None
+                cached = None
+                if answer_cache is not None:
+                    cache_scope = answer_cache.scope(
+                        st.session_state.doc_id,
+                        get_index_version(st.session_state.doc_id),
+                        responder.template_id,
                     )
+                    cached = answer_cache.lookup(cache_scope, prompt)
 
-                    retrieve_result = retriever.handle_message(retrieve_msg)
+                if cached is not None:
+                    answer = cached["answer"]
+                    sources = cached["source_chunks"]
+                    st.markdown(answer)
+                    st.caption(
+                        f"Cached answer (similarity {cached['similarity']:.2f} to “{cached['question']}”) · "
+                        f"saved ~{cached['cost_ms']:.0f} ms"
+                    )
+                else:
+                    # 1. Retrieve
+                    with st.spinner("Searching document…"):
+                        retrieve_msg = create_message(
+                            sender="User",
+                            receiver="RetrievalAgent",
+                            msg_type="RETRIEVE_REQUEST",
+                            trace_id=st.session_state.trace,
+                            payload={
+                                "query": prompt,
+                                "doc_id": st.session_state.doc_id
+                            }
+                        )
+
+                        retrieve_result = bus.request(retrieve_msg)
 
-                    # 2. Generate answer
+                    # 2. Generate answer – streamed, rendered as it arrives
                     llm_msg = create_message(
                         sender="RetrievalAgent",
                         receiver="LLMResponseAgent",
@@ -155,27 +291,49 @@ if st.session_state.doc_id:
                         payload=retrieve_result
                     )
 
-                    final_result = responder.handle_message(llm_msg)
+                    final_result: dict = {}
 
-                    answer = final_result.get("answer", "No answer generated.")
+                    def answer_deltas():
+                        for event in bus.stream(llm_msg):
+                            if event["type"] == "delta":
+                                yield event["text"]
+                            else:
+                                final_result.update(event)
+
+                    streamed = st.write_stream(answer_deltas())
+
+                    if final_result.get("type") == "error":
+                        answer = final_result.get("answer", "No answer generated.")
+                        st.error(final_result.get("error") or answer)
+                    else:
+                        answer = final_result.get("answer") or (streamed if isinstance(streamed, str) else "")
+                        if final_result.get("ttft_ms") is not None:
+                            st.caption(
+                                f"First token {final_result['ttft_ms']:.0f} ms · total {final_result['total_ms']:.0f} ms"
+                            )
                     sources = final_result.get("source_chunks", [])
 
-                    st.markdown(answer)
+                    if answer_cache is not None and final_result.get("status") == "success":
+                        answer_cache.store(
+                            cache_scope, prompt, answer, sources,
+                            cost_ms=(time.perf_counter() - started) * 1000,
+                        )
 
-                    if sources:
-                        with st.expander("📚 Source chunks", expanded=False):
-                            for i, chunk in enumerate(sources, 1):
-                                st.markdown(f"**Chunk {i}**")
-                                st.code(chunk.strip(), language=None)
+                if sources:
+                    with st.expander("📚 Source chunks", expanded=False):
+                        for i, chunk in enumerate(sources, 1):
+                            text = chunk.get("text", "") if isinstance(chunk, dict) else chunk
+                            st.markdown(f"**Chunk {i}**")
+                            st.code(text.strip(), language=None)
 
-                    st.session_state.messages.append({
-                        "role": "assistant",
-                        "content": answer
-                    })
+                st.session_state.messages.append({
+                    "role": "assistant",
+                    "content": answer
+                })
 
-                except Exception as e:
-                    st.error(f"Error during retrieval / generation\n{str(e)}")
-                    st.exception(e)
+            except Exception as e:
+                st.error(f"Error during retrieval / generation\n{str(e)}")
+                st.exception(e)
 
 else:
     # No document yet → helper message
@@ -0,0 +1,121 @@
+"""
+Recall@k vs latency report for the index types in utils.index_types.
+
+    python -m benchmarks.ann_recall --n 100000 --k 10
+    python -m benchmarks.ann_recall --doc-id <doc_id>      # vectors of a stored document
+
+Ground truth is an exact flat search over the same vectors.
+"""
+import argparse
+import json
+import time
+import numpy as np
+import faiss
+from typing import Any, Dict, List
+
+from utils.index_types import build_index, search_params
+
+NPROBE_SWEEP = [1, 4, 16, 64]
+EF_SEARCH_SWEEP = [16, 32, 64, 128]
+
+
+def synthetic_vectors(n: int, dim: int, n_clusters: int = 256, seed: int = 0) -> np.ndarray:
+    """Clustered, L2-normalized vectors — closer to sentence embeddings than uniform noise"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, n_clusters, size=n)
+    vectors = centers[labels] + 0.35 * rng.standard_normal((n, dim)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def stored_vectors(doc_id: str) -> np.ndarray:
+    from utils.vector_store import _load_store
+    from utils.index_types import reconstruct_vectors
+    return np.ascontiguousarray(reconstruct_vectors(_load_store(doc_id).index), dtype=np.float32)
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def time_queries(index: faiss.Index, queries: np.ndarray, k: int, params) -> tuple:
+    """One query at a time, as the chat path does; returns (ids, p50 ms, p95 ms)"""
+    ids = np.empty((len(queries), k), dtype=np.int64)
+    latencies = []
+    for i, q in enumerate(queries):
+        t0 = time.perf_counter()
+        _, ids[i:i + 1] = index.search(q.reshape(1, -1), k, params=params)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    return ids, float(np.percentile(latencies, 50)), float(np.percentile(latencies, 95))
+
+
+def run(vectors: np.ndarray, n_queries: int, k: int) -> List[Dict[str, Any]]:
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(len(vectors), size=min(n_queries, len(vectors)), replace=False)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+    faiss.normalize_L2(queries)
+
+    flat, _ = build_index(vectors, "flat")
+    _, truth = flat.search(queries, k)
+
+    rows = []
+    for index_type in ("flat", "ivf_flat", "ivf_pq", "hnsw"):
+        t0 = time.perf_counter()
+        index, info = build_index(vectors, index_type)
+        build_s = time.perf_counter() - t0
+
+        if index_type.startswith("ivf"):
+            sweep = [("nprobe", v) for v in NPROBE_SWEEP if v <= info["nlist"]]
+        elif index_type == "hnsw":
+            sweep = [("ef_search", v) for v in EF_SEARCH_SWEEP]
+        else:
+            sweep = [(None, None)]
+
+        for knob, value in sweep:
+            params = search_params(index, **({knob: value} if knob else {}))
+            ids, p50, p95 = time_queries(index, queries, k, params)
+            rows.append({
+                "index_type": index_type,
+                "knob": knob,
+                "value": value,
+                "recall_at_k": round(recall_at_k(ids, truth), 4),
+                "p50_ms": round(p50, 3),
+                "p95_ms": round(p95, 3),
+                "build_s": round(build_s, 2),
+                "index_bytes": int(faiss.serialize_index(index).nbytes),
+            })
+    return rows
+
+
+def print_report(rows: List[Dict[str, Any]], n: int, dim: int, k: int) -> None:
+    print(f"\nrecall@{k} vs latency  |  n={n}  dim={dim}\n")
+    print(f"{'index':<10}{'knob':<14}{'recall':>8}{'p50 ms':>10}{'p95 ms':>10}{'build s':>10}{'size MB':>10}")
+    for r in rows:
+        knob = f"{r['knob']}={r['value']}" if r["knob"] else "-"
+        print(f"{r['index_type']:<10}{knob:<14}{r['recall_at_k']:>8.3f}{r['p50_ms']:>10.3f}"
+              f"{r['p95_ms']:>10.3f}{r['build_s']:>10.2f}{r['index_bytes'] / 2**20:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=50_000, help="synthetic vector count")
+    parser.add_argument("--dim", type=int, default=384, help="synthetic dimension (all-MiniLM-L6-v2 = 384)")
+    parser.add_argument("--doc-id", help="benchmark the vectors of a stored document instead")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--json", dest="json_path", help="also write rows to this file")
+    args = parser.parse_args()
+
+    vectors = stored_vectors(args.doc_id) if args.doc_id else synthetic_vectors(args.n, args.dim)
+    rows = run(vectors, args.queries, args.k)
+    print_report(rows, len(vectors), vectors.shape[1], args.k)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"n": len(vectors), "dim": int(vectors.shape[1]), "k": args.k, "rows": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
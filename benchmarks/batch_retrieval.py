@@ -0,0 +1,90 @@
+"""
+N queries as N RETRIEVE_REQUEST messages versus one RETRIEVE_BATCH_REQUEST,
+against one synthetic document and against the whole collection.
+
+    python -m benchmarks.batch_retrieval --size medium --queries 64
+
+Runs in a scratch working directory with the query caches off, so every
+query goes through the model on both paths.
+"""
+import os
+import time
+import shutil
+import argparse
+import tempfile
+from typing import Any, Dict, List
+
+from benchmarks.corpus import SIZES, generate
+
+
+def _queries(n: int, tag: str) -> List[str]:
+    # distinct per run, so neither path is served from the in-memory query cache
+    return [f"What was the {tag} budget figure number {i} for the division?" for i in range(n)]
+
+
+def bench(size: str, n_queries: int, k: int, repeat: int) -> List[Dict[str, Any]]:
+    from agents.ingestion_agent import IngestionAgent
+    from agents.retrieval_agent import RetrievalAgent
+    from utils.embedding_engine import configure_engine
+    from utils.mcp import create_message
+
+    engine = configure_engine(chunk_cache_path=None, query_cache_path=None, query_batching=False)
+    engine.encode(["warmup"])
+
+    entry = generate(os.path.join("data", "corpus"), ("txt",), (size,))[0]
+    doc_id = IngestionAgent().handle_message(create_message(
+        "Benchmark", "IngestionAgent", "INGEST_REQUEST", {"file_path": entry["path"]},
+    ))["doc_id"]
+    retriever = RetrievalAgent()
+
+    rows = []
+    for scope, extra in (("document", {"doc_id": doc_id}), ("collection", {})):
+        loop_ms, batch_ms = [], []
+        for run in range(repeat):
+            queries = _queries(n_queries, f"loop-{scope}-{run}")
+            started = time.perf_counter()
+            for query in queries:
+                retriever.handle_message(create_message(
+                    "Benchmark", "RetrievalAgent", "RETRIEVE_REQUEST", {"query": query, "k": k, **extra},
+                ))
+            loop_ms.append((time.perf_counter() - started) * 1000)
+
+            queries = _queries(n_queries, f"batch-{scope}-{run}")
+            started = time.perf_counter()
+            retriever.handle_message(create_message(
+                "Benchmark", "RetrievalAgent", "RETRIEVE_BATCH_REQUEST", {"queries": queries, "k": k, **extra},
+            ))
+            batch_ms.append((time.perf_counter() - started) * 1000)
+
+        loop, batch = min(loop_ms), min(batch_ms)
+        rows.append({"scope": scope, "loop_ms": loop, "batch_ms": batch, "speedup": loop / batch if batch else None})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", default="medium", choices=list(SIZES))
+    parser.add_argument("--queries", type=int, default=64)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3, help="best of this many runs is reported")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="rag-batch-bench-")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        os.makedirs(os.path.join("data", "vector_store"), exist_ok=True)
+        rows = bench(args.size, args.queries, args.k, args.repeat)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"\n{args.queries} queries · k={args.k} · {args.size} document")
+    print(f"{'scope':<12}{'loop ms':>12}{'batch ms':>12}{'per query':>12}{'speedup':>10}")
+    for row in rows:
+        print(f"{row['scope']:<12}{row['loop_ms']:>12.1f}{row['batch_ms']:>12.1f}"
+              f"{row['batch_ms'] / args.queries:>12.2f}{row['speedup']:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Deterministic synthetic documents in every format the ingestion agent reads
+(PDF, DOCX, PPTX, CSV, TXT, MD), at a few sizes.
+
+    python -m benchmarks.corpus --out data/bench_corpus --sizes small,medium
+
+The prose is seeded filler with planted facts ("The <unit> budget for <year>
+was <n> million ..."); questions() returns questions about those facts, so
+retrieval has something real to find.
+"""
+import os
+import csv
+import random
+import argparse
+from typing import Dict, Iterator, List, Optional, Tuple
+
+FORMATS = ("pdf", "docx", "pptx", "csv", "txt", "md")
+
+# approximate words per document
+SIZES: Dict[str, int] = {
+    "small": 2_000,
+    "medium": 20_000,
+    "large": 100_000,
+}
+
+WORDS_PER_PARAGRAPH = 80
+WORDS_PER_PAGE = 450          # PDF
+WORDS_PER_SLIDE = 120         # PPTX
+WORDS_PER_ROW = 25            # CSV
+FACT_EVERY = 5                # one planted fact per this many paragraphs
+
+_VOCAB = (
+    "revenue margin forecast supplier contract region quarter audit policy customer "
+    "inventory logistics pricing warehouse compliance retention analysis market growth "
+    "capacity budget headcount schedule milestone risk review strategy pipeline vendor "
+    "shipment demand model estimate variance target operations finance product launch "
+    "service network support training incident report partner channel portfolio asset"
+).split()
+_GLUE = "the a of to and in for with on by across during after before while under".split()
+_UNITS = (
+    "Northern", "Southern", "Eastern", "Western", "Central", "Coastal", "Mountain", "Harbor",
+    "Research", "Platform", "Retail", "Wholesale", "Marine", "Aviation", "Rail", "Energy",
+)
+
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(_VOCAB if i % 2 == 0 else _GLUE) for i in range(rng.randint(9, 16))]
+    return " ".join(words).capitalize() + "."
+
+
+def _fact(rng: random.Random) -> Tuple[str, str]:
+    unit, year = rng.choice(_UNITS), rng.randint(2015, 2030)
+    amount = rng.randint(2, 950)
+    fact = f"The {unit} division budget for {year} was {amount} million dollars."
+    question = f"What was the {unit} division budget for {year}?"
+    return fact, question
+
+
+def _paragraphs(n_words: int, seed: int) -> Iterator[Tuple[str, Optional[str]]]:
+    rng = random.Random(seed)
+    written = i = 0
+    while written < n_words:
+        parts, question = [], None
+        if i % FACT_EVERY == 0:
+            fact, question = _fact(rng)
+            parts.append(fact)
+        while sum(len(p.split()) for p in parts) < WORDS_PER_PARAGRAPH:
+            parts.append(_sentence(rng))
+        text = " ".join(parts)
+        written += len(text.split())
+        i += 1
+        yield text, question
+
+
+def paragraphs(n_words: int, seed: int = 0) -> Iterator[str]:
+    """Seeded paragraphs of about WORDS_PER_PARAGRAPH words, every FACT_EVERY-th with a fact"""
+    for text, _ in _paragraphs(n_words, seed):
+        yield text
+
+
+def questions(n: int, n_words: int, seed: int = 0) -> List[str]:
+    """Questions about facts planted in paragraphs(n_words, seed), topped up with generic ones"""
+    found = [q for _, q in _paragraphs(n_words, seed) if q is not None]
+    generic = [f"What does the document say about {word}?" for word in _VOCAB]
+    picked = found[::max(1, len(found) // n)] if len(found) > n else found     # spread over the document
+    return (picked + generic)[:n]
+
+
+def _group(items: List[str], words_per_group: int) -> List[str]:
+    groups, current, count = [], [], 0
+    for item in items:
+        current.append(item)
+        count += len(item.split())
+        if count >= words_per_group:
+            groups.append("\n\n".join(current))
+            current, count = [], 0
+    if current:
+        groups.append("\n\n".join(current))
+    return groups
+
+
+def write_pdf(path: str, paras: List[str]) -> None:
+    import fitz
+    doc = fitz.open()
+    for page_text in _group(paras, WORDS_PER_PAGE):
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, page.rect.width - 50, page.rect.height - 50), page_text, fontsize=9)
+    doc.save(path)
+    doc.close()
+
+
+def write_docx(path: str, paras: List[str]) -> None:
+    from docx import Document
+    doc = Document()
+    for i, text in enumerate(paras):
+        if i % 10 == 0:
+            doc.add_heading(f"Section {i // 10 + 1}", level=1)
+        doc.add_paragraph(text)
+    doc.save(path)
+
+
+def write_pptx(path: str, paras: List[str]) -> None:
+    from pptx import Presentation
+    from pptx.util import Inches
+    prs = Presentation()
+    layout = prs.slide_layouts[5]           # title only
+    for i, text in enumerate(_group(paras, WORDS_PER_SLIDE)):
+        slide = prs.slides.add_slide(layout)
+        slide.shapes.title.text = f"Slide {i + 1}"
+        box = slide.shapes.add_textbox(Inches(0.5), Inches(1.5), Inches(9), Inches(5))
+        box.text_frame.text = text
+    prs.save(path)
+
+
+def write_csv(path: str, paras: List[str]) -> None:
+    rng = random.Random(len(paras))
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "region", "year", "amount", "note"])
+        row_id = 0
+        for text in paras:
+            words = text.split()
+            for start in range(0, len(words), WORDS_PER_ROW):
+                writer.writerow([row_id, rng.choice(_UNITS), rng.randint(2015, 2030),
+                                 rng.randint(1, 999), " ".join(words[start:start + WORDS_PER_ROW])])
+                row_id += 1
+
+
+def write_txt(path: str, paras: List[str]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n\n".join(paras) + "\n")
+
+
+def write_md(path: str, paras: List[str]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        for i, text in enumerate(paras):
+            if i % 10 == 0:
+                f.write(f"## Section {i // 10 + 1}\n\n")
+            if i % 7 == 3:
+                f.write("".join(f"- {s.strip()}\n" for s in text.split(". ") if s.strip()) + "\n")
+            else:
+                f.write(text + "\n\n")
+
+
+WRITERS = {
+    "pdf": write_pdf, "docx": write_docx, "pptx": write_pptx,
+    "csv": write_csv, "txt": write_txt, "md": write_md,
+}
+
+
+def generate(out_dir: str, formats=FORMATS, sizes=("small",), seed: int = 0) -> List[Dict[str, object]]:
+    """Write the corpus (skipping files that already exist); returns one entry per file"""
+    os.makedirs(out_dir, exist_ok=True)
+    entries = []
+    for size in sizes:
+        n_words = SIZES[size]
+        paras = list(paragraphs(n_words, seed))
+        for fmt in formats:
+            path = os.path.join(out_dir, f"{size}-s{seed}.{fmt}")
+            if not os.path.isfile(path):
+                WRITERS[fmt](path, paras)
+            entries.append({"format": fmt, "size": size, "words": n_words, "seed": seed,
+                            "path": path, "bytes": os.path.getsize(path)})
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default=os.path.join("data", "bench_corpus"))
+    parser.add_argument("--formats", default=",".join(FORMATS))
+    parser.add_argument("--sizes", default="small,medium", help=f"comma-separated of {', '.join(SIZES)}")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for entry in generate(args.out, args.formats.split(","), args.sizes.split(","), args.seed):
+        print(f"{entry['path']:<40}{entry['bytes'] / 1024:>10.1f} KB")
+
+
+if __name__ == "__main__":
+    main()
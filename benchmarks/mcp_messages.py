@@ -0,0 +1,112 @@
+"""
+Cost of creating and serializing MCP messages: the previous dict path
+(two uuid4 + ISO timestamp + dict copy per message, chunks copied into
+raw_results) versus the slotted MCPMessage and its binary wire format.
+
+    python -m benchmarks.mcp_messages --n 20000 --chunks 5 --chunk-chars 1000
+
+The payload is shaped like a RETRIEVE_REQUEST result handed to the LLM agent.
+"""
+import argparse
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List
+
+from utils.mcp import MCPMessage, create_message, msgpack
+
+
+def legacy_create_message(sender: str, receiver: str, msg_type: str, payload: Dict[str, Any],
+                          trace_id: str = None) -> Dict[str, Any]:
+    """The message path before the slotted MCPMessage (eager ids, copied into a dict)"""
+    message_id = str(uuid.uuid4())
+    trace_id = trace_id or str(uuid.uuid4())
+    return {
+        "message_id": message_id,
+        "trace_id": trace_id,
+        "correlation_id": trace_id,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "sender": sender,
+        "receiver": receiver,
+        "type": msg_type,
+        "version": "1.0",
+        "payload": payload,
+    }
+
+
+def retrieval_payload(n_chunks: int, chunk_chars: int, with_raw: bool) -> Dict[str, Any]:
+    text = ("Quarterly revenue grew in every region while costs stayed flat. " * (chunk_chars // 64 + 1))[:chunk_chars]
+    chunks = [
+        {
+            "text": text,
+            "score": 0.8 - 0.05 * i,
+            "metadata": {"doc_id": "d" * 32, "chunk_index": i, "file_name": "report.pdf", "chunk_length": chunk_chars},
+        }
+        for i in range(n_chunks)
+    ]
+    payload = {"status": "success", "query": "How did revenue develop?", "chunks": chunks,
+               "retrieved_count": n_chunks, "doc_id": "d" * 32}
+    if with_raw:
+        payload["raw_results"] = [(c["text"], c["score"], c["metadata"]) for c in chunks]
+    return payload
+
+
+def time_per_op(fn: Callable[[], Any], n: int) -> float:
+    """Microseconds per call"""
+    started = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - started) / n * 1e6
+
+
+def run(n: int, n_chunks: int, chunk_chars: int) -> List[Dict[str, Any]]:
+    legacy_payload = retrieval_payload(n_chunks, chunk_chars, with_raw=True)
+    payload = retrieval_payload(n_chunks, chunk_chars, with_raw=False)
+    args = ("RetrievalAgent", "LLMResponseAgent", "CONTEXT_RESPONSE")
+
+    legacy = legacy_create_message(*args, legacy_payload)
+    message = create_message(*args, payload)
+    legacy_json = json.dumps(legacy).encode("utf-8")
+    wire = message.to_bytes()
+    wire_refs = message.to_bytes(by_reference=True)
+
+    rows = [
+        {"case": "create (dict, eager ids)", "us": time_per_op(lambda: legacy_create_message(*args, legacy_payload), n)},
+        {"case": "create (MCPMessage, lazy ids)", "us": time_per_op(lambda: create_message(*args, payload), n)},
+        {"case": "create + read trace_id", "us": time_per_op(lambda: create_message(*args, payload).trace_id, n)},
+        {"case": "serialize (dict → json)", "us": time_per_op(lambda: json.dumps(legacy).encode("utf-8"), n),
+         "bytes": len(legacy_json)},
+        {"case": "serialize (to_bytes)", "us": time_per_op(message.to_bytes, n), "bytes": len(wire)},
+        {"case": "serialize (to_bytes, by reference)", "us": time_per_op(lambda: message.to_bytes(by_reference=True), n),
+         "bytes": len(wire_refs)},
+        {"case": "deserialize (json → dict)", "us": time_per_op(lambda: json.loads(legacy_json), n)},
+        {"case": "deserialize (from_bytes)", "us": time_per_op(lambda: MCPMessage.from_bytes(wire), n)},
+    ]
+    for row in rows:
+        row["us"] = round(row["us"], 2)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=20_000, help="iterations per case")
+    parser.add_argument("--chunks", type=int, default=5, help="retrieved chunks in the payload")
+    parser.add_argument("--chunk-chars", type=int, default=1000)
+    parser.add_argument("--json", dest="json_path", help="also write rows to this file")
+    args = parser.parse_args()
+
+    rows = run(args.n, args.chunks, args.chunk_chars)
+    print(f"\nwire format: {'msgpack' if msgpack is not None else 'json (msgpack not installed)'} · "
+          f"{args.chunks} chunks × {args.chunk_chars} chars · {args.n} iterations\n")
+    print(f"{'case':<38}{'µs/op':>10}{'bytes':>10}")
+    for r in rows:
+        print(f"{r['case']:<38}{r['us']:>10.2f}{r.get('bytes', ''):>10}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"n": args.n, "chunks": args.chunks, "chunk_chars": args.chunk_chars, "rows": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
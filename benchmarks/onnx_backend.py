@@ -0,0 +1,147 @@
+"""
+PyTorch vs int8 ONNX Runtime embedding backend: parity, startup, throughput, RSS.
+
+    python -m benchmarks.onnx_backend --texts 2000
+    python -m benchmarks.onnx_backend --file data/report.pdf --check   # exit 1 on parity failure
+
+Each backend runs in a fresh subprocess so startup time (imports + model load)
+and peak RSS are measured in isolation. Parity is the per-text cosine between
+the two backends' vectors for the same inputs.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+import tempfile
+import numpy as np
+from typing import Any, Dict, List
+
+DEFAULT_MIN_COSINE = 0.98
+
+WORDS = (
+    "invoice contract revenue quarterly model retrieval index vector document policy "
+    "customer shipment warranty clause payment schedule analysis summary appendix table "
+    "figure result method dataset training evaluation latency throughput memory budget"
+).split()
+
+
+def synthetic_texts(n: int, seed: int = 0) -> List[str]:
+    """Mixed lengths, from short questions to chunk-sized passages"""
+    rng = np.random.default_rng(seed)
+    lengths = rng.choice([6, 12, 40, 120, 180], size=n)
+    return [" ".join(rng.choice(WORDS, size=int(length))) + "." for length in lengths]
+
+
+def document_texts(file_path: str, limit: int) -> List[str]:
+    from utils.parser import iter_document_chunks
+    texts = []
+    for chunk in iter_document_chunks(file_path, chunk_size=1000, chunk_overlap=180):
+        texts.append(chunk)
+        if len(texts) >= limit:
+            break
+    return texts
+
+
+def _child(backend: str, texts_path: str, out_path: str, batch_size: int) -> None:
+    """Runs inside the subprocess: load, encode, report"""
+    t0 = time.perf_counter()
+    from utils.embedding_engine import EmbeddingEngine
+    engine = EmbeddingEngine(backend=backend, device="cpu", chunk_cache_path=None, query_batching=False)
+    engine.load()
+    engine.encode(["warmup"])
+    startup_s = time.perf_counter() - t0
+
+    with open(texts_path, encoding="utf-8") as f:
+        texts = json.load(f)
+
+    t0 = time.perf_counter()
+    vectors = engine.encode(texts, batch_size=batch_size)
+    encode_s = time.perf_counter() - t0
+
+    latencies = []
+    for text in texts[:100]:
+        t1 = time.perf_counter()
+        engine.encode([text])
+        latencies.append((time.perf_counter() - t1) * 1000)
+
+    np.save(out_path, vectors)
+    print(json.dumps({
+        "backend": backend,
+        "startup_s": round(startup_s, 3),
+        "texts_per_s": round(len(texts) / encode_s, 1),
+        "single_p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),   # KiB on Linux
+    }))
+
+
+def run_backend(backend: str, texts_path: str, workdir: str, batch_size: int) -> Dict[str, Any]:
+    out_path = os.path.join(workdir, f"{backend}.npy")
+    proc = subprocess.run(
+        [sys.executable, "-m", "benchmarks.onnx_backend", "--child", backend,
+         "--texts-path", texts_path, "--out", out_path, "--batch-size", str(batch_size)],
+        capture_output=True, text=True, check=True,
+    )
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["vectors"] = np.load(out_path)
+    return result
+
+
+def parity(a: np.ndarray, b: np.ndarray) -> Dict[str, float]:
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    cos = (a * b).sum(axis=1)
+    return {
+        "min_cosine": round(float(cos.min()), 5),
+        "mean_cosine": round(float(cos.mean()), 5),
+        "p01_cosine": round(float(np.percentile(cos, 1)), 5),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--texts", type=int, default=1000, help="synthetic text count")
+    parser.add_argument("--file", help="use chunks of this document instead of synthetic texts")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--check", action="store_true", help="exit 1 if min cosine < --min-cosine")
+    parser.add_argument("--min-cosine", type=float, default=DEFAULT_MIN_COSINE)
+    parser.add_argument("--json", dest="json_path", help="also write results to this file")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--texts-path", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child(args.child, args.texts_path, args.out, args.batch_size)
+        return
+
+    texts = document_texts(args.file, args.texts) if args.file else synthetic_texts(args.texts)
+    with tempfile.TemporaryDirectory() as workdir:
+        texts_path = os.path.join(workdir, "texts.json")
+        with open(texts_path, "w", encoding="utf-8") as f:
+            json.dump(texts, f)
+        results = {backend: run_backend(backend, texts_path, workdir, args.batch_size) for backend in ("torch", "onnx")}
+
+    agreement = parity(results["torch"].pop("vectors"), results["onnx"].pop("vectors"))
+
+    print(f"\nembedding backends  |  texts={len(texts)}  batch_size={args.batch_size}\n")
+    print(f"{'backend':<8}{'startup s':>11}{'texts/s':>10}{'1-text p50 ms':>15}{'peak RSS MB':>13}")
+    for r in results.values():
+        print(f"{r['backend']:<8}{r['startup_s']:>11.2f}{r['texts_per_s']:>10.1f}"
+              f"{r['single_p50_ms']:>15.2f}{r['peak_rss_mb']:>13.1f}")
+    print(f"\nparity (cosine torch vs onnx-int8): min={agreement['min_cosine']:.4f}  "
+          f"p01={agreement['p01_cosine']:.4f}  mean={agreement['mean_cosine']:.4f}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"texts": len(texts), "backends": list(results.values()), "parity": agreement}, f, indent=2)
+
+    if args.check and agreement["min_cosine"] < args.min_cosine:
+        print(f"FAIL: min cosine {agreement['min_cosine']} < {args.min_cosine}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+End-to-end benchmark: ingestion stages and retrieve → answer latency over a
+synthetic corpus (benchmarks.corpus), with the local stub LLM in place of Gemini.
+
+    python -m benchmarks.pipeline --sizes small,medium --out bench.json
+    python -m benchmarks.pipeline --sizes small --compare bench.json     # exit 1 on regression
+
+Everything runs in a scratch working directory (own vector store, no
+embedding cache), so results do not depend on what was indexed before.
+Per-stage times come from the tracing spans (utils.tracing); the stub LLM
+answers extractively with configurable (default zero) latency, so the answer
+path measures this code, not the network.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import subprocess
+import statistics
+import tempfile
+from typing import Any, Dict, List, Optional
+
+from benchmarks.corpus import FORMATS, SIZES, generate, questions
+
+INGEST_STAGES = ("parse", "chunk", "embed", "index_write", "ingest")
+QUERY_STAGES = ("query_embed", "search", "retrieve", "prompt_build", "llm_generate", "answer")
+
+DEFAULT_THRESHOLD = 0.15        # relative slowdown flagged as a regression
+DEFAULT_MIN_DELTA_MS = 2.0      # ... unless it is below this absolute noise floor
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+
+
+def _stage_ms(names) -> Dict[str, float]:
+    """Total ms per stage over the spans recorded since the last reset"""
+    from utils.tracing import stage_summary
+    summary = stage_summary()
+    return {name: round(summary[name]["mean_ms"] * summary[name]["count"], 3)
+            for name in names if name in summary}
+
+
+def bench_document(entry: Dict[str, Any], repeat: int, n_queries: int, k: int) -> Dict[str, Any]:
+    from agents.ingestion_agent import IngestionAgent
+    from agents.retrieval_agent import RetrievalAgent
+    from agents.llm_response_agent import LLMResponseAgent
+    from utils.mcp import create_message
+    from utils.tracing import reset_metrics
+    from utils.vector_store import clear_index_cache
+
+    ingestor, retriever, responder = IngestionAgent(), RetrievalAgent(), LLMResponseAgent(backend="stub")
+
+    # ── Ingestion: median over repeats, each a full re-index ──
+    runs = []
+    result: Dict[str, Any] = {}
+    for _ in range(repeat):
+        reset_metrics()
+        started = time.perf_counter()
+        result = ingestor.handle_message(create_message(
+            "Benchmark", "IngestionAgent", "INGEST_REQUEST",
+            {"file_path": entry["path"], "force_reindex": True},
+        ))
+        wall_ms = (time.perf_counter() - started) * 1000
+        if result.get("status") != "success":
+            raise RuntimeError(f"Ingestion of {entry['path']} failed: {result.get('error')}")
+        runs.append({"wall_ms": wall_ms, **_stage_ms(INGEST_STAGES)})
+
+    def median(key):
+        values = [r[key] for r in runs if key in r]
+        return round(statistics.median(values), 3) if values else None
+
+    row: Dict[str, Any] = {
+        "format": entry["format"],
+        "size": entry["size"],
+        "bytes": entry["bytes"],
+        "chunks": result.get("chunk_count"),
+        "ingest_ms": median("wall_ms"),
+        "stages_ms": {stage: median(stage) for stage in INGEST_STAGES if median(stage) is not None},
+        "tokens_per_s": result.get("tokens_per_s"),
+    }
+
+    # ── Retrieve → answer: first query opens the index (cold), the rest are warm ──
+    doc_id = result["doc_id"]
+    clear_index_cache()
+    reset_metrics()
+    retrieve_ms, answer_ms, e2e_ms, hits = [], [], [], 0
+    for query in questions(n_queries, entry["words"], entry["seed"]):
+        started = time.perf_counter()
+        retrieved = retriever.handle_message(create_message(
+            "Benchmark", "RetrievalAgent", "RETRIEVE_REQUEST",
+            {"query": query, "doc_id": doc_id, "k": k, "min_score": None},
+        ))
+        retrieved_at = time.perf_counter()
+        answer = responder.handle_message(create_message(
+            "RetrievalAgent", "LLMResponseAgent", "CONTEXT_RESPONSE", retrieved,
+        ))
+        finished = time.perf_counter()
+        retrieve_ms.append((retrieved_at - started) * 1000)
+        answer_ms.append((finished - retrieved_at) * 1000)
+        e2e_ms.append((finished - started) * 1000)
+        hits += answer.get("status") == "success"
+
+    from utils.tracing import stage_summary
+    summary = stage_summary()
+    row.update({
+        "queries": len(e2e_ms),
+        "answered": hits,
+        "retrieve_cold_ms": round(retrieve_ms[0], 3) if retrieve_ms else None,
+        "retrieve_p50_ms": _percentile(retrieve_ms[1:], 0.50),
+        "retrieve_p95_ms": _percentile(retrieve_ms[1:], 0.95),
+        "answer_p50_ms": _percentile(answer_ms, 0.50),
+        "answer_p95_ms": _percentile(answer_ms, 0.95),
+        "e2e_p50_ms": _percentile(e2e_ms[1:], 0.50),
+        "e2e_p95_ms": _percentile(e2e_ms[1:], 0.95),
+        "query_stages_p50_ms": {s: summary[s]["p50_ms"] for s in QUERY_STAGES if s in summary},
+    })
+    return row
+
+
+def run(formats: List[str], sizes: List[str], repeat: int, n_queries: int, k: int,
+        corpus_dir: Optional[str], seed: int) -> Dict[str, Any]:
+    # Scratch working directory: own data/vector_store, no chunk embedding cache
+    workdir = tempfile.mkdtemp(prefix="rag-bench-")
+    corpus_dir = os.path.abspath(corpus_dir) if corpus_dir else os.path.join(workdir, "corpus")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        os.makedirs(os.path.join("data", "vector_store"), exist_ok=True)
+        from utils.embedding_engine import configure_engine
+        from utils.tracing import configure_tracing
+        configure_tracing(enabled=True, trace_file="")
+
+        engine = configure_engine(chunk_cache_path=None)
+        started = time.perf_counter()
+        engine.encode(["warmup"])
+        engine.embed_query("warmup")
+        load_ms = (time.perf_counter() - started) * 1000
+
+        entries = generate(corpus_dir, formats, sizes, seed)
+        rows = []
+        for entry in entries:
+            row = bench_document(entry, repeat, n_queries, k)
+            print(f"[bench] {entry['size']:<7}{entry['format']:<5} ingest {row['ingest_ms']:>9.1f} ms · "
+                  f"e2e p50 {row['e2e_p50_ms'] or 0:>7.2f} ms")
+            rows.append(row)
+
+        return {
+            "meta": {
+                "commit": _git_commit(),
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "embedding_model": engine.model_id,
+                "model_load_ms": round(load_ms, 1),
+                "llm": "stub",
+                "stub_first_token_ms": float(os.environ.get("RAG_STUB_FIRST_TOKEN_MS", 0)),
+                "stub_token_ms": float(os.environ.get("RAG_STUB_TOKEN_MS", 0)),
+                "repeat": repeat,
+                "queries": n_queries,
+                "k": k,
+                "seed": seed,
+            },
+            "rows": rows,
+        }
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+# ────────────────────────────────────────────────
+#  Baseline comparison
+# ────────────────────────────────────────────────
+
+def _metrics(row: Dict[str, Any]) -> Dict[str, float]:
+    """Flat {metric: ms} of one result row (lower is better for all of them)"""
+    flat = {key: row[key] for key in ("ingest_ms", "retrieve_p50_ms", "retrieve_p95_ms", "answer_p50_ms",
+                                      "answer_p95_ms", "e2e_p50_ms", "e2e_p95_ms") if row.get(key) is not None}
+    flat.update({f"stage.{k}": v for k, v in row.get("stages_ms", {}).items()})
+    flat.update({f"query_stage.{k}": v for k, v in row.get("query_stages_p50_ms", {}).items() if v is not None})
+    return flat
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float = DEFAULT_THRESHOLD,
+            min_delta_ms: float = DEFAULT_MIN_DELTA_MS) -> List[Dict[str, Any]]:
+    """Every metric present in both runs, with its change and a regression flag"""
+    base_rows = {(r["format"], r["size"]): r for r in baseline["rows"]}
+    changes = []
+    for row in current["rows"]:
+        base = base_rows.get((row["format"], row["size"]))
+        if base is None:
+            continue
+        base_metrics = _metrics(base)
+        for metric, value in _metrics(row).items():
+            old = base_metrics.get(metric)
+            if old is None:
+                continue
+            ratio = value / old if old > 0 else float("inf") if value > 0 else 1.0
+            changes.append({
+                "format": row["format"], "size": row["size"], "metric": metric,
+                "baseline": old, "current": value, "ratio": round(ratio, 3),
+                "regression": ratio > 1 + threshold and value - old > min_delta_ms,
+            })
+    return changes
+
+
+def print_comparison(changes: List[Dict[str, Any]], threshold: float) -> None:
+    regressions = [c for c in changes if c["regression"]]
+    print(f"\nCompared {len(changes)} metrics · threshold +{threshold:.0%}")
+    print(f"{'doc':<14}{'metric':<28}{'baseline':>12}{'current':>12}{'change':>10}")
+    for c in sorted(changes, key=lambda c: -c["ratio"])[:20]:
+        flag = "  ← REGRESSION" if c["regression"] else ""
+        print(f"{c['size'] + '/' + c['format']:<14}{c['metric']:<28}{c['baseline']:>12.2f}"
+              f"{c['current']:>12.2f}{c['ratio'] - 1:>+10.1%}{flag}")
+    print(f"\n{len(regressions)} regression(s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--formats", default=",".join(FORMATS))
+    parser.add_argument("--sizes", default="small", help=f"comma-separated of {', '.join(SIZES)}")
+    parser.add_argument("--repeat", type=int, default=3, help="ingestions per document (median is reported)")
+    parser.add_argument("--queries", type=int, default=20, help="questions per document")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--corpus-dir", help="keep / reuse generated documents here (default: temporary)")
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--compare", help="baseline results JSON; exit 1 if anything regressed")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--min-delta-ms", type=float, default=DEFAULT_MIN_DELTA_MS)
+    args = parser.parse_args()
+
+    # Deterministic local LLM, no network latency unless asked for
+    os.environ["RAG_LLM_BACKEND"] = "stub"
+    os.environ.setdefault("RAG_STUB_FIRST_TOKEN_MS", "0")
+    os.environ.setdefault("RAG_STUB_TOKEN_MS", "0")
+
+    results = run(args.formats.split(","), args.sizes.split(","), args.repeat, args.queries, args.k,
+                  args.corpus_dir, args.seed)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        changes = compare(results, baseline, args.threshold, args.min_delta_ms)
+        print_comparison(changes, args.threshold)
+        if any(c["regression"] for c in changes):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Memory vs recall for float32 / float16 / int8 vector storage, with and without
+exact rescoring against full-precision vectors.
+
+    python -m benchmarks.vector_codecs --n 100000 --k 10
+    python -m benchmarks.vector_codecs --doc-id <doc_id> --index-types flat
+
+Ground truth is an exact float32 flat search over the same vectors.
+"""
+import argparse
+import json
+import time
+import numpy as np
+import faiss
+from typing import Any, Dict, List
+
+from benchmarks.ann_recall import recall_at_k, stored_vectors, synthetic_vectors
+from utils.index_types import VECTOR_CODECS, build_index, search_params
+from utils.vector_store import RESCORE_FACTOR, _rescore
+
+
+def run(vectors: np.ndarray, index_types: List[str], n_queries: int, k: int, factor: int) -> List[Dict[str, Any]]:
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(len(vectors), size=min(n_queries, len(vectors)), replace=False)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+    faiss.normalize_L2(queries)
+
+    flat, _ = build_index(vectors, "flat")
+    _, truth = flat.search(queries, k)
+    full_bytes = int(vectors.nbytes)
+
+    rows = []
+    for index_type in index_types:
+        for codec in VECTOR_CODECS:
+            index, info = build_index(vectors, index_type, codec=codec)
+            index_bytes = int(faiss.serialize_index(index).nbytes)
+            params = search_params(index)
+
+            for rescore in (False, True):
+                if rescore and info["codec"] == "float32":
+                    continue
+                fetch = k * factor if rescore else k
+                ids = np.full((len(queries), k), -1, dtype=np.int64)
+                latencies = []
+                for i, q in enumerate(queries):
+                    t0 = time.perf_counter()
+                    _, found = index.search(q.reshape(1, -1), fetch, params=params)
+                    if rescore:
+                        _, found_ids = _rescore(vectors, q, found[0], k)
+                        ids[i, :len(found_ids)] = found_ids
+                    else:
+                        ids[i] = found[0]
+                    latencies.append((time.perf_counter() - t0) * 1000)
+
+                rows.append({
+                    "index_type": index_type,
+                    "codec": info["codec"],
+                    "rescore": rescore,
+                    "recall_at_k": round(recall_at_k(ids, truth), 4),
+                    "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+                    "index_bytes": index_bytes,
+                    # float32 copy lives on disk, memory-mapped; only touched rows are paged in
+                    "disk_bytes": index_bytes + (full_bytes if rescore else 0),
+                })
+    return rows
+
+
+def print_report(rows: List[Dict[str, Any]], n: int, dim: int, k: int, factor: int) -> None:
+    print(f"\nmemory vs recall@{k}  |  n={n}  dim={dim}  rescore fetch={factor}×k\n")
+    print(f"{'index':<10}{'codec':<9}{'rescore':<9}{'recall':>8}{'p50 ms':>10}{'index MB':>10}{'disk MB':>10}")
+    for r in rows:
+        print(f"{r['index_type']:<10}{r['codec']:<9}{'yes' if r['rescore'] else 'no':<9}{r['recall_at_k']:>8.3f}"
+              f"{r['p50_ms']:>10.3f}{r['index_bytes'] / 2**20:>10.1f}{r['disk_bytes'] / 2**20:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=50_000, help="synthetic vector count")
+    parser.add_argument("--dim", type=int, default=384, help="synthetic dimension (all-MiniLM-L6-v2 = 384)")
+    parser.add_argument("--doc-id", help="benchmark the vectors of a stored document instead")
+    parser.add_argument("--index-types", default="flat,hnsw", help="comma-separated (codec does not apply to ivf_pq)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--factor", type=int, default=RESCORE_FACTOR, help="rescoring candidates per result")
+    parser.add_argument("--json", dest="json_path", help="also write rows to this file")
+    args = parser.parse_args()
+
+    vectors = stored_vectors(args.doc_id) if args.doc_id else synthetic_vectors(args.n, args.dim)
+    rows = run(vectors, args.index_types.split(","), args.queries, args.k, args.factor)
+    print_report(rows, len(vectors), vectors.shape[1], args.k, args.factor)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"n": len(vectors), "dim": int(vectors.shape[1]), "k": args.k, "rows": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
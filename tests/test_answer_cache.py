@@ -0,0 +1,42 @@
+import time
+
+import numpy as np
+
+from utils.answer_cache import SemanticAnswerCache
+
+VECTORS = {
+    "what was the budget in 2021?": [1.0, 0.0, 0.0],
+    "what was the 2021 budget?": [0.96, 0.28, 0.0],
+    "how large was the 2021 budget?": [0.9, 0.0, 0.436],
+}
+SCOPE = SemanticAnswerCache.scope("doc", "v1", "default")
+
+
+def _cache(**kwargs):
+    return SemanticAnswerCache(threshold=0.85, embed=lambda q: np.array(VECTORS[q.lower()]), **kwargs)
+
+
+def test_expired_best_match_falls_back_to_next_live_match():
+    cache = _cache(ttl_s=60)
+    cache.store(SCOPE, "What was the 2021 budget?", "old", [])
+    cache.store(SCOPE, "How large was the 2021 budget?", "live", [])
+    cache._entries.get((SCOPE, "what was the 2021 budget?"))["created_at"] = time.time() - 120
+
+    hit = cache.lookup(SCOPE, "What was the budget in 2021?")
+
+    assert hit is not None and hit["answer"] == "live"
+    assert cache.stats()["entries"] == 1
+
+
+def test_lookup_embeds_outside_the_lock():
+    held = []
+    cache = _cache()
+
+    def embed(question):
+        held.append(cache._lock._is_owned())
+        return np.array(VECTORS[question.lower()])
+
+    cache._embed = embed
+    cache.store(SCOPE, "What was the 2021 budget?", "answer", [])
+    assert cache.lookup(SCOPE, "What was the budget in 2021?")["answer"] == "answer"
+    assert held == [False, False]
@@ -0,0 +1,51 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from utils.bus import BusStopped, MessageBus
+
+
+def test_put_timeout_leaves_a_cancelled_future_alone():
+    bus = MessageBus(put_timeout_s=0.1)
+    gate = threading.Event()
+    bus.subscribe("SLOW", lambda message: gate.wait(), concurrency=1, queue_size=1)
+    bus.start()
+    try:
+        running = bus.submit({"type": "SLOW"})
+        queued = bus.submit({"type": "SLOW"})
+        time.sleep(0.05)
+
+        future: Future = Future()
+        future.cancel()                     # consumer gave up while the put was waiting
+        job = ({"type": "SLOW"}, future, {}, None, time.perf_counter())
+        sub = bus._subscriptions["SLOW"]
+        asyncio.run_coroutine_threadsafe(bus._enqueue(sub, job), bus._loop).result(timeout=2)
+
+        assert sub.rejected == 1
+    finally:
+        gate.set()
+        running.result(timeout=2)
+        queued.result(timeout=2)
+        bus.stop()
+
+
+def test_stop_fails_running_and_queued_requests():
+    bus = MessageBus()
+
+    async def slow(message):
+        await asyncio.sleep(30)
+
+    bus.subscribe("SLOW", slow, concurrency=1)
+    bus.start()
+    running = bus.submit({"type": "SLOW"})
+    queued = bus.submit({"type": "SLOW"})
+    time.sleep(0.1)
+
+    bus.stop()
+
+    for future in (running, queued):
+        with pytest.raises(BusStopped):
+            future.result(timeout=2)
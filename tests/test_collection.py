@@ -0,0 +1,81 @@
+import logging
+import os
+import threading
+
+import numpy as np
+
+import utils.collection as collection
+import utils.vector_store as vector_store
+from utils.collection import Collection
+
+DIM = 8
+
+
+def _vectors(n, seed):
+    return np.random.default_rng(seed).normal(size=(n, DIM)).astype(np.float32)
+
+
+def test_add_updates_the_active_shard_in_place_with_one_write(tmp_path, monkeypatch):
+    coll = Collection(str(tmp_path))
+    coll.add_document("a", _vectors(10, 0))
+    shard = coll._shard("shard-0000")
+
+    writes = []
+    write_shard = coll._write_shard
+    monkeypatch.setattr(coll, "_write_shard", lambda name, index: (writes.append(name), write_shard(name, index)))
+
+    coll.add_document("b", _vectors(10, 1), replaces="a")
+
+    assert writes == ["shard-0000"]
+    assert coll._shard("shard-0000") is shard
+    assert shard.ntotal == 10
+    assert coll.list_documents() == ["b"]
+
+
+def test_search_runs_alongside_adds(tmp_path):
+    coll = Collection(str(tmp_path))
+    coll.add_document("seed", _vectors(50, 0))
+    query = _vectors(1, 99)
+    errors = []
+
+    def search():
+        try:
+            for _ in range(200):
+                assert coll.search(query, k=5)[0]
+        except Exception as e:
+            errors.append(e)
+
+    reader = threading.Thread(target=search)
+    reader.start()
+    for i in range(20):
+        coll.add_document(f"doc-{i}", _vectors(50, i + 1))
+    reader.join()
+
+    assert not errors
+    assert len(coll.list_documents()) == 21
+    assert Collection(str(tmp_path))._shard("shard-0000").ntotal == 21 * 50
+
+
+def test_listing_syncs_only_when_stores_change_and_logs_failures_once(tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(vector_store, "VECTOR_STORE_DIR", str(tmp_path))
+    monkeypatch.setattr(vector_store, "_synced_dir_version", None)
+    monkeypatch.setattr(vector_store, "_sync_failures", set())
+    monkeypatch.setattr(collection, "_default_collection", Collection(str(tmp_path / "_collection")))
+    # a store the collection cannot load
+    os.makedirs(tmp_path / "broken")
+    (tmp_path / "broken" / vector_store.HEADER_FILE).write_text("{")
+
+    scans = []
+    list_store_ids = vector_store._list_store_ids
+    monkeypatch.setattr(vector_store, "_list_store_ids", lambda: scans.append(1) or list_store_ids())
+
+    with caplog.at_level(logging.ERROR, logger=vector_store.__name__):
+        for _ in range(3):
+            assert vector_store.list_stored_documents() == []
+        assert len(scans) == 1
+
+        os.makedirs(tmp_path / "other")
+        vector_store.list_stored_documents()
+
+    assert len(scans) == 2
+    assert sum("broken" in record.getMessage() for record in caplog.records) == 1
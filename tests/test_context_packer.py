@@ -0,0 +1,29 @@
+from utils.context_packer import pack_context
+
+
+def _chunk(text, chunk_index, doc_id="doc", score=0.1):
+    return {"text": text, "score": score, "metadata": {"doc_id": doc_id, "chunk_index": chunk_index}}
+
+
+def test_merges_non_overlapping_run_on_separate_lines():
+    chunks = [
+        _chunk("Line 0 reports revenue number 0", 0),
+        _chunk("Line 1 talks about the northern region", 1),
+        _chunk("id,region,amount", 2),
+    ]
+    passages, stats = pack_context(chunks, token_budget=0)
+
+    assert len(passages) == 1
+    assert stats["merged_chunks"] == 2
+    assert passages[0]["text"] == (
+        "Line 0 reports revenue number 0\nLine 1 talks about the northern region\nid,region,amount"
+    )
+    assert passages[0]["metadata"]["chunk_indexes"] == [0, 1, 2]
+
+
+def test_merges_overlapping_run_without_repeating_the_overlap():
+    first = "The Northern division budget for 2021 was 40 million dollars."
+    second = "budget for 2021 was 40 million dollars. Costs stayed flat."
+    passages, _ = pack_context([_chunk(first, 0), _chunk(second, 1)], token_budget=0)
+
+    assert passages[0]["text"] == "The Northern division budget for 2021 was 40 million dollars. Costs stayed flat."
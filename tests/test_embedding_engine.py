@@ -0,0 +1,85 @@
+import os
+
+import numpy as np
+import pytest
+
+from utils.embedding_engine import EMBEDDING_MODEL_NAME, EmbeddingEngine
+
+SHORT = ["What was the budget?"] * 8
+LONG = [" ".join(["revenue grew in every region while costs stayed flat"] * 15)] * 8
+TOKEN_BUDGET = 1024
+
+
+class _LengthModel:
+    """Minimal encoder: one token per word, constant vectors"""
+
+    def token_lengths(self, texts):
+        return [len(text.split()) + 2 for text in texts]
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False, convert_to_numpy=True,
+               normalize_embeddings=False):
+        return np.ones((len(texts), 4), dtype=np.float32)
+
+    def get_sentence_embedding_dimension(self):
+        return 4
+
+
+def _engine(backend: str = "torch") -> EmbeddingEngine:
+    return EmbeddingEngine(
+        backend=backend,
+        token_budget=TOKEN_BUDGET,
+        query_cache_path=None,
+        chunk_cache_path=None,
+        query_batching=False,
+    )
+
+
+def _bucket_lengths(engine: EmbeddingEngine, texts):
+    lengths = engine.token_lengths(texts)
+    batches = engine._plan_batches(lengths, None)
+    return lengths, [max(lengths[i] for i in rows) for rows in batches]
+
+
+def _load_backend(backend: str) -> EmbeddingEngine:
+    if backend == "torch":
+        pytest.importorskip("sentence_transformers")
+    else:
+        pytest.importorskip("onnxruntime")
+        pytest.importorskip("tokenizers")
+        from utils.onnx_backend import INT8_FILE, default_model_dir
+        if not os.path.isfile(os.path.join(default_model_dir(EMBEDDING_MODEL_NAME), INT8_FILE)):
+            pytest.skip("no exported ONNX model")
+    engine = _engine(backend)
+    try:
+        engine.load()
+    except OSError as e:                      # model not downloadable here
+        pytest.skip(f"embedding model unavailable: {e}")
+    return engine
+
+
+def test_plan_batches_buckets_mixed_lengths():
+    engine = _engine()
+    engine._model = _LengthModel()
+
+    lengths, buckets = _bucket_lengths(engine, SHORT + LONG)
+
+    assert len(set(lengths)) == 2
+    assert buckets[0] == max(lengths)
+    assert buckets[-1] == min(lengths)
+    for rows in engine._plan_batches(lengths, None):
+        assert len(rows) * max(lengths[i] for i in rows) <= TOKEN_BUDGET
+
+
+@pytest.mark.parametrize("backend", ["torch", "onnx"])
+def test_mixed_lengths_get_different_buckets(backend):
+    engine = _load_backend(backend)
+
+    lengths, buckets = _bucket_lengths(engine, SHORT + LONG)
+
+    # real (unpadded) counts: short and long texts must not report the same length
+    assert max(lengths[:len(SHORT)]) < min(lengths[len(SHORT):])
+    assert len(set(buckets)) > 1
+
+    _, stats = engine.encode_with_stats(SHORT + LONG)
+    assert stats["tokens"] == sum(lengths)
+    assert stats["padded_tokens"] >= stats["tokens"]
@@ -0,0 +1,57 @@
+import os
+
+import numpy as np
+import pytest
+
+from benchmarks.corpus import paragraphs, questions
+from benchmarks.onnx_backend import DEFAULT_MIN_COSINE, parity, synthetic_texts
+from utils.embedding_engine import EMBEDDING_MODEL_NAME, EmbeddingEngine
+
+TOP_K = 5
+MIN_TOP_K_OVERLAP = 0.8      # mean share of the torch top-k that the ONNX top-k also returns
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("tokenizers")
+pytest.importorskip("sentence_transformers")
+
+
+def _engine(backend: str) -> EmbeddingEngine:
+    return EmbeddingEngine(backend=backend, query_cache_path=None, chunk_cache_path=None, query_batching=False)
+
+
+@pytest.fixture(scope="module")
+def engines():
+    from utils.onnx_backend import INT8_FILE, default_model_dir
+    if not os.path.isfile(os.path.join(default_model_dir(EMBEDDING_MODEL_NAME), INT8_FILE)):
+        pytest.skip("no exported ONNX model (python -m benchmarks.onnx_backend exports one)")
+    torch_engine, onnx_engine = _engine("torch"), _engine("onnx")
+    try:
+        torch_engine.load()
+        onnx_engine.load()
+    except OSError as e:
+        pytest.skip(f"embedding model unavailable: {e}")
+    return torch_engine, onnx_engine
+
+
+def test_vectors_match(engines):
+    torch_engine, onnx_engine = engines
+    texts = synthetic_texts(200)
+
+    agreement = parity(torch_engine.encode(texts), onnx_engine.encode(texts))
+
+    assert agreement["min_cosine"] >= DEFAULT_MIN_COSINE
+
+
+def test_top_k_neighbours_agree(engines):
+    torch_engine, onnx_engine = engines
+    corpus = list(paragraphs(20_000))              # seeded paragraphs with planted facts
+    queries = questions(40, 20_000)                # questions about those facts
+
+    def top_k(engine):
+        scores = engine.encode(queries) @ engine.encode(corpus).T      # normalized → cosine
+        return np.argsort(-scores, axis=1)[:, :TOP_K]
+
+    expected, actual = top_k(torch_engine), top_k(onnx_engine)
+    overlap = np.mean([len(set(e) & set(a)) / TOP_K for e, a in zip(expected, actual)])
+
+    assert overlap >= MIN_TOP_K_OVERLAP
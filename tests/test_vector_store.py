@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+import utils.collection as collection
+import utils.vector_store as vector_store
+
+DIM = 16
+
+
+@pytest.fixture(autouse=True)
+def store_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store, "VECTOR_STORE_DIR", str(tmp_path))
+    monkeypatch.setattr(collection, "_default_collection", collection.Collection(str(tmp_path / "_collection")))
+    vector_store.clear_index_cache()
+    yield tmp_path
+    vector_store.clear_index_cache()
+
+
+def _vectors(n, seed):
+    return np.random.default_rng(seed).normal(size=(n, DIM)).astype(np.float32)
+
+
+def _write(doc_id, chunks, vectors, index_type="flat", replaces=None, codec="float32"):
+    with vector_store.StoreWriter(doc_id, index_type=index_type, codec=codec, replaces=replaces,
+                                  metadata={"embedding_model": "test"}) as writer:
+        writer.add(chunks, vectors)
+        writer.commit()
+        return writer.index_info
+
+
+def _nearest(doc_id, vector):
+    store = vector_store._load_store(doc_id)
+    query = np.array(vector, dtype=np.float32).reshape(1, -1)
+    if store.normalized:
+        query /= np.linalg.norm(query)
+    _, ids = store.index.search(query, 1)
+    return store.chunks[int(ids[0][0])]
+
+
+@pytest.mark.parametrize("index_type,codec", [("flat", "float32"), ("flat", "int8"), ("ivf_flat", "float32")])
+def test_edited_version_updates_previous_index_in_place(index_type, codec):
+    old_chunks = [f"chunk {i}" for i in range(200)]
+    old_vectors = _vectors(200, seed=0)
+    _write("v1", old_chunks, old_vectors, index_type, codec=codec)
+
+    # first 160 chunks unchanged, the rest edited / appended
+    new_chunks = old_chunks[:160] + [f"edited {i}" for i in range(60)]
+    new_vectors = np.vstack([old_vectors[:160], _vectors(60, seed=1)])
+    info = _write("v2", new_chunks, new_vectors, index_type, replaces="v1", codec=codec)
+
+    assert info["updated_from"] == "v1"
+    assert info["reused_vectors"] == 160
+    store = vector_store._load_store("v2")
+    assert store.index.ntotal == len(new_chunks)
+    for row in (0, 159, 160, 219):
+        assert _nearest("v2", new_vectors[row]) == new_chunks[row]
+    assert "v1" not in vector_store.list_stored_documents()
+
+
+def test_hnsw_is_rebuilt_unless_only_appended():
+    chunks = [f"chunk {i}" for i in range(100)]
+    vectors = _vectors(100, seed=0)
+    _write("v1", chunks, vectors, "hnsw")
+
+    appended = _write("v2", chunks + ["new"], np.vstack([vectors, _vectors(1, seed=1)]), "hnsw", replaces="v1")
+    assert appended["reused_vectors"] == 100
+
+    truncated = _write("v3", chunks[:90] + ["edited"], np.vstack([vectors[:90], _vectors(1, seed=2)]),
+                       "hnsw", replaces="v2")
+    assert "updated_from" not in truncated
+    assert _nearest("v3", vectors[10]) == chunks[10]
+
+
+def test_mostly_changed_version_is_rebuilt():
+    chunks = [f"chunk {i}" for i in range(100)]
+    _write("v1", chunks, _vectors(100, seed=0))
+
+    info = _write("v2", chunks[:10] + [f"new {i}" for i in range(90)], _vectors(100, seed=1), replaces="v1")
+
+    assert "updated_from" not in info
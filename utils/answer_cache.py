@@ -0,0 +1,208 @@
+import os
+import time
+import threading
+import logging
+import numpy as np
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from utils.cache import LRUCache
+from utils.embedding_engine import get_engine, normalize_query
+
+logger = logging.getLogger(__name__)
+
+# ────────────────────────────────────────────────
+#  Semantic answer cache
+#
+#  Serves a previous answer (with its source chunks) when a new question is
+#  close enough to one already answered — skipping retrieval and the LLM.
+#
+#  Entries live in a scope = (doc_id or "*", index version, prompt template id):
+#  re-indexing changes the version, so answers computed against the old
+#  index are never served and are dropped on the next lookup in that scope.
+#  Within a scope, questions match by cosine similarity of their query
+#  embeddings (the same cached vectors retrieval uses).
+# ────────────────────────────────────────────────
+
+ANSWER_CACHE_ENABLED = os.environ.get("RAG_ANSWER_CACHE", "1") != "0"
+ANSWER_CACHE_THRESHOLD = float(os.environ.get("RAG_ANSWER_CACHE_THRESHOLD", 0.92))
+ANSWER_CACHE_TTL_S = float(os.environ.get("RAG_ANSWER_CACHE_TTL_S", 3600))
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("RAG_ANSWER_CACHE_MAX_ENTRIES", 1024))
+
+Scope = Tuple[str, str, str]
+
+
+class SemanticAnswerCache:
+    """
+    Similarity-matched answer cache with TTL and LRU eviction.
+
+    ``embed`` maps a question to a vector (defaults to the embedding engine's
+    query embedding, normalized, so a dot product is the cosine).
+    """
+
+    def __init__(
+        self,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        ttl_s: float = ANSWER_CACHE_TTL_S,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        embed: Optional[Callable[[str], np.ndarray]] = None,
+    ):
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self._embed = embed or (lambda text: get_engine().embed_query(text))
+        self._lock = threading.RLock()
+        # key = (scope, normalized question); LRU order + eviction live here,
+        # the per-scope vector lists are what similarity search runs over
+        self._entries = LRUCache(max_entries, on_evict=self._forget)
+        self._by_scope: Dict[Scope, Dict[Hashable, np.ndarray]] = {}
+
+        self.lookups = 0
+        self.hits = 0
+        self.exact_hits = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.saved_ms = 0.0
+
+    @staticmethod
+    def scope(doc_id: Optional[str], index_version: str, template_id: str) -> Scope:
+        return (doc_id or "*", str(index_version), template_id)
+
+    def _vector(self, question: str) -> np.ndarray:
+        vec = np.asarray(self._embed(question), dtype=np.float32).ravel()
+        norm = float(np.linalg.norm(vec))
+        return vec / norm if norm > 0 else vec
+
+    def _forget(self, key: Hashable, _value: Any = None) -> None:
+        with self._lock:
+            vectors = self._by_scope.get(key[0])
+            if vectors is not None:
+                vectors.pop(key, None)
+                if not vectors:
+                    del self._by_scope[key[0]]
+
+    def _drop_stale_versions(self, scope: Scope) -> None:
+        """Entries for the same document + template but another index version"""
+        stale = [s for s in self._by_scope if s[0] == scope[0] and s[2] == scope[2] and s[1] != scope[1]]
+        for s in stale:
+            for key in list(self._by_scope.get(s, {})):
+                self._entries.pop(key)
+                self._forget(key)
+                self.invalidations += 1
+
+    def _live_entry(self, key: Hashable, now: float) -> Optional[Dict[str, Any]]:
+        """Entry for key, or None – expired entries are evicted on the way (lock held)"""
+        entry = self._entries.get(key)
+        if entry is not None and now - entry["created_at"] > self.ttl_s:
+            self._entries.pop(key)
+            self._forget(key)
+            self.expirations += 1
+            return None
+        return entry
+
+    def lookup(self, scope: Scope, question: str) -> Optional[Dict[str, Any]]:
+        """
+        Cached entry for a question similar to ``question`` in ``scope``, or None.
+        The returned dict has "answer", "source_chunks", "similarity", "question", ...
+        """
+        now = time.time()
+        exact_key = (scope, normalize_query(question))
+        with self._lock:
+            self.lookups += 1
+            self._drop_stale_versions(scope)
+            candidates = self._by_scope.get(scope)
+            if not candidates:
+                return None
+            entry = self._live_entry(exact_key, now) if exact_key in candidates else None
+            if entry is not None:
+                return self._hit(entry, 1.0, exact=True)
+
+        # Outside the lock: may run the embedding model
+        query_vec = self._vector(question)
+
+        with self._lock:
+            candidates = self._by_scope.get(scope)
+            if not candidates:
+                return None
+            keys = list(candidates)
+            scores = np.stack([candidates[k] for k in keys]) @ query_vec
+            # Best live match above the threshold (expired ones are evicted and skipped)
+            for best in np.argsort(-scores, kind="stable"):
+                similarity = float(scores[best])
+                if similarity < self.threshold:
+                    break
+                entry = self._live_entry(keys[best], now)
+                if entry is not None:
+                    return self._hit(entry, similarity, exact=keys[best] == exact_key)
+            return None
+
+    def _hit(self, entry: Dict[str, Any], similarity: float, exact: bool) -> Dict[str, Any]:
+        self.hits += 1
+        if exact:
+            self.exact_hits += 1
+        self.saved_ms += entry.get("cost_ms", 0.0)
+        return {**entry, "similarity": similarity}
+
+    def store(
+        self,
+        scope: Scope,
+        question: str,
+        answer: str,
+        source_chunks: List[Any],
+        cost_ms: float = 0.0,
+        extra: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """Remember an answer. cost_ms (retrieval + generation) is what a later hit saves."""
+        key = (scope, normalize_query(question))
+        vector = self._vector(question)
+        entry = {
+            "question": question,
+            "answer": answer,
+            "source_chunks": source_chunks,
+            "cost_ms": float(cost_ms),
+            "created_at": time.time(),
+            **(extra or {}),
+        }
+        with self._lock:
+            self._entries.put(key, entry)
+            self._by_scope.setdefault(scope, {})[key] = vector
+
+    def invalidate(self, doc_id: Optional[str] = None) -> int:
+        """Drop every entry of one document (or all entries). Returns how many."""
+        with self._lock:
+            scopes = [s for s in self._by_scope if doc_id is None or s[0] == doc_id]
+            dropped = 0
+            for s in scopes:
+                for key in list(self._by_scope.get(s, {})):
+                    self._entries.pop(key)
+                    self._forget(key)
+                    dropped += 1
+            self.invalidations += dropped
+            return dropped
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "exact_hits": self.exact_hits,
+                "hit_rate": (self.hits / self.lookups) if self.lookups else 0.0,
+                "saved_latency_ms": round(self.saved_ms, 1),
+                "evictions": self._entries.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "threshold": self.threshold,
+                "ttl_s": self.ttl_s,
+            }
+
+
+_default_cache: Optional[SemanticAnswerCache] = None
+_default_cache_guard = threading.Lock()
+
+
+def get_answer_cache() -> SemanticAnswerCache:
+    """Process-wide answer cache (shared by all chat sessions)"""
+    global _default_cache
+    with _default_cache_guard:
+        if _default_cache is None:
+            _default_cache = SemanticAnswerCache()
+        return _default_cache
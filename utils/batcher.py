@@ -0,0 +1,143 @@
+import os
+import time
+import queue
+import threading
+import logging
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Request coalescer: gathers items submitted concurrently from many threads
+    and processes them with one call of ``batch_fn``.
+
+    A batch is dispatched when it reaches ``max_batch_size`` items or when
+    ``max_wait_ms`` has passed since its first item arrived, whichever comes
+    first. Items that arrive while a batch is running queue up and form the
+    next batch, so under load batches grow without any extra waiting.
+
+    ``batch_fn(items)`` must return one result per item, in order.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], Sequence[Any]],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 2.0,
+        name: str = "batcher",
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1")
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.name = name
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._max_queue_depth = 0
+        self._batch_size_counts: Dict[int, int] = {}
+        self._total_wait_s = 0.0
+
+        self._closed = False
+        self._thread = None
+        self._thread_pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_worker(self) -> None:
+        # Started lazily and re-started after fork(): threads do not survive
+        # into child processes, but this object (and its queue) does
+        if self._thread is not None and self._thread_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is None or self._thread_pid != os.getpid():
+                self._queue = queue.Queue()
+                self._thread = threading.Thread(target=self._run, name=f"{self.name}-worker", daemon=True)
+                self._thread_pid = os.getpid()
+                self._thread.start()
+
+    def submit(self, item: Any) -> Future:
+        if self._closed:
+            raise RuntimeError(f"{self.name} is closed")
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        depth = self._queue.qsize()
+        with self._stats_lock:
+            if depth > self._max_queue_depth:
+                self._max_queue_depth = depth
+        return future
+
+    def run(self, item: Any, timeout: float = None) -> Any:
+        """Submit one item and block until its result is ready"""
+        return self.submit(item).result(timeout=timeout)
+
+    def _collect(self) -> list:
+        first = self._queue.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                entry = self._queue.get_nowait() if remaining <= 0 else self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if entry is None:            # close() sentinel: finish this batch, then stop
+                self._queue.put(None)
+                break
+            batch.append(entry)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            if not batch:
+                return
+
+            items = [entry[0] for entry in batch]
+            started = time.perf_counter()
+            try:
+                results = self.batch_fn(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"{self.name}: batch_fn returned {len(results)} results for {len(items)} items")
+                for (_, future, _), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                logger.exception(f"{self.name}: batch of {len(items)} failed")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+            with self._stats_lock:
+                self._batches += 1
+                self._items += len(items)
+                self._batch_size_counts[len(items)] = self._batch_size_counts.get(len(items), 0) + 1
+                self._total_wait_s += sum(started - enqueued for _, _, enqueued in batch)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._max_queue_depth,
+                "batches": self._batches,
+                "items": self._items,
+                "avg_batch_size": (self._items / self._batches) if self._batches else 0.0,
+                "avg_queue_wait_ms": (self._total_wait_s * 1000 / self._items) if self._items else 0.0,
+                "batch_size_histogram": dict(sorted(self._batch_size_counts.items())),
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_ms,
+            }
+
+    def close(self, timeout: float = 5.0) -> None:
+        if not self._closed:
+            self._closed = True
+            if self._thread is not None and self._thread_pid == os.getpid():
+                self._queue.put(None)
+                self._thread.join(timeout=timeout)
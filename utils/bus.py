@@ -0,0 +1,371 @@
+import os
+import time
+import queue
+import asyncio
+import inspect
+import threading
+import logging
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# ────────────────────────────────────────────────
+#  MCP message bus
+#
+#  Agents subscribe to message types. Each type gets a bounded asyncio queue
+#  and ``concurrency`` worker tasks on one event loop (running in a
+#  background thread, so Streamlit's script threads can use it too).
+#  Handlers are plain blocking callables (handle_message) and run in a
+#  per-type thread pool — embedding, FAISS and LLM calls release the GIL, so
+#  requests of one type overlap and a slow ingestion cannot starve retrieval.
+#
+#  A full queue pushes back: submit() waits up to BUS_PUT_TIMEOUT_S for room,
+#  then fails the returned future with BusOverloaded.
+# ────────────────────────────────────────────────
+
+BUS_QUEUE_SIZE = int(os.environ.get("RAG_BUS_QUEUE_SIZE", 64))
+BUS_WORKERS = int(os.environ.get("RAG_BUS_WORKERS", 4))
+BUS_INGEST_WORKERS = int(os.environ.get("RAG_BUS_INGEST_WORKERS", 1))
+BUS_PUT_TIMEOUT_S = float(os.environ.get("RAG_BUS_PUT_TIMEOUT_S", 30))
+
+LATENCY_WINDOW = 1024           # per-queue samples kept for the percentiles
+
+# message type → receiver, concurrency of the default subscriptions
+DEFAULT_ROUTES = {
+    "INGEST_REQUEST": ("IngestionAgent", BUS_INGEST_WORKERS),
+    "RETRIEVE_REQUEST": ("RetrievalAgent", BUS_WORKERS),
+    "RETRIEVE_BATCH_REQUEST": ("RetrievalAgent", BUS_WORKERS),
+    "CONTEXT_RESPONSE": ("LLMResponseAgent", BUS_WORKERS),
+}
+
+_STREAM_END = object()
+
+
+class BusOverloaded(RuntimeError):
+    """A message queue stayed full for longer than the put timeout"""
+
+
+class BusStopped(RuntimeError):
+    """The bus was stopped before the message was handled"""
+
+
+def _fail_stopped(future: Future, msg_type: str) -> None:
+    if not future.done():
+        future.set_exception(BusStopped(f"Bus stopped before '{msg_type}' was handled"))
+
+
+def _percentile(samples: List[float], q: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2)
+
+
+class _Subscription:
+    def __init__(self, msg_type: str, handler: Callable, stream_handler: Optional[Callable],
+                 concurrency: int, queue_size: int):
+        self.msg_type = msg_type
+        self.handler = handler
+        self.stream_handler = stream_handler
+        self.concurrency = max(1, concurrency)
+        self.queue_size = queue_size
+        self.queue: Optional[asyncio.Queue] = None
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=f"bus-{msg_type.lower()}")
+        self.tasks: List[asyncio.Task] = []
+
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_depth = 0
+        self.processed = 0
+        self.errors = 0
+        self.rejected = 0
+        self.wait_ms: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.service_ms: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self.lock:
+            wait, service = list(self.wait_ms), list(self.service_ms)
+            return {
+                "depth": self.queue.qsize() if self.queue is not None else 0,
+                "max_depth": self.max_depth,
+                "capacity": self.queue_size,
+                "concurrency": self.concurrency,
+                "in_flight": self.in_flight,
+                "processed": self.processed,
+                "errors": self.errors,
+                "rejected": self.rejected,
+                "wait_ms_p50": _percentile(wait, 0.50),
+                "wait_ms_p95": _percentile(wait, 0.95),
+                "service_ms_p50": _percentile(service, 0.50),
+                "service_ms_p95": _percentile(service, 0.95),
+            }
+
+
+class MessageBus:
+    """
+    Asynchronous router for MCP messages (utils.mcp.create_message).
+
+    From any thread:
+        future = bus.submit(msg)               # concurrent.futures.Future
+        result = bus.request(msg, timeout=60)  # submit + wait
+        for event in bus.stream(msg): ...      # handlers registered with stream_handler
+    From a coroutine on the bus loop:
+        result = await bus.publish(msg)
+    """
+
+    def __init__(self, queue_size: int = BUS_QUEUE_SIZE, put_timeout_s: float = BUS_PUT_TIMEOUT_S):
+        self.queue_size = queue_size
+        self.put_timeout_s = put_timeout_s
+        self._subscriptions: Dict[str, _Subscription] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    # ── Lifecycle ───────────────────────────────────────────
+
+    def start(self) -> "MessageBus":
+        with self._lock:
+            if self._loop is not None:
+                return self
+            ready = threading.Event()
+
+            def run():
+                loop = asyncio.new_event_loop()
+                asyncio.set_event_loop(loop)
+                self._loop = loop
+                ready.set()
+                loop.run_forever()
+                loop.close()
+
+            self._thread = threading.Thread(target=run, name="mcp-bus", daemon=True)
+            self._thread.start()
+            ready.wait()
+            for sub in self._subscriptions.values():
+                self._call_soon(self._start_workers, sub).result()
+        logger.info(f"Message bus started ({', '.join(self._subscriptions) or 'no subscriptions'})")
+        return self
+
+    def stop(self) -> None:
+        with self._lock:
+            loop, self._loop = self._loop, None
+            if loop is None:
+                return
+
+            async def cancel_workers():
+                tasks = [t for sub in self._subscriptions.values() for t in sub.tasks]
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                # Messages still queued would otherwise leave their callers waiting forever
+                for sub in self._subscriptions.values():
+                    while sub.queue is not None and not sub.queue.empty():
+                        _fail_stopped(sub.queue.get_nowait()[1], sub.msg_type)
+
+            asyncio.run_coroutine_threadsafe(cancel_workers(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            self._thread.join()
+            for sub in self._subscriptions.values():
+                sub.executor.shutdown(wait=False)
+                sub.queue, sub.tasks = None, []
+
+    def _call_soon(self, fn: Callable, *args) -> Future:
+        future: Future = Future()
+
+        def call():
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+
+        self._loop.call_soon_threadsafe(call)
+        return future
+
+    # ── Subscriptions ──────────────────────────────────────
+
+    def subscribe(
+        self,
+        msg_type: str,
+        handler: Callable[..., Any],
+        stream_handler: Optional[Callable[..., Iterator[Any]]] = None,
+        concurrency: int = BUS_WORKERS,
+        queue_size: Optional[int] = None,
+    ) -> None:
+        """
+        Route messages of ``msg_type`` to ``handler(message, **kwargs)`` (blocking
+        callables run in the type's thread pool, coroutine functions on the loop).
+        ``stream_handler`` (a generator function) serves bus.stream() for this type.
+        """
+        sub = _Subscription(msg_type, handler, stream_handler, concurrency, queue_size or self.queue_size)
+        with self._lock:
+            old = self._subscriptions.get(msg_type)
+            self._subscriptions[msg_type] = sub
+            if self._loop is not None:
+                if old is not None:
+                    self._call_soon(lambda: [t.cancel() for t in old.tasks]).result()
+                self._call_soon(self._start_workers, sub).result()
+        if old is not None:
+            old.executor.shutdown(wait=False)
+
+    def subscribe_agents(self, registry, routes: Optional[Dict[str, tuple]] = None) -> None:
+        """Subscribe registry agents by message type (default: DEFAULT_ROUTES)"""
+        for msg_type, (name, concurrency) in (routes or DEFAULT_ROUTES).items():
+            agent = registry.get(name)
+            self.subscribe(
+                msg_type,
+                agent.handle_message,
+                stream_handler=getattr(agent, "handle_message_stream", None),
+                concurrency=concurrency,
+            )
+
+    def message_types(self) -> List[str]:
+        return list(self._subscriptions)
+
+    def _start_workers(self, sub: _Subscription) -> None:
+        sub.queue = asyncio.Queue(maxsize=sub.queue_size)
+        sub.tasks = [self._loop.create_task(self._worker(sub)) for _ in range(sub.concurrency)]
+
+    # ── Dispatch ───────────────────────────────────────────
+
+    def _subscription(self, message: Dict[str, Any]) -> _Subscription:
+        sub = self._subscriptions.get(message.get("type"))
+        if sub is None:
+            raise KeyError(f"No subscriber for message type '{message.get('type')}'")
+        return sub
+
+    async def _enqueue(self, sub: _Subscription, job: tuple) -> None:
+        try:
+            await asyncio.wait_for(sub.queue.put(job), timeout=self.put_timeout_s)
+        except asyncio.TimeoutError:
+            with sub.lock:
+                sub.rejected += 1
+            if job[1].done():               # e.g. cancelled by a stream consumer meanwhile
+                return
+            job[1].set_exception(BusOverloaded(
+                f"Queue '{sub.msg_type}' full ({sub.queue_size}) for {self.put_timeout_s:.0f}s"
+            ))
+            return
+        depth = sub.queue.qsize()
+        with sub.lock:
+            if depth > sub.max_depth:
+                sub.max_depth = depth
+
+    def submit(self, message: Dict[str, Any], **kwargs) -> Future:
+        """Queue a message for its subscriber; the future resolves to the handler's result"""
+        if self._loop is None:
+            self.start()
+        sub = self._subscription(message)
+        future: Future = Future()
+        job = (message, future, kwargs, sub.handler, time.perf_counter())
+        asyncio.run_coroutine_threadsafe(self._enqueue(sub, job), self._loop)
+        return future
+
+    def request(self, message: Dict[str, Any], timeout: Optional[float] = None, **kwargs) -> Any:
+        return self.submit(message, **kwargs).result(timeout=timeout)
+
+    async def publish(self, message: Dict[str, Any], **kwargs) -> Any:
+        """Awaitable submit, for coroutines running on the bus loop"""
+        return await asyncio.wrap_future(self.submit(message, **kwargs))
+
+    def stream(self, message: Dict[str, Any], **kwargs) -> Iterator[Any]:
+        """
+        Run the type's stream_handler through the queue (same concurrency limit
+        and metrics) and yield its items in the calling thread as they arrive.
+
+        Closing the generator early (consumer stopped, Streamlit rerun) stops
+        the handler at its next item and frees the concurrency slot.
+        """
+        sub = self._subscription(message)
+        if sub.stream_handler is None:
+            raise KeyError(f"No stream handler for message type '{sub.msg_type}'")
+        items: "queue.Queue" = queue.Queue()
+        cancelled = threading.Event()
+
+        def pump(msg, **kw):
+            produced = sub.stream_handler(msg, **kw)
+            try:
+                for item in produced:
+                    if cancelled.is_set():
+                        break
+                    items.put(item)
+            finally:
+                close = getattr(produced, "close", None)
+                if close is not None:
+                    close()                 # e.g. stops the underlying LLM stream
+                items.put(_STREAM_END)
+
+        if self._loop is None:
+            self.start()
+        future: Future = Future()
+        job = (message, future, kwargs, pump, time.perf_counter())
+        asyncio.run_coroutine_threadsafe(self._enqueue(sub, job), self._loop)
+
+        try:
+            while True:
+                try:
+                    item = items.get(timeout=0.1)
+                except queue.Empty:
+                    if future.done() and future.exception() is not None:
+                        raise future.exception()
+                    continue
+                if item is _STREAM_END:
+                    break
+                yield item
+            future.result()                 # surface handler errors
+        finally:
+            cancelled.set()
+            future.cancel()                 # still queued → the worker skips it
+
+    async def _worker(self, sub: _Subscription) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            message, future, kwargs, handler, enqueued = await sub.queue.get()
+            started = time.perf_counter()
+            with sub.lock:
+                sub.in_flight += 1
+                sub.wait_ms.append((started - enqueued) * 1000)
+            try:
+                if future.set_running_or_notify_cancel():
+                    if inspect.iscoroutinefunction(handler):
+                        result = await handler(message, **kwargs)
+                    else:
+                        result = await loop.run_in_executor(sub.executor, lambda: handler(message, **kwargs))
+                    future.set_result(result)
+            except asyncio.CancelledError:
+                # Already running, so cancel() is a no-op: fail it for a blocked request()
+                _fail_stopped(future, sub.msg_type)
+                raise
+            except Exception as e:
+                with sub.lock:
+                    sub.errors += 1
+                logger.exception(f"Bus handler for {sub.msg_type} failed")
+                future.set_exception(e)
+            finally:
+                with sub.lock:
+                    sub.in_flight -= 1
+                    sub.processed += 1
+                    sub.service_ms.append((time.perf_counter() - started) * 1000)
+                sub.queue.task_done()
+
+    # ── Metrics ────────────────────────────────────────────
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Per message type: queue depth / capacity, in-flight, counts, wait + service latency"""
+        return {msg_type: sub.metrics() for msg_type, sub in self._subscriptions.items()}
+
+
+_default_bus: Optional[MessageBus] = None
+_default_bus_guard = threading.Lock()
+
+
+def get_bus() -> MessageBus:
+    """Process-wide bus, subscribed to the registry agents and started"""
+    global _default_bus
+    with _default_bus_guard:
+        if _default_bus is None:
+            from agents.registry import get_registry
+            bus = MessageBus()
+            bus.subscribe_agents(get_registry())
+            _default_bus = bus.start()
+        return _default_bus
@@ -0,0 +1,191 @@
+import os
+import sqlite3
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with a size budget.
+
+    Every entry is stored together with its (estimated) size. When the total
+    size exceeds ``max_size`` the least recently used entries are evicted.
+    Use ``sizeof=lambda v: 1`` to turn the budget into a plain entry count.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        sizeof: Optional[Callable[[Any], int]] = None,
+        on_evict: Optional[Callable[[Hashable, Any], None]] = None,
+    ):
+        self.max_size = max_size
+        self._sizeof = sizeof or (lambda value: 1)
+        self._on_evict = on_evict
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._current_size = 0
+        self._lock = threading.RLock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Return a value without touching LRU order or hit/miss counters."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return default if entry is None else entry[0]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        size = max(int(self._sizeof(value)), 0)
+        with self._lock:
+            if key in self._entries:
+                self._current_size -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self._current_size += size
+            self._evict_over_budget(keep=key)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return default
+            self._current_size -= entry[1]
+            return entry[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._current_size = 0
+
+    def resize(self, max_size: int) -> None:
+        with self._lock:
+            self.max_size = max_size
+            self._evict_over_budget()
+
+    def _evict_over_budget(self, keep: Optional[Hashable] = None) -> None:
+        # The most recently inserted entry is kept even if it alone exceeds
+        # the budget — otherwise a single large item would never be cached.
+        while self._current_size > self.max_size and self._entries:
+            oldest_key = next(iter(self._entries))
+            if oldest_key == keep and len(self._entries) == 1:
+                break
+            value, size = self._entries.pop(oldest_key)
+            self._current_size -= size
+            self.evictions += 1
+            if self._on_evict is not None:
+                self._on_evict(oldest_key, value)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "size": self._current_size,
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+class DiskVectorCache:
+    """
+    Persistent float32 vector cache backed by SQLite (stdlib, no server).
+
+    Entries are keyed by (model, key) so vectors from different embedding
+    models never mix.
+    """
+
+    def __init__(self, path: str, table: str = "vectors"):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.table = table
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                " model TEXT NOT NULL, key TEXT NOT NULL, vector BLOB NOT NULL,"
+                " PRIMARY KEY (model, key))"
+            )
+            self._conn.commit()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, model: str, key: str) -> Optional[np.ndarray]:
+        return self.get_many(model, [key]).get(key)
+
+    def get_many(self, model: str, keys: List[str]) -> Dict[str, np.ndarray]:
+        found: Dict[str, np.ndarray] = {}
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            # SQLite limits bound parameters per statement
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM {self.table} WHERE model = ? AND key IN ({placeholders})",
+                    [model, *batch],
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+            self.hits += len(found)
+            self.misses += len(unique) - len(found)
+        return found
+
+    def put(self, model: str, key: str, vector: np.ndarray) -> None:
+        self.put_many(model, [key], [vector])
+
+    def put_many(self, model: str, keys: List[str], vectors) -> None:
+        rows = [
+            (model, key, np.ascontiguousarray(vec, dtype=np.float32).tobytes())
+            for key, vec in zip(keys, vectors)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (model, key, vector) VALUES (?, ?, ?)", rows
+            )
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,394 @@
+import os
+import copy
+import json
+import time
+import heapq
+import threading
+import contextlib
+import logging
+import numpy as np
+import faiss
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import fcntl            # cross-process locking (not available on Windows)
+except ImportError:         # pragma: no cover
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# ────────────────────────────────────────────────
+#  Collection-level index
+#
+#  Holds the vectors of every ingested document in a small number of shards,
+#  so corpus-wide search is one search per shard instead of one per document.
+#
+#  {COLLECTION_DIR}/
+#      manifest.json       dim, codec, shards, doc_id → (ordinal, shard, count)
+#      shard-0000.faiss    IndexIDMap2 over a flat (float32) or float16 index
+#      ...
+#
+#  Vector ids are (doc_ordinal << 32) | chunk_index, so all vectors of one
+#  document form a contiguous id range and doc_id filters become cheap
+#  FAISS ID selectors. A document always lives in exactly one shard.
+# ────────────────────────────────────────────────
+
+COLLECTION_DIR = os.path.join("data", "vector_store", "_collection")
+MANIFEST_FILE = "manifest.json"
+COLLECTION_FORMAT_VERSION = 1
+
+# Start a new shard once the active one would grow beyond this many vectors
+SHARD_MAX_VECTORS = int(os.environ.get("RAG_SHARD_MAX_VECTORS", 50_000))
+
+# Shard vector storage, fixed when the collection is created: "float32" or
+# "float16" (int8 would need a quantizer trained before the first shard exists)
+COLLECTION_CODECS = ("float32", "float16")
+COLLECTION_CODEC = os.environ.get("RAG_COLLECTION_CODEC", "float32")
+
+_ID_SHIFT = 32
+
+
+def make_vector_id(ordinal: int, chunk_index: int) -> int:
+    return (ordinal << _ID_SHIFT) | chunk_index
+
+
+def split_vector_id(vector_id: int) -> Tuple[int, int]:
+    return vector_id >> _ID_SHIFT, vector_id & ((1 << _ID_SHIFT) - 1)
+
+
+class Collection:
+    """
+    Sharded FAISS index over many documents with doc_id as a filterable attribute.
+    """
+
+    def __init__(self, root_dir: str = COLLECTION_DIR, shard_max_vectors: int = SHARD_MAX_VECTORS):
+        self.root_dir = root_dir
+        self.shard_max_vectors = shard_max_vectors
+        os.makedirs(self.root_dir, exist_ok=True)
+
+        self._lock = threading.RLock()
+        # Shards are mutated in place: writers wait for in-flight searches to drain
+        self._readers = 0
+        self._writing = False
+        self._readers_idle = threading.Condition(self._lock)
+        self._manifest: Optional[Dict[str, Any]] = None
+        self._manifest_version = None
+        self._shards: Dict[str, Tuple[Any, faiss.Index]] = {}   # name → (file version, index)
+
+    # ── Locking / persistence ───────────────────────────────
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Serialize writers across threads and (where supported) processes"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.root_dir, ".lock"), "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _file_version(path: str):
+        try:
+            stat_result = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (stat_result.st_mtime_ns, stat_result.st_size)
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.root_dir, MANIFEST_FILE)
+
+    def _shard_path(self, name: str) -> str:
+        return os.path.join(self.root_dir, f"{name}.faiss")
+
+    def manifest(self) -> Dict[str, Any]:
+        """Current manifest, re-read only when the file changed on disk"""
+        path = self._manifest_path()
+        version = self._file_version(path)
+        with self._lock:
+            if self._manifest is not None and version == self._manifest_version:
+                return self._manifest
+            if version is None:
+                manifest = {
+                    "format_version": COLLECTION_FORMAT_VERSION,
+                    "dim": None,
+                    "normalized": None,
+                    "codec": None,
+                    "next_ordinal": 0,
+                    "shards": [],
+                    "docs": {},
+                }
+            else:
+                with open(path, "r", encoding="utf-8") as f:
+                    manifest = json.load(f)
+            self._manifest, self._manifest_version = manifest, version
+            return manifest
+
+    def _write_manifest(self, manifest: Dict[str, Any]) -> None:
+        path = self._manifest_path()
+        tmp = f"{path}.tmp-{os.getpid()}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, path)
+        self._manifest, self._manifest_version = manifest, self._file_version(path)
+
+    def _shard(self, name: str) -> faiss.Index:
+        path = self._shard_path(name)
+        version = self._file_version(path)
+        with self._lock:
+            cached = self._shards.get(name)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+            index = faiss.read_index(path)
+            self._shards[name] = (version, index)
+            return index
+
+    def _write_shard(self, name: str, index: faiss.Index) -> None:
+        path = self._shard_path(name)
+        tmp = f"{path}.tmp-{os.getpid()}"
+        faiss.write_index(index, tmp)
+        os.replace(tmp, path)
+        self._shards[name] = (self._file_version(path), index)
+
+    @contextlib.contextmanager
+    def _reading(self):
+        """Mark a search in flight so writers don't mutate a shard under it"""
+        with self._lock:
+            self._readers_idle.wait_for(lambda: not self._writing)
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._readers -= 1
+                self._readers_idle.notify_all()
+
+    @contextlib.contextmanager
+    def _mutating(self):
+        """
+        Exclusive access to the cached shards (caller holds ``_locked``).
+        Yields a name → index dict of shards to modify in place; each one is
+        written to disk once on exit. On failure the touched shards are dropped
+        from the cache so the next access re-reads them from disk.
+        """
+        self._writing = True
+        dirty: Dict[str, faiss.Index] = {}
+        try:
+            self._readers_idle.wait_for(lambda: self._readers == 0)
+            yield dirty
+            for name, index in dirty.items():
+                self._write_shard(name, index)
+        except BaseException:
+            for name in dirty:
+                self._shards.pop(name, None)
+            raise
+        finally:
+            self._writing = False
+            self._readers_idle.notify_all()
+
+    def _shard_for_update(self, name: str, dirty: Dict[str, faiss.Index]) -> faiss.Index:
+        if name not in dirty:
+            dirty[name] = self._shard(name)
+        return dirty[name]
+
+    # ── Mutation ────────────────────────────────────────────
+
+    def add_document(
+        self,
+        doc_id: str,
+        vectors: np.ndarray,
+        normalized: bool = True,
+        replaces: Optional[str] = None,
+    ) -> None:
+        """
+        Add (or replace) all vectors of one document. Row i of ``vectors``
+        must correspond to chunk i of the document.
+
+        ``replaces`` names an older version of the document whose vectors are
+        dropped in the same manifest update, so the swap is atomic for readers.
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[0] == 0:
+            raise ValueError(f"No vectors provided for document '{doc_id}'")
+
+        with self._locked():
+            # Work on a private copy: readers keep using the published manifest
+            manifest = copy.deepcopy(self.manifest())
+
+            if manifest["dim"] is None:
+                manifest["dim"] = int(vectors.shape[1])
+                manifest["normalized"] = bool(normalized)
+                manifest["codec"] = COLLECTION_CODEC
+            elif manifest["dim"] != vectors.shape[1]:
+                raise ValueError(
+                    f"Dimension mismatch: collection has dim={manifest['dim']}, "
+                    f"document '{doc_id}' has dim={vectors.shape[1]}"
+                )
+
+            # One write per touched shard, even when a replaced version shares it
+            with self._mutating() as dirty:
+                for old_doc_id in {doc_id, replaces} - {None}:
+                    if old_doc_id in manifest["docs"]:
+                        self._remove_locked(manifest, old_doc_id, dirty)
+
+                shards = manifest["shards"]
+                if not shards or (
+                    shards[-1]["count"] > 0
+                    and shards[-1]["count"] + len(vectors) > self.shard_max_vectors
+                ):
+                    name = f"shard-{len(shards):04d}"
+                    shards.append({"name": name, "count": 0})
+                    dirty[name] = faiss.IndexIDMap2(
+                        _new_shard_index(manifest["dim"], manifest.get("codec") or "float32")
+                    )
+                name = shards[-1]["name"]
+                index = self._shard_for_update(name, dirty)
+
+                ordinal = manifest["next_ordinal"]
+                manifest["next_ordinal"] = ordinal + 1
+                ids = np.arange(len(vectors), dtype=np.int64) | np.int64(ordinal << _ID_SHIFT)
+                index.add_with_ids(vectors, ids)
+
+            shards[-1]["count"] = int(index.ntotal)
+            manifest["docs"][doc_id] = {
+                "ordinal": ordinal,
+                "shard": name,
+                "count": int(len(vectors)),
+                "added_at": time.time(),
+            }
+            self._write_manifest(manifest)
+
+        logger.info(f"Collection: added {doc_id} | {len(vectors)} vectors | shard={name}")
+
+    def remove_document(self, doc_id: str) -> bool:
+        with self._locked():
+            # Work on a private copy: readers keep using the published manifest
+            manifest = copy.deepcopy(self.manifest())
+            if doc_id not in manifest["docs"]:
+                return False
+            with self._mutating() as dirty:
+                self._remove_locked(manifest, doc_id, dirty)
+            self._write_manifest(manifest)
+            return True
+
+    def _remove_locked(self, manifest: Dict[str, Any], doc_id: str, dirty: Dict[str, faiss.Index]) -> None:
+        entry = manifest["docs"].pop(doc_id)
+        ordinal = entry["ordinal"]
+        index = self._shard_for_update(entry["shard"], dirty)
+        index.remove_ids(faiss.IDSelectorRange(ordinal << _ID_SHIFT, (ordinal + 1) << _ID_SHIFT))
+        for shard in manifest["shards"]:
+            if shard["name"] == entry["shard"]:
+                shard["count"] = int(index.ntotal)
+
+    # ── Queries ─────────────────────────────────────────────
+
+    def list_documents(self) -> List[str]:
+        return sorted(self.manifest()["docs"].keys())
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.manifest()["docs"]
+
+    def search(
+        self,
+        query_vecs: np.ndarray,
+        k: int = 5,
+        doc_ids: Optional[Iterable[str]] = None,
+        doc_rows: Optional[Dict[str, np.ndarray]] = None,
+    ) -> List[List[Tuple[float, str, int]]]:
+        """
+        Search every shard and merge the per-shard top-k.
+
+        Args:
+            query_vecs:  (n, dim) float32 array, already normalized like the collection
+            k:           results per query
+            doc_ids:     optional restriction to these documents
+            doc_rows:    optional further restriction of some of those documents
+                         to the given chunk indexes (metadata filters)
+
+        Returns:
+            For each query, up to k (distance, doc_id, chunk_index) tuples, best first
+        """
+        manifest = self.manifest()
+        docs = manifest["docs"]
+        query_vecs = np.ascontiguousarray(query_vecs, dtype=np.float32).reshape(-1, manifest["dim"] or 1)
+        merged: List[List[Tuple[float, str, int]]] = [[] for _ in range(len(query_vecs))]
+        if not docs:
+            return merged
+
+        by_ordinal = {entry["ordinal"]: doc_id for doc_id, entry in docs.items()}
+
+        # Which shards to visit, and which id ranges are allowed inside each
+        if doc_ids is None:
+            targets = {shard["name"]: None for shard in manifest["shards"] if shard["count"] > 0}
+        else:
+            targets: Dict[str, Optional[List[int]]] = {}
+            for doc_id in doc_ids:
+                entry = docs.get(doc_id)
+                if entry is not None:
+                    targets.setdefault(entry["shard"], []).append(entry["ordinal"])
+
+        for name, ordinals in targets.items():
+            params = None
+            if ordinals is not None:
+                params = faiss.SearchParameters(sel=_ordinal_selector(ordinals, docs, by_ordinal, doc_rows))
+            with self._reading():
+                index = self._shard(name)
+                if index.ntotal == 0:
+                    continue
+                distances, ids = index.search(query_vecs, min(k, index.ntotal), params=params)
+            for qi in range(len(query_vecs)):
+                for dist, vid in zip(distances[qi], ids[qi]):
+                    if vid < 0:
+                        continue
+                    ordinal, chunk_index = split_vector_id(int(vid))
+                    doc_id = by_ordinal.get(ordinal)
+                    if doc_id is not None:
+                        merged[qi].append((float(dist), doc_id, chunk_index))
+
+        return [heapq.nsmallest(k, hits) for hits in merged]
+
+
+def _new_shard_index(dim: int, codec: str) -> faiss.Index:
+    if codec not in COLLECTION_CODECS:
+        raise ValueError(f"Unknown collection codec '{codec}' (expected one of {COLLECTION_CODECS})")
+    if codec == "float16":
+        return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_L2)
+    return faiss.IndexFlatL2(dim)
+
+
+def _ordinal_selector(
+    ordinals: List[int],
+    docs: Dict[str, Any],
+    by_ordinal: Dict[int, str],
+    doc_rows: Optional[Dict[str, np.ndarray]] = None,
+) -> faiss.IDSelector:
+    doc_rows = doc_rows or {}
+    if len(ordinals) == 1 and by_ordinal[ordinals[0]] not in doc_rows:
+        o = ordinals[0]
+        return faiss.IDSelectorRange(o << _ID_SHIFT, (o + 1) << _ID_SHIFT)
+
+    def rows(o: int) -> np.ndarray:
+        doc_id = by_ordinal[o]
+        if doc_id in doc_rows:
+            return np.asarray(doc_rows[doc_id], dtype=np.int64)
+        return np.arange(docs[doc_id]["count"], dtype=np.int64)
+
+    ids = np.concatenate([rows(o) | np.int64(o << _ID_SHIFT) for o in ordinals])
+    return faiss.IDSelectorBatch(ids)
+
+
+_default_collection: Optional[Collection] = None
+_default_collection_guard = threading.Lock()
+
+
+def get_collection() -> Collection:
+    """Process-wide collection instance"""
+    global _default_collection
+    with _default_collection_guard:
+        if _default_collection is None:
+            _default_collection = Collection()
+        return _default_collection
@@ -0,0 +1,202 @@
+import os
+import re
+import hashlib
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# ────────────────────────────────────────────────
+#  Context packer
+#
+#  Turns retrieved chunks (best first) into the passages that go into the
+#  prompt:
+#    1. chunks of the same document with consecutive chunk_index are merged
+#       into one passage, with the overlap between neighbours cut out
+#       (or a line break between them when they share no overlap)
+#    2. passages / paragraphs already present in a more relevant passage are dropped
+#    3. passages fill a token budget in relevance order (the last one that
+#       does not fit is truncated at a sentence / word boundary if worthwhile)
+#
+#  Chunks may be plain strings or {"text", "score", "metadata": {"doc_id",
+#  "chunk_index", ...}} dicts as produced by RetrievalAgent.
+# ────────────────────────────────────────────────
+
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("RAG_CONTEXT_TOKEN_BUDGET", 3000))
+
+MAX_OVERLAP_CHARS = 600          # chunker overlap is 150–200 chars; leave headroom
+MIN_OVERLAP_CHARS = 12           # shorter suffix/prefix matches are coincidence
+MIN_DEDUP_PARAGRAPH_CHARS = 40   # short lines ("Total", table headers) may legitimately repeat
+MIN_TRUNCATED_TOKENS = 48        # not worth adding a sliver of a passage
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Fast local token estimate: word pieces + punctuation, scaled for subword
+    splits of longer words. Within ~10% of WordPiece / SentencePiece counts
+    on English prose — close enough for budgeting, no tokenizer needed.
+    """
+    if not text:
+        return 0
+    pieces = _TOKEN_RE.findall(text)
+    long_words = sum(1 for p in pieces if len(p) > 8)
+    return len(pieces) + long_words // 2
+
+
+def _text_and_meta(chunk: Any) -> Tuple[str, Optional[float], Dict[str, Any]]:
+    if isinstance(chunk, dict):
+        text = chunk.get("text", chunk.get("content", "")) or ""
+        return text, chunk.get("score"), dict(chunk.get("metadata") or {})
+    return str(chunk), None, {}
+
+
+def _overlap(a: str, b: str, max_len: int = MAX_OVERLAP_CHARS) -> int:
+    """Length of the longest suffix of a that is also a prefix of b"""
+    for length in range(min(max_len, len(a), len(b)), MIN_OVERLAP_CHARS - 1, -1):
+        if a.endswith(b[:length]):
+            return length
+    return 0
+
+
+def _paragraph_key(paragraph: str) -> str:
+    return hashlib.sha1(" ".join(paragraph.split()).lower().encode("utf-8")).hexdigest()
+
+
+def _truncate(text: str, max_tokens: int, estimator: Callable[[str], int]) -> str:
+    """Longest prefix within max_tokens, cut at a sentence end if possible, else at a word"""
+    lo, hi = 0, len(text)
+    while lo < hi:                                    # binary search on characters
+        mid = (lo + hi + 1) // 2
+        if estimator(text[:mid]) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    prefix = text[:lo]
+    sentence_end = max(prefix.rfind(". "), prefix.rfind(".\n"), prefix.rfind("? "), prefix.rfind("! "))
+    if sentence_end > len(prefix) // 2:
+        return prefix[:sentence_end + 1]
+    space = prefix.rfind(" ")
+    return (prefix[:space] if space > 0 else prefix) + " …"
+
+
+def pack_context(
+    chunks: List[Any],
+    token_budget: int = CONTEXT_TOKEN_BUDGET,
+    estimator: Callable[[str], int] = estimate_tokens,
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Args:
+        chunks:        retrieved chunks, most relevant first
+        token_budget:  max estimated tokens of passage text (0 → unlimited)
+
+    Returns:
+        (passages, stats) — passages are {"text", "score", "metadata"} dicts,
+        most relevant first; metadata carries "chunk_indexes" for merged runs.
+        stats: raw_tokens, packed_tokens, raw_chunks, passages, merged_chunks,
+        duplicate_chunks, dropped_passages, truncated, token_budget
+    """
+    items = []
+    for rank, chunk in enumerate(chunks):
+        text, score, meta = _text_and_meta(chunk)
+        items.append({"rank": rank, "text": text, "score": score, "meta": meta})
+    raw_tokens = sum(estimator(item["text"]) for item in items)
+
+    # 1. Group consecutive chunk indexes of the same document into runs
+    positioned: Dict[Any, List[dict]] = {}
+    standalone: List[List[dict]] = []
+    for item in items:
+        chunk_index = item["meta"].get("chunk_index")
+        if isinstance(chunk_index, int):
+            key = item["meta"].get("doc_id") or item["meta"].get("file_name")
+            positioned.setdefault(key, []).append(item)
+        else:
+            standalone.append([item])
+
+    runs: List[List[dict]] = list(standalone)
+    for group in positioned.values():
+        by_index: Dict[int, dict] = {}
+        for item in group:
+            by_index.setdefault(item["meta"]["chunk_index"], item)     # same chunk twice → keep best
+        run: List[dict] = []
+        for chunk_index in sorted(by_index):
+            if run and chunk_index != run[-1]["meta"]["chunk_index"] + 1:
+                runs.append(run)
+                run = []
+            run.append(by_index[chunk_index])
+        if run:
+            runs.append(run)
+
+    # 2. Build passages: stitch runs, drop repeated paragraphs across passages
+    merged_chunks = sum(len(run) - 1 for run in runs)
+    duplicate_chunks = len(items) - sum(len(run) for run in runs)
+    passages = []
+    for run in runs:
+        text = run[0]["text"]
+        for item in run[1:]:
+            overlap = _overlap(text, item["text"])
+            # no shared overlap (line / row / paragraph / slide chunks): keep them apart
+            if not overlap and not text.endswith("\n"):
+                text += "\n"
+            text += item["text"][overlap:]
+        best = min(run, key=lambda item: item["rank"])
+        meta = dict(best["meta"])
+        if len(run) > 1:
+            meta["chunk_indexes"] = [item["meta"]["chunk_index"] for item in run]
+        passages.append({"rank": best["rank"], "text": text, "score": best["score"], "metadata": meta})
+    passages.sort(key=lambda p: p["rank"])
+
+    seen_paragraphs = set()
+    seen_passages = set()
+    deduped = []
+    for passage in passages:
+        kept = []
+        for paragraph in passage["text"].split("\n"):
+            if len(paragraph.strip()) >= MIN_DEDUP_PARAGRAPH_CHARS:
+                key = _paragraph_key(paragraph)
+                if key in seen_paragraphs:
+                    continue
+                seen_paragraphs.add(key)
+            kept.append(paragraph)
+        text = "\n".join(kept).strip()
+        key = _paragraph_key(text)
+        if not text or key in seen_passages or any(text in other["text"] for other in deduped):
+            duplicate_chunks += 1
+            continue
+        seen_passages.add(key)
+        deduped.append({**passage, "text": text})
+
+    # 3. Fill the budget in relevance order
+    packed, used, dropped, truncated = [], 0, 0, 0
+    for passage in deduped:
+        tokens = estimator(passage["text"])
+        if token_budget <= 0 or used + tokens <= token_budget:
+            packed.append(passage)
+            used += tokens
+            continue
+        remaining = token_budget - used
+        if remaining >= MIN_TRUNCATED_TOKENS:
+            text = _truncate(passage["text"], remaining, estimator)
+            packed.append({**passage, "text": text, "metadata": {**passage["metadata"], "truncated": True}})
+            used += estimator(text)
+            truncated += 1
+        else:
+            dropped += 1
+
+    for passage in packed:
+        passage.pop("rank", None)
+
+    stats = {
+        "raw_tokens": raw_tokens,
+        "packed_tokens": used,
+        "raw_chunks": len(items),
+        "passages": len(packed),
+        "merged_chunks": merged_chunks,
+        "duplicate_chunks": duplicate_chunks,
+        "dropped_passages": dropped,
+        "truncated": truncated,
+        "token_budget": token_budget,
+    }
+    logger.debug(f"Packed context: {stats}")
+    return packed, stats
@@ -1,21 +1,35 @@
-from typing import List
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
 import streamlit as st
-from sentence_transformers import SentenceTransformer
 import google.generativeai as genai
 import logging
 
+from utils.embedding_engine import (  # noqa: F401 (re-export)
+    EMBEDDING_BACKEND,
+    EMBEDDING_BACKENDS,
+    EMBEDDING_MODEL_NAME,
+    configure_engine,
+    get_engine,
+    normalize_query,
+)
+
 logger = logging.getLogger(__name__)
 
 # ────────────────────────────────────────────────
 #  Embedding Model (Sentence Transformers)
+#
+#  Thin Streamlit layer over utils.embedding_engine — the engine owns the
+#  model, batching and caches; this module only adds spinners / messages.
+#  Code that must run without Streamlit should use the engine directly.
 # ────────────────────────────────────────────────
 
 @st.cache_resource(show_spinner="Loading embedding model...")
 def get_embedding_model():
     """Loads lightweight all-MiniLM-L6-v2 once and caches it"""
     try:
-        model = SentenceTransformer("all-MiniLM-L6-v2")
-        st.success("Embedding model loaded (all-MiniLM-L6-v2)")
+        engine = get_engine()
+        model = engine.load()
+        st.success(f"Embedding model loaded ({EMBEDDING_MODEL_NAME}, backend={engine.backend})")
         return model
     except Exception as e:
         st.error(f"Failed to load SentenceTransformer model: {e}")
@@ -23,6 +37,13 @@ def get_embedding_model():
         raise
 
 
+def select_embedding_backend(backend: str) -> None:
+    """Switch between "torch" and the int8 ONNX Runtime backend ("onnx")"""
+    if get_engine().backend != backend:
+        configure_engine(backend=backend)
+        get_embedding_model.clear()
+
+
 def get_embeddings(
     chunks: List[str],
     batch_size: int = 32,
@@ -41,17 +62,11 @@ def get_embeddings(
     if not chunks:
         return []
 
-    model = get_embedding_model()
+    get_embedding_model()
 
     try:
         with st.spinner(f"Generating embeddings for {len(chunks)} chunks..."):
-            embeddings = model.encode(
-                chunks,
-                batch_size=batch_size,
-                show_progress_bar=show_progress,
-                convert_to_numpy=True,
-                normalize_embeddings=True   # usually good for cosine similarity
-            )
+            embeddings = get_engine().encode(chunks, batch_size=batch_size, show_progress=show_progress)
             embeddings_list = embeddings.tolist()
 
         st.caption(f"✅ Created {len(embeddings_list)} embeddings (dim={len(embeddings_list[0])})")
@@ -63,6 +78,32 @@ def get_embeddings(
         return []
 
 
+def get_chunk_embeddings(
+    chunks: List[str],
+    batch_size: int = 32,
+    show_progress: bool = True,
+) -> Tuple[np.ndarray, Dict[str, int]]:
+    """Cached chunk embeddings — see EmbeddingEngine.embed_chunks"""
+    return get_engine().embed_chunks(chunks, batch_size=batch_size, show_progress=show_progress)
+
+
+def embed_query(query: str) -> np.ndarray:
+    """Cached query embedding — see EmbeddingEngine.embed_query"""
+    return get_engine().embed_query(query)
+
+
+def configure_query_cache(max_entries: Optional[int] = None, disk_path: Optional[str] = None) -> None:
+    get_engine().configure_query_cache(max_entries=max_entries, disk_path=disk_path)
+
+
+def get_query_cache_stats() -> Dict[str, Any]:
+    return get_engine().query_cache_stats()
+
+
+def clear_query_cache() -> None:
+    get_engine().query_cache.clear()
+
+
 # ────────────────────────────────────────────────
 #  Gemini LLM (only for generation / answering)
 # ────────────────────────────────────────────────
@@ -0,0 +1,443 @@
+import os
+import time
+import threading
+import logging
+import numpy as np
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.batcher import MicroBatcher
+from utils.cache import DiskVectorCache, LRUCache
+from utils.fingerprint import text_sha256
+
+logger = logging.getLogger(__name__)
+
+# ────────────────────────────────────────────────
+#  Headless embedding engine
+#
+#  Owns the SentenceTransformer lifecycle, device / thread settings,
+#  batching and the query / chunk embedding caches. No Streamlit imports:
+#  usable from worker processes, CLIs and tests. utils.embedding is the
+#  thin Streamlit wrapper around it.
+# ────────────────────────────────────────────────
+
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+
+EMBEDDING_DEVICE = os.environ.get("RAG_EMBEDDING_DEVICE")            # None → sentence-transformers default
+EMBEDDING_THREADS = int(os.environ.get("RAG_EMBEDDING_THREADS", 0))  # 0 → leave torch default
+EMBEDDING_BATCH_SIZE = int(os.environ.get("RAG_EMBEDDING_BATCH_SIZE", 32))
+
+# Length-bucketed batching: texts are sorted by token count and grouped so a
+# batch's padded size (count × longest member) stays within this many tokens.
+# 0 → plain fixed-size batches of EMBEDDING_BATCH_SIZE in input order.
+EMBEDDING_TOKEN_BUDGET = int(os.environ.get("RAG_EMBEDDING_TOKEN_BUDGET", 8192))
+EMBEDDING_MAX_BATCH_SIZE = int(os.environ.get("RAG_EMBEDDING_MAX_BATCH_SIZE", 512))   # cap for very short texts
+
+# "torch" → sentence-transformers; "onnx" → int8-quantized ONNX Runtime export
+# (CPU only, exported on first use into RAG_ONNX_MODEL_DIR if not present)
+EMBEDDING_BACKENDS = ("torch", "onnx")
+EMBEDDING_BACKEND = os.environ.get("RAG_EMBEDDING_BACKEND", "torch")
+ONNX_MODEL_DIR = os.environ.get("RAG_ONNX_MODEL_DIR")                # None → data/models/<model>-onnx-int8
+
+# Query-embedding cache: in-memory LRU, plus an optional SQLite tier that
+# survives restarts (enabled when RAG_QUERY_CACHE_PATH is set)
+QUERY_CACHE_MAX_ENTRIES = int(os.environ.get("RAG_QUERY_CACHE_MAX_ENTRIES", 4096))
+QUERY_CACHE_PATH = os.environ.get("RAG_QUERY_CACHE_PATH")
+
+# Query micro-batching: concurrent cache-miss queries (e.g. many chat sessions)
+# are coalesced into one encode call instead of many batch-of-1 forward passes
+QUERY_BATCHING = os.environ.get("RAG_QUERY_BATCHING", "1") != "0"
+QUERY_BATCH_MAX_SIZE = int(os.environ.get("RAG_QUERY_BATCH_MAX_SIZE", 32))
+QUERY_BATCH_MAX_WAIT_MS = float(os.environ.get("RAG_QUERY_BATCH_MAX_WAIT_MS", 2.0))
+
+# Chunk-embedding cache used by ingestion (keyed by chunk-content hash + model)
+CHUNK_CACHE_PATH = os.environ.get("RAG_CHUNK_CACHE_PATH", os.path.join("data", "embedding_cache.sqlite"))
+
+
+def normalize_query(query: str) -> str:
+    """Cache key for a query: collapsed whitespace, lowercased (the model is uncased)"""
+    return " ".join(query.split()).lower()
+
+
+class EmbeddingEngine:
+    """
+    Embedding model + batching + caches, independent of any UI.
+
+    The model is loaded lazily on first use (or explicitly with load()), once
+    per engine, and is safe to share between threads.
+
+    Vectors from different backends are close but not identical, so caches
+    and doc_ids are keyed by model_id (model name + backend), never mixed.
+    """
+
+    def __init__(
+        self,
+        model_name: str = EMBEDDING_MODEL_NAME,
+        backend: str = EMBEDDING_BACKEND,
+        onnx_model_dir: Optional[str] = ONNX_MODEL_DIR,
+        device: Optional[str] = EMBEDDING_DEVICE,
+        num_threads: int = EMBEDDING_THREADS,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        token_budget: int = EMBEDDING_TOKEN_BUDGET,
+        max_batch_size: int = EMBEDDING_MAX_BATCH_SIZE,
+        normalize: bool = True,
+        query_cache_max_entries: int = QUERY_CACHE_MAX_ENTRIES,
+        query_cache_path: Optional[str] = QUERY_CACHE_PATH,
+        chunk_cache_path: Optional[str] = CHUNK_CACHE_PATH,
+        query_batching: bool = QUERY_BATCHING,
+        query_batch_max_size: int = QUERY_BATCH_MAX_SIZE,
+        query_batch_max_wait_ms: float = QUERY_BATCH_MAX_WAIT_MS,
+    ):
+        if backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"Unknown embedding backend {backend!r} (expected one of {EMBEDDING_BACKENDS})")
+        self.model_name = model_name
+        self.backend = backend
+        self.onnx_model_dir = onnx_model_dir
+        self.device = device
+        self.num_threads = num_threads
+        self.batch_size = batch_size
+        self.token_budget = token_budget
+        self.max_batch_size = max_batch_size
+        self.normalize = normalize
+
+        self._stats_lock = threading.Lock()
+        self._encoded_texts = 0
+        self._encoded_tokens = 0
+        self._padded_tokens = 0
+        self._encode_seconds = 0.0
+
+        self._model = None
+        self._load_lock = threading.Lock()
+
+        self.query_cache = LRUCache(query_cache_max_entries)
+        self.query_disk_cache: Optional[DiskVectorCache] = (
+            DiskVectorCache(query_cache_path, table="query_embeddings") if query_cache_path else None
+        )
+        self._chunk_cache_path = chunk_cache_path
+        self._chunk_cache: Optional[DiskVectorCache] = None
+
+        self._query_batcher: Optional[MicroBatcher] = None
+        if query_batching:
+            self._query_batcher = MicroBatcher(
+                self._encode_query_batch,
+                max_batch_size=query_batch_max_size,
+                max_wait_ms=query_batch_max_wait_ms,
+                name="query-embed",
+            )
+
+    # ── Model lifecycle ─────────────────────────────────────
+
+    def load(self):
+        """Load the model now (idempotent). Returns the SentenceTransformer (or ONNX encoder)."""
+        if self._model is not None:
+            return self._model
+        with self._load_lock:
+            if self._model is None and self.backend == "onnx":
+                self._model = self._load_onnx()
+                logger.info(f"Embedding model loaded ({self.model_id}, device=cpu)")
+            elif self._model is None:
+                from sentence_transformers import SentenceTransformer   # heavy import, deferred
+
+                if self.num_threads > 0:
+                    import torch
+                    torch.set_num_threads(self.num_threads)
+
+                self._model = SentenceTransformer(self.model_name, device=self.device)
+                logger.info(f"Embedding model loaded ({self.model_name}, device={self._model.device})")
+        return self._model
+
+    def _load_onnx(self):
+        from utils.onnx_backend import INT8_FILE, OnnxSentenceEncoder, default_model_dir, export_onnx_model
+
+        model_dir = self.onnx_model_dir or default_model_dir(self.model_name)
+        if not os.path.isfile(os.path.join(model_dir, INT8_FILE)):
+            logger.info(f"No ONNX export found in {model_dir} – exporting {self.model_name}")
+            export_onnx_model(self.model_name, model_dir)
+        return OnnxSentenceEncoder(model_dir, num_threads=self.num_threads)
+
+    @property
+    def model(self):
+        return self.load()
+
+    @property
+    def model_id(self) -> str:
+        """Identity of the vectors this engine produces (cache / doc_id key)"""
+        return self.model_name if self.backend == "torch" else f"{self.model_name}+onnx-int8"
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    @property
+    def dim(self) -> int:
+        return int(self.model.get_sentence_embedding_dimension())
+
+    # ── Encoding ────────────────────────────────────────────
+
+    def token_lengths(self, texts: List[str]) -> List[int]:
+        """Token count per text (with special tokens, after truncation)"""
+        model = self.model
+        if hasattr(model, "token_lengths"):                       # ONNX encoder
+            return model.token_lengths(texts)
+        tokenizer = getattr(model, "tokenizer", None)
+        max_len = getattr(model, "max_seq_length", None) or 512
+        if tokenizer is None:                                     # rough estimate: ~4 chars per token
+            return [min(len(t) // 4 + 2, max_len) for t in texts]
+        encoded = tokenizer(texts, add_special_tokens=True, truncation=True, max_length=max_len)
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    def _plan_batches(self, lengths: List[int], batch_size: Optional[int]) -> List[np.ndarray]:
+        """Row indices per batch: longest first, each batch within the token budget"""
+        if self.token_budget <= 0:
+            size = batch_size or self.batch_size
+            return [np.arange(i, min(i + size, len(lengths))) for i in range(0, len(lengths), size)]
+
+        order = np.argsort(-np.asarray(lengths), kind="stable")
+        batches, start = [], 0
+        while start < len(order):
+            longest = max(lengths[order[start]], 1)      # sorted descending → first member is the longest
+            count = max(1, min(self.token_budget // longest, self.max_batch_size))
+            batches.append(order[start:start + count])
+            start += count
+        return batches
+
+    def encode_with_stats(
+        self,
+        texts: List[str],
+        batch_size: Optional[int] = None,
+        show_progress: bool = False,
+    ) -> Tuple[np.ndarray, Dict[str, Any]]:
+        """
+        Embed texts in length-bucketed batches (batch_size only applies when
+        token_budget is 0, i.e. fixed-size batching).
+
+        Returns:
+            (float32 array of shape (len(texts), dim) in input order,
+             {"tokens", "padded_tokens", "seconds", "batches"})
+        """
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32), {"tokens": 0, "padded_tokens": 0, "seconds": 0.0, "batches": 0}
+
+        started = time.perf_counter()
+        lengths = self.token_lengths(texts)
+        batches = self._plan_batches(lengths, batch_size)
+        if show_progress:
+            try:
+                from tqdm.auto import tqdm
+                batches = tqdm(batches, desc="Batches")
+            except ImportError:
+                pass
+
+        out: Optional[np.ndarray] = None
+        padded = 0
+        n_batches = 0
+        for rows in batches:
+            vectors = self.model.encode(
+                [texts[i] for i in rows],
+                batch_size=len(rows),
+                show_progress_bar=False,
+                convert_to_numpy=True,
+                normalize_embeddings=self.normalize,   # usually good for cosine similarity
+            )
+            if out is None:
+                out = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+            out[rows] = vectors
+            padded += len(rows) * max(lengths[i] for i in rows)
+            n_batches += 1
+
+        seconds = time.perf_counter() - started
+        tokens = int(sum(lengths))
+        with self._stats_lock:
+            self._encoded_texts += len(texts)
+            self._encoded_tokens += tokens
+            self._padded_tokens += padded
+            self._encode_seconds += seconds
+        return out, {"tokens": tokens, "padded_tokens": padded, "seconds": seconds, "batches": n_batches}
+
+    def encode(
+        self,
+        texts: List[str],
+        batch_size: Optional[int] = None,
+        show_progress: bool = False,
+    ) -> np.ndarray:
+        """Embed texts → float32 array of shape (len(texts), dim)"""
+        return self.encode_with_stats(texts, batch_size, show_progress)[0]
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """
+        Embedding for a single search query, served from the query cache when the
+        same (normalized) question was embedded before.
+
+        Returns:
+            float32 vector of shape (dim,). Treat it as read-only.
+        """
+        key = (self.model_id, normalize_query(query))
+
+        vector = self.query_cache.get(key)
+        if vector is not None:
+            return vector
+
+        if self.query_disk_cache is not None:
+            vector = self.query_disk_cache.get(self.model_id, key[1])
+
+        if vector is None:
+            if self._query_batcher is not None:
+                vector = self._query_batcher.run(query.strip())
+            else:
+                vector = self.encode([query.strip()])[0]
+            if self.query_disk_cache is not None:
+                self.query_disk_cache.put(self.model_id, key[1], vector)
+
+        vector.setflags(write=False)
+        self.query_cache.put(key, vector)
+        return vector
+
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """
+        Embeddings for many search queries at once: cache hits are reused, the
+        rest (duplicates collapsed) go through the model in one encode call.
+        Bypasses the micro-batcher – the caller already has its batch.
+
+        Returns:
+            float32 array of shape (len(queries), dim)
+        """
+        keys = [normalize_query(query) for query in queries]
+        found: Dict[str, np.ndarray] = {}
+        for key in dict.fromkeys(keys):
+            vector = self.query_cache.get((self.model_id, key))
+            if vector is not None:
+                found[key] = vector
+
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+        if missing and self.query_disk_cache is not None:
+            found.update(self.query_disk_cache.get_many(self.model_id, missing))
+            missing = [key for key in missing if key not in found]
+
+        if missing:
+            texts = {key: query.strip() for key, query in zip(keys, queries) if key in missing}
+            fresh = self.encode([texts[key] for key in missing])
+            if self.query_disk_cache is not None:
+                self.query_disk_cache.put_many(self.model_id, missing, fresh)
+            found.update(zip(missing, fresh))
+
+        for key, vector in found.items():
+            vector.setflags(write=False)
+            self.query_cache.put((self.model_id, key), vector)
+
+        if not keys:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.stack([found[key] for key in keys]).astype(np.float32, copy=False)
+
+    def _encode_query_batch(self, queries: List[str]) -> List[np.ndarray]:
+        """MicroBatcher callback: one encode for all queued queries (duplicates encoded once)"""
+        unique = list(dict.fromkeys(queries))
+        vectors = self.encode(unique)
+        by_text = {text: vectors[i] for i, text in enumerate(unique)}
+        return [by_text[q].copy() for q in queries]
+
+    def _get_chunk_cache(self) -> Optional[DiskVectorCache]:
+        if self._chunk_cache is None and self._chunk_cache_path:
+            self._chunk_cache = DiskVectorCache(self._chunk_cache_path, table="chunk_embeddings")
+        return self._chunk_cache
+
+    def embed_chunks(
+        self,
+        chunks: List[str],
+        batch_size: Optional[int] = None,
+        show_progress: bool = False,
+    ) -> Tuple[np.ndarray, Dict[str, int]]:
+        """
+        Embeddings for document chunks, re-using vectors of any chunk whose exact
+        text was embedded before by the same model + backend (e.g. an earlier version of
+        the same document). Only new or changed chunks go through the model.
+
+        Returns:
+            (float32 array of shape (len(chunks), dim),
+             {"reused": n, "embedded": m, "tokens": t, "seconds": s})
+            where "embedded" counts distinct texts that went through the model
+            and tokens / seconds cover those model calls only
+        """
+        if not chunks:
+            return np.zeros((0, 0), dtype=np.float32), {"reused": 0, "embedded": 0, "tokens": 0, "seconds": 0.0}
+
+        cache = self._get_chunk_cache()
+        if cache is None:
+            vectors, enc = self.encode_with_stats(chunks, batch_size, show_progress)
+            return vectors, {"reused": 0, "embedded": len(chunks), "tokens": enc["tokens"], "seconds": enc["seconds"]}
+
+        hashes = [text_sha256(chunk) for chunk in chunks]
+        cached = cache.get_many(self.model_id, hashes)
+        reused = sum(1 for h in hashes if h in cached)
+
+        # Embed each distinct missing text once
+        missing: Dict[str, str] = {}
+        for h, chunk in zip(hashes, chunks):
+            if h not in cached and h not in missing:
+                missing[h] = chunk
+
+        enc = {"tokens": 0, "seconds": 0.0}
+        if missing:
+            fresh, enc = self.encode_with_stats(list(missing.values()), batch_size, show_progress)
+            cache.put_many(self.model_id, list(missing.keys()), fresh)
+            cached.update(zip(missing.keys(), fresh))
+
+        vectors = np.stack([cached[h] for h in hashes]).astype(np.float32, copy=False)
+        return vectors, {"reused": reused, "embedded": len(missing), "tokens": enc["tokens"], "seconds": enc["seconds"]}
+
+    # ── Cache management ────────────────────────────────────
+
+    def configure_query_cache(self, max_entries: Optional[int] = None, disk_path: Optional[str] = None) -> None:
+        """Resize the in-memory tier and/or enable the on-disk tier at disk_path"""
+        if max_entries is not None:
+            self.query_cache.resize(max_entries)
+        if disk_path is not None:
+            self.query_disk_cache = DiskVectorCache(disk_path, table="query_embeddings")
+
+    def query_cache_stats(self) -> Dict[str, Any]:
+        return {
+            "memory": self.query_cache.stats(),
+            "disk": self.query_disk_cache.stats() if self.query_disk_cache is not None else None,
+        }
+
+    def encode_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "texts": self._encoded_texts,
+                "tokens": self._encoded_tokens,
+                "seconds": round(self._encode_seconds, 3),
+                "tokens_per_s": (self._encoded_tokens / self._encode_seconds) if self._encode_seconds else 0.0,
+                # share of the computed positions that were real tokens rather than padding
+                "padding_efficiency": (self._encoded_tokens / self._padded_tokens) if self._padded_tokens else 1.0,
+                "token_budget": self.token_budget,
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "model": self.model_name,
+            "backend": self.backend,
+            "loaded": self.loaded,
+            "device": str(self._model.device) if self._model is not None else self.device,
+            "encode": self.encode_stats(),
+            "query_cache": self.query_cache_stats(),
+            "query_batching": self._query_batcher.stats() if self._query_batcher is not None else None,
+        }
+
+
+_default_engine: Optional[EmbeddingEngine] = None
+_default_engine_guard = threading.Lock()
+
+
+def get_engine() -> EmbeddingEngine:
+    """Process-wide engine (one model load per process)"""
+    global _default_engine
+    with _default_engine_guard:
+        if _default_engine is None:
+            _default_engine = EmbeddingEngine()
+        return _default_engine
+
+
+def configure_engine(**kwargs) -> EmbeddingEngine:
+    """Replace the process-wide engine, e.g. configure_engine(backend="onnx")"""
+    global _default_engine
+    with _default_engine_guard:
+        _default_engine = EmbeddingEngine(**kwargs)
+        return _default_engine
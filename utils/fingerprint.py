@@ -0,0 +1,52 @@
+import json
+import hashlib
+from typing import Any, Dict, Optional
+
+# Bump when chunking/embedding semantics change so old doc_ids stop matching
+DOC_ID_SCHEME = "v1"
+
+
+def file_sha256(file_path: str, block_size: int = 1 << 20) -> str:
+    """Hex SHA-256 of a file's bytes, read in blocks"""
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def text_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def compute_doc_id(
+    file_path: str,
+    chunk_size: int,
+    chunk_overlap: int,
+    embedding_model: str,
+    extra: Optional[Dict[str, Any]] = None,
+) -> str:
+    """
+    Content-addressed document id.
+
+    The same file bytes ingested with the same chunking parameters and
+    embedding model always map to the same doc_id, so a re-upload can reuse
+    the existing index instead of re-parsing and re-embedding.
+
+    ``extra`` holds any other settings that change the stored index (index
+    type, document metadata, ...); leave out values at their defaults so
+    doc_ids of documents ingested with the defaults stay stable.
+    """
+    parts = [
+        DOC_ID_SCHEME,
+        file_sha256(file_path),
+        f"chunk_size={chunk_size}",
+        f"chunk_overlap={chunk_overlap}",
+        f"model={embedding_model}",
+    ]
+    for key in sorted(extra or {}):
+        value = extra[key]
+        if isinstance(value, (dict, list, tuple)):
+            value = json.dumps(value, sort_keys=True, default=str)     # key order must not matter
+        parts.append(f"{key}={value}")
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()[:32]
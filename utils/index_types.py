@@ -0,0 +1,195 @@
+import math
+import logging
+import numpy as np
+import faiss
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# ────────────────────────────────────────────────
+#  Index types
+#
+#  flat      exact brute-force scan (IndexFlatL2)
+#  ivf_flat  inverted file, full vectors in the lists   — knob: nprobe
+#  ivf_pq    inverted file, product-quantized codes     — knob: nprobe
+#  hnsw      graph index, full vectors                  — knob: ef_search
+#  auto      pick one of the above from the vector count
+#
+#  Vector codecs (how flat / ivf_flat / hnsw store their vectors):
+#
+#  float32   4 bytes per dimension, exact
+#  float16   2 bytes per dimension, near-lossless for normalized embeddings
+#  int8      1 byte per dimension, per-dimension scalar quantizer (trained)
+#
+#  ivf_pq always stores PQ codes; the codec does not apply to it.
+# ────────────────────────────────────────────────
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+VECTOR_CODECS = ("float32", "float16", "int8")
+
+_SQ_TYPES = {
+    "float16": faiss.ScalarQuantizer.QT_fp16,
+    "int8": faiss.ScalarQuantizer.QT_8bit,
+}
+
+# Automatic policy thresholds (vector counts)
+AUTO_FLAT_MAX = 20_000          # below this an exact scan is already sub-millisecond
+AUTO_HNSW_MAX = 1_000_000       # above this full-precision graphs get too large → ivf_pq
+
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+HNSW_EF_SEARCH = 64
+
+# Training points per IVF centroid (FAISS warns below 39)
+IVF_POINTS_PER_CENTROID = 64
+IVF_MAX_TRAINING_POINTS = 256 * 1024
+
+
+def choose_index_type(n_vectors: int) -> str:
+    """Automatic index policy based on corpus size"""
+    if n_vectors < AUTO_FLAT_MAX:
+        return "flat"
+    if n_vectors < AUTO_HNSW_MAX:
+        return "hnsw"
+    return "ivf_pq"
+
+
+def _default_nlist(n_vectors: int) -> int:
+    nlist = int(4 * math.sqrt(n_vectors))
+    # Keep enough training points per centroid
+    return max(1, min(nlist, n_vectors // 39))
+
+
+def _default_pq_m(dim: int) -> int:
+    """Largest number of sub-quantizers ≤ dim/8 that divides dim"""
+    for m in range(max(1, dim // 8), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def bytes_per_vector(dim: int, codec: str) -> int:
+    return dim * {"float32": 4, "float16": 2, "int8": 1}[codec]
+
+
+def _training_sample(vectors: np.ndarray, n_points: int, seed: int = 1234) -> np.ndarray:
+    if len(vectors) <= n_points:
+        return vectors
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(len(vectors), size=n_points, replace=False))
+    return np.ascontiguousarray(vectors[rows])
+
+
+def build_index(
+    vectors: np.ndarray,
+    index_type: str = "auto",
+    nlist: Optional[int] = None,
+    nprobe: Optional[int] = None,
+    pq_m: Optional[int] = None,
+    pq_nbits: int = 8,
+    hnsw_m: int = HNSW_M,
+    ef_construction: int = HNSW_EF_CONSTRUCTION,
+    ef_search: int = HNSW_EF_SEARCH,
+    codec: str = "float32",
+) -> Tuple[faiss.Index, Dict[str, Any]]:
+    """
+    Build (and train, where required) an index over already-normalized vectors.
+    ``codec`` selects float32 / float16 / int8 vector storage (see above).
+
+    Returns:
+        (index, info) — info describes the resolved type and parameters and is
+        meant to be stored in the index header
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, dim = vectors.shape
+    if index_type == "auto":
+        index_type = choose_index_type(n)
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index_type '{index_type}' (expected one of {INDEX_TYPES} or 'auto')")
+    if codec not in VECTOR_CODECS:
+        raise ValueError(f"Unknown codec '{codec}' (expected one of {VECTOR_CODECS})")
+    if index_type == "ivf_pq":
+        codec = "pq"
+
+    info: Dict[str, Any] = {"index_type": index_type, "codec": codec}
+
+    if index_type == "flat":
+        if codec == "float32":
+            index = faiss.IndexFlatL2(dim)
+        else:
+            index = faiss.IndexScalarQuantizer(dim, _SQ_TYPES[codec], faiss.METRIC_L2)
+
+    elif index_type == "hnsw":
+        if codec == "float32":
+            index = faiss.IndexHNSWFlat(dim, hnsw_m)
+        else:
+            index = faiss.IndexHNSWSQ(dim, _SQ_TYPES[codec], hnsw_m)
+        index.hnsw.efConstruction = ef_construction
+        index.hnsw.efSearch = ef_search
+        info.update({"hnsw_m": hnsw_m, "ef_construction": ef_construction, "ef_search": ef_search})
+
+    else:
+        nlist = nlist or _default_nlist(n)
+        quantizer = faiss.IndexFlatL2(dim)
+        if index_type == "ivf_flat" and codec == "float32":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        elif index_type == "ivf_flat":
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, _SQ_TYPES[codec], faiss.METRIC_L2)
+        else:
+            pq_m = pq_m or _default_pq_m(dim)
+            # 2**nbits codewords need enough training points
+            pq_nbits = max(1, min(pq_nbits, int(math.log2(max(2, n // 39)))))
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, pq_nbits)
+            info.update({"pq_m": pq_m, "pq_nbits": pq_nbits})
+
+        train_points = min(IVF_MAX_TRAINING_POINTS, max(nlist * IVF_POINTS_PER_CENTROID, 2 ** pq_nbits * 39))
+        index.train(_training_sample(vectors, train_points))
+        index.nprobe = nprobe or max(1, nlist // 16)
+        info.update({"nlist": nlist, "nprobe": index.nprobe})
+
+    if not index.is_trained:                    # scalar quantizer ranges (flat / hnsw)
+        index.train(_training_sample(vectors, IVF_MAX_TRAINING_POINTS))
+
+    index.add(vectors)
+    logger.debug(f"Built {index_type} index | n={n} | dim={dim} | {info}")
+    return index, info
+
+
+def search_params(
+    index: faiss.Index,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+    sel: Optional[faiss.IDSelector] = None,
+) -> Optional[faiss.SearchParameters]:
+    """
+    Per-query search parameters for ``index.search(..., params=...)``.
+    Knobs that do not apply to the index type are ignored.
+    """
+    # Passing sel through the constructor keeps the selector alive for
+    # as long as the params object (FAISS python wrapper bookkeeping)
+    kwargs: Dict[str, Any] = {} if sel is None else {"sel": sel}
+
+    if faiss.try_extract_index_ivf(index) is not None:
+        if nprobe is not None:
+            kwargs["nprobe"] = int(nprobe)
+        elif kwargs:
+            kwargs["nprobe"] = faiss.extract_index_ivf(index).nprobe
+        return faiss.SearchParametersIVF(**kwargs) if kwargs else None
+
+    if isinstance(index, faiss.IndexHNSW):
+        if ef_search is not None:
+            kwargs["efSearch"] = int(ef_search)
+        elif kwargs:
+            kwargs["efSearch"] = index.hnsw.efSearch
+        return faiss.SearchParametersHNSW(**kwargs) if kwargs else None
+
+    return faiss.SearchParameters(**kwargs) if kwargs else None
+
+
+def reconstruct_vectors(index: faiss.Index) -> np.ndarray:
+    """All stored vectors (approximate for PQ indexes), in insertion order"""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        index = faiss.clone_index(index)
+        faiss.extract_index_ivf(index).make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
@@ -0,0 +1,326 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+import logging
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional
+
+from utils.tracing import get_trace_file, merge_spans, tracing_enabled
+
+logger = logging.getLogger(__name__)
+
+# ────────────────────────────────────────────────
+#  Background ingestion jobs
+#
+#  submit() records a job in SQLite and hands it to a pool of worker
+#  processes. Each worker keeps one IngestionAgent (model loaded once per
+#  process) and writes per-stage progress back to the job row, so any
+#  session / rerun can poll status() without holding a reference to the
+#  work. Stores are committed by the workers themselves (the collection
+#  uses a cross-process lock); readers in the app pick them up from disk.
+#
+#  Job states: queued → running → succeeded | failed   (or cancelled while queued)
+#  Jobs left queued / running by a previous process are re-queued on start:
+#  ingestion is idempotent (content-addressed doc_id).
+#
+#  Workers trace like the app process (same switch and JSONL file) and send
+#  their finished spans back with each job, so the app's /metrics endpoint
+#  includes the ingestion stages (utils.tracing.merge_spans).
+# ────────────────────────────────────────────────
+
+JOBS_DB_PATH = os.environ.get("RAG_JOBS_DB", os.path.join("data", "jobs.sqlite"))
+INGEST_WORKERS = int(os.environ.get("RAG_INGEST_WORKERS", 2))
+PROGRESS_INTERVAL_S = 0.25          # min seconds between progress writes within one stage
+
+ACTIVE_STATES = ("queued", "running")
+FINAL_STATES = ("succeeded", "failed", "cancelled")
+
+_COLUMNS = (
+    "job_id", "kind", "file_path", "file_name", "payload", "status", "stage", "done", "total",
+    "result", "error", "created_at", "started_at", "finished_at", "worker_pid",
+)
+
+
+class JobStore:
+    """SQLite job table, shared by the app process and the worker processes"""
+
+    def __init__(self, path: str = JOBS_DB_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " job_id TEXT PRIMARY KEY, kind TEXT NOT NULL, file_path TEXT, file_name TEXT,"
+                " payload TEXT, status TEXT NOT NULL, stage TEXT, done INTEGER, total INTEGER,"
+                " result TEXT, error TEXT, created_at REAL NOT NULL, started_at REAL,"
+                " finished_at REAL, worker_pid INTEGER)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+            self._conn.commit()
+
+    def _update(self, job_id: str, **fields) -> None:
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?", [*fields.values(), job_id])
+            self._conn.commit()
+
+    @staticmethod
+    def _row(row) -> Dict[str, Any]:
+        job = dict(zip(_COLUMNS, row))
+        job["payload"] = json.loads(job["payload"]) if job["payload"] else {}
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def create(self, kind: str, file_path: str, payload: Dict[str, Any]) -> str:
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, kind, file_path, file_name, payload, status, created_at)"
+                " VALUES (?, ?, ?, ?, ?, 'queued', ?)",
+                (job_id, kind, file_path, os.path.basename(file_path), json.dumps(payload), time.time()),
+            )
+            self._conn.commit()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._row(row) if row else None
+
+    def list(self, statuses: Optional[tuple] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        query = f"SELECT {', '.join(_COLUMNS)} FROM jobs"
+        params: list = []
+        if statuses:
+            query += f" WHERE status IN ({','.join('?' * len(statuses))})"
+            params += list(statuses)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        with self._lock:
+            rows = self._conn.execute(query, [*params, limit]).fetchall()
+        return [self._row(row) for row in rows]
+
+    def find_active(self, file_path: str, payload: Dict[str, Any]) -> Optional[str]:
+        """A queued / running job for the same file + settings (a rerun must not start it twice)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT job_id FROM jobs WHERE file_path = ? AND payload = ? AND status IN ('queued', 'running')"
+                " ORDER BY created_at DESC LIMIT 1",
+                (file_path, json.dumps(payload)),
+            ).fetchone()
+        return row[0] if row else None
+
+    def mark_running(self, job_id: str) -> None:
+        self._update(job_id, status="running", started_at=time.time(), worker_pid=os.getpid())
+
+    def progress(self, job_id: str, stage: str, done: int, total: Optional[int]) -> None:
+        self._update(job_id, stage=stage, done=done, total=total)
+
+    def finish(self, job_id: str, status: str, result: Optional[Dict[str, Any]] = None,
+               error: Optional[str] = None) -> None:
+        self._update(job_id, status=status, result=json.dumps(result, default=str) if result is not None else None,
+                     error=error, finished_at=time.time())
+
+    def requeue_interrupted(self) -> List[Dict[str, Any]]:
+        """Jobs a previous app process left unfinished, reset to queued"""
+        jobs = self.list(ACTIVE_STATES, limit=10_000)
+        for job in jobs:
+            self._update(job["job_id"], status="queued", stage=None, done=None, total=None, worker_pid=None)
+        return jobs
+
+    def prune(self, keep: int = 500) -> None:
+        """Drop the oldest finished jobs beyond ``keep``"""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM jobs WHERE status IN ('succeeded', 'failed', 'cancelled') AND job_id NOT IN"
+                " (SELECT job_id FROM jobs ORDER BY created_at DESC LIMIT ?)", (keep,),
+            )
+            self._conn.commit()
+
+
+# ────────────────────────────────────────────────
+#  Worker process side
+# ────────────────────────────────────────────────
+
+_worker_agent = None
+_worker_stores: Dict[str, JobStore] = {}
+
+
+def _init_worker(workers: int = INGEST_WORKERS, tracing: Optional[bool] = None,
+                 trace_file: Optional[str] = None) -> None:
+    """
+    Load the embedding model once per worker process, before the first job.
+
+    The job workers share the machine: unless set explicitly (RAG_PDF_WORKERS,
+    RAG_EMBEDDING_THREADS), each gets cpu_count // workers PDF extraction
+    processes and torch / ONNX threads instead of the whole machine apiece.
+    """
+    global _worker_agent
+    from utils.tracing import configure_tracing
+    configure_tracing(enabled=tracing, trace_file=trace_file)     # as switched in the app process
+
+    share = max(1, (os.cpu_count() or 1) // max(1, workers))
+    if "RAG_PDF_WORKERS" not in os.environ:
+        import utils.parser
+        utils.parser.PDF_WORKERS = share
+    if "RAG_EMBEDDING_THREADS" not in os.environ:
+        from utils.embedding_engine import configure_engine
+        configure_engine(num_threads=share)
+
+    from agents.ingestion_agent import IngestionAgent
+    _worker_agent = IngestionAgent()
+    try:
+        _worker_agent.warmup()
+    except Exception:
+        logger.exception("Ingestion worker warmup failed")
+
+
+def _run_ingest_job(db_path: str, job_id: str, message: Dict[str, Any]) -> Dict[str, Any]:
+    """Runs one job in a worker; returns {"result": agent response, "spans": trace span records}"""
+    store = _worker_stores.get(db_path)
+    if store is None:
+        store = _worker_stores[db_path] = JobStore(db_path)
+    if _worker_agent is None:
+        _init_worker()
+
+    store.mark_running(job_id)
+    last = {"stage": None, "at": 0.0}
+
+    def on_progress(stage: str, done: int, total: Optional[int]) -> None:
+        now = time.monotonic()
+        if stage != last["stage"] or now - last["at"] >= PROGRESS_INTERVAL_S or (total and done >= total):
+            store.progress(job_id, stage, done, total)
+            last["stage"], last["at"] = stage, now
+
+    from utils.tracing import capture_spans
+    with capture_spans() as spans:
+        try:
+            result = _worker_agent.handle_message(message, progress_callback=on_progress)
+        except Exception as e:      # handle_message reports errors itself; this is a last resort
+            logger.exception(f"Ingestion job {job_id} crashed")
+            result = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+
+    if result.get("status") == "success":
+        store.finish(job_id, "succeeded", result=result)
+    else:
+        store.finish(job_id, "failed", result=result, error=result.get("error") or "ingestion failed")
+    return {"result": result, "spans": spans}
+
+
+# ────────────────────────────────────────────────
+#  Queue (app process side)
+# ────────────────────────────────────────────────
+
+class IngestionJobQueue:
+    """
+    Accepts ingestion jobs and runs them on a process pool.
+
+        job_id = jobs.submit("data/report.pdf", previous_doc_id=...)
+        jobs.status(job_id)   # {"status", "stage", "done", "total", "result", "error", ...}
+    """
+
+    def __init__(self, db_path: str = JOBS_DB_PATH, workers: int = INGEST_WORKERS):
+        self.db_path = db_path
+        self.workers = max(1, workers)
+        self.store = JobStore(db_path)
+        self._futures: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+        for job in self.store.requeue_interrupted():
+            logger.info(f"Re-queueing interrupted ingestion job {job['job_id'][:8]} ({job['file_name']})")
+            self._dispatch(job["job_id"], job["file_path"], job["payload"])
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: workers must not inherit the app's threads (bus loop, batchers, torch pools)
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.workers, tracing_enabled(), get_trace_file()),
+            )
+        return self._pool
+
+    def _dispatch(self, job_id: str, file_path: str, payload: Dict[str, Any]) -> None:
+        from utils.mcp import create_message
+        message = create_message(
+            sender="JobQueue",
+            receiver="IngestionAgent",
+            msg_type="INGEST_REQUEST",
+            payload={"file_path": file_path, **payload},
+            trace_id=job_id,
+        ).to_dict()
+        with self._lock:
+            try:
+                future = self._get_pool().submit(_run_ingest_job, self.db_path, job_id, message)
+            except BrokenProcessPool:
+                # a worker died (e.g. out of memory) – start a fresh pool
+                self._pool = None
+                future = self._get_pool().submit(_run_ingest_job, self.db_path, job_id, message)
+            self._futures[job_id] = future
+        future.add_done_callback(lambda f, job_id=job_id: self._on_done(job_id, f))
+
+    def _on_done(self, job_id: str, future: Future) -> None:
+        with self._lock:
+            self._futures.pop(job_id, None)
+        if future.cancelled():
+            self.store.finish(job_id, "cancelled")
+            return
+        exc = future.exception()
+        if exc is not None:
+            # the worker process died before it could record the outcome
+            logger.error(f"Ingestion job {job_id} failed in the pool: {exc!r}")
+            job = self.store.get(job_id)
+            if job is not None and job["status"] in ACTIVE_STATES:
+                self.store.finish(job_id, "failed", error=f"{type(exc).__name__}: {exc}")
+            return
+        merge_spans(future.result()["spans"])
+
+    def submit(self, file_path: str, **payload) -> str:
+        """Queue ingestion of file_path (payload: INGEST_REQUEST options); returns the job id"""
+        existing = self.store.find_active(file_path, payload)
+        if existing is not None and existing in self._futures:
+            return existing
+        job_id = self.store.create("ingest", file_path, payload)
+        self._dispatch(job_id, file_path, payload)
+        return job_id
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(job_id)
+
+    def list_jobs(self, active_only: bool = False, limit: int = 50) -> List[Dict[str, Any]]:
+        return self.store.list(ACTIVE_STATES if active_only else None, limit=limit)
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a job that has not started yet"""
+        with self._lock:
+            future = self._futures.get(job_id)
+        return bool(future and future.cancel())
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait, cancel_futures=True)
+
+
+_default_queue: Optional[IngestionJobQueue] = None
+_default_queue_guard = threading.Lock()
+
+
+def get_job_queue() -> IngestionJobQueue:
+    """Process-wide ingestion job queue"""
+    global _default_queue
+    with _default_queue_guard:
+        if _default_queue is None:
+            _default_queue = IngestionJobQueue()
+        return _default_queue
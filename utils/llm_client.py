@@ -0,0 +1,79 @@
+import os
+import json
+import threading
+import logging
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# ────────────────────────────────────────────────
+#  LLM client pool
+#
+#  genai.configure() runs once per process and GenerativeModel objects are
+#  built once per (backend, model, generation config, safety settings) and
+#  then reused by every request — they hold no per-request state.
+# ────────────────────────────────────────────────
+
+_configure_lock = threading.Lock()
+_configured_key: Optional[str] = None
+
+_models: Dict[str, Any] = {}
+_models_lock = threading.Lock()
+
+
+def _read_api_key() -> str:
+    api_key = os.environ.get("GOOGLE_API_KEY")
+    if not api_key:
+        import streamlit as st
+        api_key = st.secrets["GOOGLE_API_KEY"]
+    if not api_key:
+        raise ValueError("GOOGLE_API_KEY environment variable is not set")
+    return api_key
+
+
+def configure_genai(api_key: Optional[str] = None) -> None:
+    """Configure google.generativeai once per process (again only if the key changes)"""
+    global _configured_key
+    import google.generativeai as genai
+
+    api_key = api_key or _read_api_key()
+    with _configure_lock:
+        if _configured_key != api_key:
+            genai.configure(api_key=api_key)
+            _configured_key = api_key
+
+
+def get_generative_model(
+    model_name: str,
+    generation_config: Optional[Dict[str, Any]] = None,
+    safety_settings: Optional[List[Dict[str, str]]] = None,
+    backend: str = "gemini",
+):
+    """Shared model object for these settings (built on first request)"""
+    key = json.dumps([backend, model_name, generation_config, safety_settings], sort_keys=True)
+    model = _models.get(key)
+    if model is not None:
+        return model
+
+    with _models_lock:
+        model = _models.get(key)
+        if model is None:
+            if backend == "stub":
+                from utils.llm_stub import StubGenerativeModel
+                model = StubGenerativeModel(model_name, generation_config=generation_config)
+            else:
+                import google.generativeai as genai
+                configure_genai()
+                model = genai.GenerativeModel(
+                    model_name=model_name,
+                    generation_config=generation_config,
+                    safety_settings=safety_settings,
+                )
+            _models[key] = model
+            logger.info(f"LLM client created ({backend}:{model_name})")
+        return model
+
+
+def clear_model_pool() -> None:
+    with _models_lock:
+        _models.clear()
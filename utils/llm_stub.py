@@ -0,0 +1,101 @@
+import os
+import re
+import time
+from typing import Iterator, List, Optional
+
+# ────────────────────────────────────────────────
+#  Local stub LLM
+#
+#  Stands in for google.generativeai.GenerativeModel in tests, benchmarks and
+#  offline runs: same generate_content(prompt, stream=...) surface, no network.
+#  The "answer" is extractive — the first sentences of the prompt's context —
+#  so it is deterministic and still depends on what retrieval returned.
+# ────────────────────────────────────────────────
+
+STUB_FIRST_TOKEN_MS = float(os.environ.get("RAG_STUB_FIRST_TOKEN_MS", 150))
+STUB_TOKEN_MS = float(os.environ.get("RAG_STUB_TOKEN_MS", 15))
+STUB_ANSWER_SENTENCES = 3
+
+
+def _approx_tokens(text: str) -> int:
+    return max(1, len(text) // 4) if text else 0
+
+
+class StubUsage:
+    def __init__(self, prompt_token_count: int, candidates_token_count: int):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+
+class StubChunk:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class StubResponse:
+    """
+    Mirrors GenerateContentResponse: .text / .usage_metadata, and when streamed,
+    iterating yields chunks; usage_metadata is filled once the stream is drained.
+    """
+
+    def __init__(self, pieces: List[str], prompt_tokens: int, stream: bool,
+                 first_token_ms: float, token_ms: float):
+        self._pieces = pieces
+        self._prompt_tokens = prompt_tokens
+        self._first_token_ms = first_token_ms
+        self._token_ms = token_ms
+        self.usage_metadata: Optional[StubUsage] = None
+        if not stream:
+            self._sleep(first_token_ms + token_ms * len(pieces))
+            self._finish()
+
+    @staticmethod
+    def _sleep(ms: float) -> None:
+        if ms > 0:
+            time.sleep(ms / 1000.0)
+
+    def _finish(self) -> None:
+        self.usage_metadata = StubUsage(self._prompt_tokens, _approx_tokens(self.text))
+
+    @property
+    def text(self) -> str:
+        return "".join(self._pieces)
+
+    def __iter__(self) -> Iterator[StubChunk]:
+        self._sleep(self._first_token_ms)
+        for i, piece in enumerate(self._pieces):
+            if i:
+                self._sleep(self._token_ms)
+            yield StubChunk(piece)
+        self._finish()
+
+
+class StubGenerativeModel:
+    """Drop-in for genai.GenerativeModel (only what LLMResponseAgent uses)"""
+
+    def __init__(
+        self,
+        model_name: str = "stub",
+        generation_config=None,
+        safety_settings=None,
+        first_token_ms: float = STUB_FIRST_TOKEN_MS,
+        token_ms: float = STUB_TOKEN_MS,
+    ):
+        self.model_name = model_name
+        self.generation_config = generation_config or {}
+        self.first_token_ms = first_token_ms
+        self.token_ms = token_ms
+
+    def _answer(self, prompt: str) -> str:
+        context = prompt.split("Context:", 1)[-1].split("User question:", 1)[0]
+        # drop the "[1] file • chunk n" source lines, keep the text
+        lines = [line for line in context.strip().splitlines() if line and not line.startswith("[")]
+        sentences = re.split(r"(?<=[.!?])\s+", " ".join(lines))
+        answer = " ".join(sentences[:STUB_ANSWER_SENTENCES]).strip()
+        return answer or "I'm sorry, but I don't have enough information in the provided context to answer this question."
+
+    def generate_content(self, prompt: str, stream: bool = False, **kwargs) -> StubResponse:
+        # Word-sized pieces, roughly like the token deltas of a real stream
+        pieces = re.findall(r"\S+\s*", self._answer(prompt))
+        return StubResponse(pieces, _approx_tokens(prompt), stream, self.first_token_ms, self.token_ms)
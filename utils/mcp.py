@@ -1,11 +1,44 @@
+import json
 import uuid
+import time
+from collections.abc import Mapping
 from datetime import datetime, timezone
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Iterator, List, Optional
 
-class MCPMessage:
+try:
+    import msgpack
+except ImportError:             # optional: JSON is used on the wire instead
+    msgpack = None
+
+# ────────────────────────────────────────────────
+#  MCP messages
+#
+#  MCPMessage is a slotted, read-mostly mapping: it can be used wherever the
+#  old message dicts were (message["payload"], message.get("type"), ...).
+#  message_id / trace_id / timestamp are only generated when first read, so
+#  a message that just travels between in-process agents costs a small
+#  object and a clock read.
+#
+#  to_bytes() / from_bytes() are the wire format for process boundaries:
+#  msgpack when installed (JSON otherwise), tagged with a one-byte prefix.
+#  With by_reference=True, retrieved chunks that carry doc_id + chunk_index
+#  travel without their text; the receiver resolves them from the mmapped
+#  store (utils.vector_store.resolve_chunk_refs).
+# ────────────────────────────────────────────────
+
+FIELDS = (
+    "message_id", "trace_id", "correlation_id", "timestamp",
+    "sender", "receiver", "type", "version", "payload",
+)
+
+WIRE_MSGPACK = b"M"
+WIRE_JSON = b"J"
+
+
+class MCPMessage(Mapping):
     """
     Structured message format for agent communication.
-    
+
     Recommended fields:
     - trace_id:    root request identifier (stays the same across one user request)
     - message_id:  unique id for *this* message
@@ -13,6 +46,11 @@ class MCPMessage:
     - timestamp:   when the message was created (UTC)
     - version:     schema version (helps when formats evolve)
     """
+    __slots__ = (
+        "_message_id", "_trace_id", "_correlation_id", "_timestamp", "_created",
+        "sender", "receiver", "type", "version", "payload",
+    )
+
     def __init__(
         self,
         sender: str,
@@ -23,16 +61,78 @@ class MCPMessage:
         correlation_id: Optional[str] = None,
         version: str = "1.0",
     ):
-        self.message_id = str(uuid.uuid4())
-        self.trace_id = trace_id or str(uuid.uuid4())
-        self.correlation_id = correlation_id or self.trace_id
-        self.timestamp = datetime.now(timezone.utc).isoformat()
+        self._message_id = None
+        self._trace_id = trace_id
+        self._correlation_id = correlation_id
+        self._timestamp = None
+        self._created = time.time()
         self.sender = sender
         self.receiver = receiver
         self.type = msg_type
         self.version = version
         self.payload = payload
 
+    # ── Lazily generated fields ────────────────────────────
+
+    @property
+    def message_id(self) -> str:
+        if self._message_id is None:
+            self._message_id = str(uuid.uuid4())
+        return self._message_id
+
+    @message_id.setter
+    def message_id(self, value: str) -> None:
+        self._message_id = value
+
+    @property
+    def trace_id(self) -> str:
+        if self._trace_id is None:
+            self._trace_id = str(uuid.uuid4())
+        return self._trace_id
+
+    @trace_id.setter
+    def trace_id(self, value: str) -> None:
+        self._trace_id = value
+
+    @property
+    def correlation_id(self) -> str:
+        return self._correlation_id or self.trace_id
+
+    @correlation_id.setter
+    def correlation_id(self, value: str) -> None:
+        self._correlation_id = value
+
+    @property
+    def timestamp(self) -> str:
+        if self._timestamp is None:
+            self._timestamp = datetime.fromtimestamp(self._created, timezone.utc).isoformat()
+        return self._timestamp
+
+    @timestamp.setter
+    def timestamp(self, value: str) -> None:
+        self._timestamp = value
+
+    # ── Mapping interface (compatibility with message dicts) ─
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key not in FIELDS:
+            raise KeyError(f"MCPMessage has no field '{key}'")
+        setattr(self, key, value)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(FIELDS)
+
+    def __len__(self) -> int:
+        return len(FIELDS)
+
+    def __repr__(self) -> str:
+        return f"MCPMessage({self.sender} → {self.receiver}, type={self.type})"
+
     def to_dict(self) -> Dict[str, Any]:
         return {
             "message_id": self.message_id,
@@ -47,7 +147,7 @@ class MCPMessage:
         }
 
     @classmethod
-    def from_dict(cls, data: Dict[str, Any]) -> "MCPMessage":
+    def from_dict(cls, data: Mapping) -> "MCPMessage":
         msg = cls(
             sender=data["sender"],
             receiver=data["receiver"],
@@ -58,12 +158,79 @@ class MCPMessage:
             version=data.get("version", "1.0"),
         )
         # Preserve original message_id if present
-        if "message_id" in data:
+        if data.get("message_id"):
             msg.message_id = data["message_id"]
-        if "timestamp" in data:
+        if data.get("timestamp"):
             msg.timestamp = data["timestamp"]
         return msg
 
+    # ── Wire format ────────────────────────────────────────
+
+    def to_bytes(self, by_reference: bool = False) -> bytes:
+        """
+        Compact serialization (msgpack if installed, else JSON).
+        by_reference: send chunk references (doc_id + chunk_index) instead of chunk text.
+        """
+        data = self.to_dict()
+        if by_reference:
+            data["payload"] = chunk_refs_payload(self.payload)
+        if msgpack is not None:
+            return WIRE_MSGPACK + msgpack.packb(data, default=_wire_default, use_bin_type=True)
+        return WIRE_JSON + json.dumps(data, default=_wire_default, separators=(",", ":")).encode("utf-8")
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> "MCPMessage":
+        tag, body = blob[:1], blob[1:]
+        if tag == WIRE_MSGPACK:
+            if msgpack is None:
+                raise RuntimeError("msgpack-encoded message but msgpack is not installed")
+            data = msgpack.unpackb(body, raw=False, strict_map_key=False)
+        elif tag == WIRE_JSON:
+            data = json.loads(body.decode("utf-8"))
+        else:
+            raise ValueError(f"Unknown MCP wire format tag {tag!r}")
+        return cls.from_dict(data)
+
+
+def _wire_default(value: Any) -> Any:
+    # numpy scalars / arrays (scores, ids) and tuples from search results
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__} in an MCP message")
+
+
+def chunk_refs_payload(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Copy of payload whose "chunks" / "source_chunks" reference stored chunks
+    ({"ref": [doc_id, chunk_index], "score", "metadata"}) instead of carrying
+    their text. Chunks without doc_id + chunk_index metadata keep their text.
+    """
+    if not isinstance(payload, dict):
+        return payload
+    out = dict(payload)
+    for key in ("chunks", "source_chunks"):
+        chunks = payload.get(key)
+        if isinstance(chunks, list):
+            out[key] = [_chunk_ref(chunk) for chunk in chunks]
+    return out
+
+
+def _chunk_ref(chunk: Any) -> Any:
+    if not isinstance(chunk, dict):
+        return chunk
+    meta = chunk.get("metadata") or {}
+    if meta.get("doc_id") is None or not isinstance(meta.get("chunk_index"), int):
+        return chunk
+    ref = {k: v for k, v in chunk.items() if k != "text"}
+    ref["ref"] = [meta["doc_id"], meta["chunk_index"]]
+    return ref
+
+
+def has_chunk_refs(chunks: List[Any]) -> bool:
+    return any(isinstance(chunk, dict) and "ref" in chunk and "text" not in chunk for chunk in chunks)
+
 
 # Convenience factory functions (drop-in replacement for your original helpers)
 
@@ -79,11 +246,12 @@ def create_message(
     trace_id: Optional[str] = None,
     correlation_id: Optional[str] = None,
     version: str = "1.0",
-) -> Dict[str, Any]:
+) -> MCPMessage:
     """
-    Compatibility wrapper — returns dict like your original code
+    Compatibility wrapper — the message reads like your original dicts
+    (message["payload"], message.get("trace_id"), ...); use .to_dict() for a real dict
     """
-    msg = MCPMessage(
+    return MCPMessage(
         sender=sender,
         receiver=receiver,
         msg_type=msg_type,
@@ -92,5 +260,3 @@ def create_message(
         correlation_id=correlation_id,
         version=version,
     )
-    return msg.to_dict()
-
@@ -0,0 +1,256 @@
+import os
+import json
+import operator
+import logging
+import numpy as np
+import faiss
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# ────────────────────────────────────────────────
+#  Columnar per-chunk metadata
+#
+#  {store_dir}/metadata/
+#      schema.json          row count + per-field kind (and dictionary for "cat")
+#      {field}.npy          int64 / float64 values, or int32 dictionary codes (-1 = missing)
+#      {field}.order.npy    row ids sorted by value / code  ← the per-field inverted index
+#      {field}.bounds.npy   "cat" only: offsets into order for each code (CSR postings)
+#
+#  Filters are evaluated against these indexes into a row bitmap that is handed
+#  to FAISS as an ID selector, so only matching vectors are ever scored.
+#
+#  Filter syntax (fields are ANDed):
+#      {"file_name": "a.pdf"}                        equality
+#      {"file_name": ["a.pdf", "b.pdf"]}             any of
+#      {"chunk_index": {"$gte": 10, "$lt": 20}}      $eq $ne $in $nin $gt $gte $lt $lte
+#
+#  Fields that are not per-chunk are looked up in the document-level metadata
+#  (header.json), where they match all rows or none.
+# ────────────────────────────────────────────────
+
+METADATA_DIR = "metadata"
+SCHEMA_FILE = "schema.json"
+
+_OPERATORS = ("$eq", "$ne", "$in", "$nin", "$gt", "$gte", "$lt", "$lte")
+_COMPARISONS = {"$gt": operator.gt, "$gte": operator.ge, "$lt": operator.lt, "$lte": operator.le}
+
+
+def _cat_key(value: Any) -> Any:
+    """Dictionary value for a categorical cell (JSON scalars as-is, everything else as JSON text)"""
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, bool)
+
+
+class MetadataWriter:
+    """Accumulates per-chunk metadata rows column by column; write() persists them"""
+
+    def __init__(self):
+        self.count = 0
+        self._columns: Dict[str, List[Any]] = {}
+
+    def add(self, rows: Iterable[Dict[str, Any]]) -> None:
+        for row in rows:
+            for field, value in row.items():
+                column = self._columns.get(field)
+                if column is None:
+                    column = self._columns[field] = [None] * self.count
+                column.append(value)
+            self.count += 1
+            for column in self._columns.values():
+                if len(column) < self.count:
+                    column.append(None)
+
+    def write(self, store_dir: str) -> None:
+        if not self._columns:
+            return
+        meta_dir = os.path.join(store_dir, METADATA_DIR)
+        os.makedirs(meta_dir, exist_ok=True)
+
+        fields: Dict[str, Any] = {}
+        for field, column in self._columns.items():
+            present = [v for v in column if v is not None]
+            if present and all(_is_number(v) for v in present):
+                if len(present) == len(column) and all(isinstance(v, (int, np.integer)) for v in present):
+                    values = np.asarray(column, dtype=np.int64)
+                    fields[field] = {"kind": "int"}
+                else:
+                    values = np.asarray([np.nan if v is None else v for v in column], dtype=np.float64)
+                    fields[field] = {"kind": "float"}
+                order = np.argsort(values, kind="stable")          # NaN sorts last
+            else:
+                dictionary: Dict[Any, int] = {}
+                values = np.empty(len(column), dtype=np.int32)
+                for i, v in enumerate(column):
+                    values[i] = -1 if v is None else dictionary.setdefault(_cat_key(v), len(dictionary))
+                order = np.argsort(values, kind="stable")
+                bounds = np.searchsorted(values[order], np.arange(-1, len(dictionary) + 1)).astype(np.int64)
+                np.save(os.path.join(meta_dir, f"{field}.bounds.npy"), bounds)
+                fields[field] = {"kind": "cat", "values": list(dictionary)}
+
+            np.save(os.path.join(meta_dir, f"{field}.npy"), values)
+            np.save(os.path.join(meta_dir, f"{field}.order.npy"), order.astype(np.int64))
+
+        with open(os.path.join(meta_dir, SCHEMA_FILE), "w", encoding="utf-8") as f:
+            json.dump({"count": self.count, "fields": fields}, f)
+
+
+class MetadataStore:
+    """
+    Read side: row lookup and filter evaluation for one stored document.
+    Column files are memory-mapped and opened on first use.
+    """
+
+    def __init__(self, store_dir: str, count: int, doc_metadata: Optional[Dict[str, Any]] = None):
+        self.count = count
+        self.doc_metadata = doc_metadata or {}
+        self._dir = os.path.join(store_dir, METADATA_DIR)
+        self._fields: Dict[str, Any] = {}
+        self._arrays: Dict[str, np.ndarray] = {}
+        schema_path = os.path.join(self._dir, SCHEMA_FILE)
+        if os.path.isfile(schema_path):
+            with open(schema_path, "r", encoding="utf-8") as f:
+                self._fields = json.load(f)["fields"]
+        self._codes = {
+            field: {value: code for code, value in enumerate(spec["values"])}
+            for field, spec in self._fields.items() if spec["kind"] == "cat"
+        }
+
+    @property
+    def fields(self) -> List[str]:
+        return list(self._fields)
+
+    def _array(self, name: str) -> np.ndarray:
+        array = self._arrays.get(name)
+        if array is None:
+            array = self._arrays[name] = np.load(os.path.join(self._dir, f"{name}.npy"), mmap_mode="r")
+        return array
+
+    def _sorted_values(self, field: str) -> np.ndarray:
+        key = f"{field}.sorted"
+        if key not in self._arrays:
+            self._arrays[key] = np.asarray(self._array(field))[self._array(f"{field}.order")]
+        return self._arrays[key]
+
+    # ── Rows ────────────────────────────────────────────────
+
+    def row(self, i: int) -> Dict[str, Any]:
+        """Document-level metadata merged with the per-chunk fields of row i"""
+        out = dict(self.doc_metadata)
+        for field, spec in self._fields.items():
+            value = self._array(field)[i]
+            if spec["kind"] == "cat":
+                out[field] = spec["values"][value] if value >= 0 else None
+            elif spec["kind"] == "int":
+                out[field] = int(value)
+            else:
+                out[field] = None if np.isnan(value) else float(value)
+        return out
+
+    # ── Filtering ───────────────────────────────────────────
+
+    def _rows_for(self, field: str, op: str, operand: Any) -> np.ndarray:
+        """Row ids matching one positive condition (no $ne / $nin here)"""
+        spec = self._fields[field]
+        order = self._array(f"{field}.order")
+
+        if spec["kind"] == "cat":
+            if op not in ("$eq", "$in"):
+                raise ValueError(f"Operator {op} is not supported on categorical field '{field}'")
+            bounds = self._array(f"{field}.bounds")
+            wanted = operand if op == "$in" else [operand]
+            parts = []
+            for value in wanted:
+                code = self._codes[field].get(_cat_key(value))
+                if code is not None:
+                    parts.append(order[bounds[code + 1]:bounds[code + 2]])    # bounds[0] is "missing"
+            return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+        sorted_values = self._sorted_values(field)
+        if spec["kind"] == "float":             # missing values (NaN) sort last and never match
+            n_valid = len(sorted_values) - int(np.isnan(sorted_values).sum())
+            sorted_values, order = sorted_values[:n_valid], order[:n_valid]
+        if op in ("$eq", "$in"):
+            wanted = operand if op == "$in" else [operand]
+            parts = [
+                order[np.searchsorted(sorted_values, v, "left"):np.searchsorted(sorted_values, v, "right")]
+                for v in wanted
+            ]
+            return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+        if op == "$gt":
+            return order[np.searchsorted(sorted_values, operand, "right"):]
+        if op == "$gte":
+            return order[np.searchsorted(sorted_values, operand, "left"):]
+        if op == "$lt":
+            return order[:np.searchsorted(sorted_values, operand, "left")]
+        return order[:np.searchsorted(sorted_values, operand, "right")]   # $lte
+
+    def _doc_level_match(self, field: str, op: str, operand: Any) -> bool:
+        value = self.doc_metadata.get(field)
+        if op == "$eq":
+            return value == operand
+        if op == "$ne":
+            return value != operand
+        if op == "$in":
+            return value in operand
+        if op == "$nin":
+            return value not in operand
+        if value is None:
+            return False
+        try:
+            return bool(_COMPARISONS[op](value, operand))
+        except TypeError:
+            raise ValueError(
+                f"Operator {op} cannot compare document field '{field}' "
+                f"({type(value).__name__}) with {operand!r} ({type(operand).__name__})"
+            ) from None
+
+    def match(self, metadata_filter: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """
+        Evaluate a filter → boolean row mask, or None when there is no filter.
+        Unknown fields match nothing.
+        """
+        if not metadata_filter:
+            return None
+
+        mask = np.ones(self.count, dtype=bool)
+        for field, condition in metadata_filter.items():
+            for op, operand in _normalize_condition(condition):
+                if field not in self._fields:
+                    if not self._doc_level_match(field, op, operand):
+                        return np.zeros(self.count, dtype=bool)
+                    continue
+                if op in ("$ne", "$nin"):
+                    rows = self._rows_for(field, "$in", list(operand) if op == "$nin" else [operand])
+                    mask[rows] = False
+                else:
+                    hit = np.zeros(self.count, dtype=bool)
+                    hit[self._rows_for(field, op, operand)] = True
+                    mask &= hit
+            if not mask.any():
+                break
+        return mask
+
+
+def _normalize_condition(condition: Any) -> List[tuple]:
+    if isinstance(condition, dict):
+        unknown = set(condition) - set(_OPERATORS)
+        if unknown:
+            raise ValueError(f"Unknown filter operator(s) {sorted(unknown)} (expected {_OPERATORS})")
+        return list(condition.items())
+    if isinstance(condition, (list, tuple, set)):
+        return [("$in", list(condition))]
+    return [("$eq", condition)]
+
+
+def bitmap_selector(mask: np.ndarray) -> faiss.IDSelector:
+    """ID selector over row ids 0..n-1 from a boolean mask (one bit per row)"""
+    bitmap = np.packbits(mask, bitorder="little")
+    sel = faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bitmap))
+    sel.referenced_objects = [bitmap]          # keep the buffer alive with the selector
+    return sel
@@ -0,0 +1,156 @@
+import os
+import logging
+import numpy as np
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# ────────────────────────────────────────────────
+#  ONNX Runtime backend (int8-quantized) for the embedding model
+#
+#  Runs an exported, dynamically-quantized copy of the sentence-transformers
+#  model with onnxruntime + tokenizers only — no torch at inference time.
+#  Mirrors the subset of SentenceTransformer's API that EmbeddingEngine uses.
+#
+#  {model_dir}/
+#      model.onnx          fp32 export (kept for re-quantization / debugging)
+#      model.int8.onnx     dynamically quantized weights (what we run)
+#      tokenizer.json      fast tokenizer
+# ────────────────────────────────────────────────
+
+ONNX_MODEL_ROOT = os.path.join("data", "models")
+FP32_FILE = "model.onnx"
+INT8_FILE = "model.int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+
+# all-MiniLM-L6-v2's sentence-transformers config truncates at 256 word pieces
+MAX_SEQ_LENGTH = 256
+
+
+def default_model_dir(model_name: str) -> str:
+    return os.path.join(ONNX_MODEL_ROOT, f"{model_name.replace('/', '__')}-onnx-int8")
+
+
+def export_onnx_model(model_name: str, model_dir: Optional[str] = None, opset: int = 14) -> str:
+    """
+    One-time export: HF transformer → ONNX → int8 (dynamic quantization).
+    Needs torch + transformers + onnxruntime; inference afterwards needs only
+    onnxruntime + tokenizers. Returns model_dir.
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    model_dir = model_dir or default_model_dir(model_name)
+    os.makedirs(model_dir, exist_ok=True)
+    hf_name = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+
+    tokenizer = AutoTokenizer.from_pretrained(hf_name)
+    model = AutoModel.from_pretrained(hf_name).eval()
+    tokenizer.backend_tokenizer.save(os.path.join(model_dir, TOKENIZER_FILE))
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    fp32_path = os.path.join(model_dir, FP32_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+        )
+
+    quantize_dynamic(fp32_path, os.path.join(model_dir, INT8_FILE), weight_type=QuantType.QInt8)
+    logger.info(f"Exported int8 ONNX model for {model_name} → {model_dir}")
+    return model_dir
+
+
+class OnnxSentenceEncoder:
+    """
+    Drop-in for the parts of SentenceTransformer used by EmbeddingEngine:
+    encode(), get_sentence_embedding_dimension(), device.
+    Mean pooling over the attention mask, like all-MiniLM-L6-v2's pooling layer.
+    """
+
+    device = "cpu"
+
+    def __init__(
+        self,
+        model_dir: str,
+        num_threads: int = 0,
+        max_seq_length: int = MAX_SEQ_LENGTH,
+        quantized: bool = True,
+    ):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+
+        model_file = INT8_FILE if quantized else FP32_FILE
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, model_file), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=max_seq_length)
+        self.tokenizer.enable_padding()
+        self.max_seq_length = max_seq_length
+        self._dim: Optional[int] = None
+
+    def token_lengths(self, texts: List[str]) -> List[int]:
+        """Real token count per text – encode_batch pads to the batch's longest, so count the mask"""
+        return [sum(enc.attention_mask) for enc in self.tokenizer.encode_batch(texts)]
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+        hidden = self.session.run(["last_hidden_state"], feeds)[0]
+        mask = attention_mask[:, :, None].astype(np.float32)
+        return (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(
+        self,
+        sentences: List[str],
+        batch_size: int = 32,
+        show_progress_bar: bool = False,
+        convert_to_numpy: bool = True,
+        normalize_embeddings: bool = False,
+    ) -> np.ndarray:
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        if not sentences:
+            return np.zeros((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        # Length-sorted batches waste less padding; results restored to input order
+        order = np.argsort([-len(s) for s in sentences], kind="stable")
+        parts = []
+        for start in range(0, len(order), batch_size):
+            rows = order[start:start + batch_size]
+            parts.append((rows, self._encode_batch([sentences[i] for i in rows])))
+        out = np.empty((len(sentences), parts[0][1].shape[1]), dtype=np.float32)
+        for rows, vectors in parts:
+            out[rows] = vectors
+
+        if normalize_embeddings:
+            out /= np.clip(np.linalg.norm(out, axis=1, keepdims=True), 1e-12, None)
+        return out
+
+    def get_sentence_embedding_dimension(self) -> int:
+        if self._dim is None:
+            self._dim = int(self._encode_batch(["dimension probe"]).shape[1])
+        return self._dim
@@ -1,37 +1,163 @@
 import os
+import math
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
 import fitz             # PyMuPDF
 import pandas as pd
 from docx import Document
 from pptx import Presentation
 import markdown         # only if you really want to convert md → html later
 
-def parse_pdf(file_path: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> list[str]:
-    """Extract text from PDF using PyMuPDF (fitz) - much faster & more reliable than PyPDF2"""
+from utils.tracing import timed_iter
+
+# Parallel PDF extraction: below this many pages the process pool costs more than it saves
+PARALLEL_MIN_PAGES = 48
+PDF_WORKERS = int(os.environ.get("RAG_PDF_WORKERS", os.cpu_count() or 1))
+
+
+def _pool_context() -> multiprocessing.context.BaseContext:
+    """
+    Never fork the calling process – it is the threaded app or an ingestion
+    job worker with torch loaded (utils.jobs uses spawn for the same reason).
+    Where available, workers fork from a clean forkserver that has this
+    module imported already, so a pool starts without re-importing pandas /
+    python-docx / python-pptx per worker; otherwise they are spawned.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+def _extract_page_range(task: Tuple[str, int, int]) -> List[str]:
+    """Worker: open the PDF independently and return non-empty page texts in [start, end)"""
+    file_path, start, end = task
+    doc = fitz.open(file_path)
     try:
-        doc = fitz.open(file_path)
-        full_text = ""
-        for page in doc:
+        texts = []
+        for page_no in range(start, end):
+            text = doc.load_page(page_no).get_text("text").strip()
+            if text:
+                texts.append(text)
+        return texts
+    finally:
+        doc.close()
+
+
+def _iter_pdf_pages_parallel(
+    file_path: str,
+    total: int,
+    workers: int,
+    on_progress: Optional[Callable[[int, int], None]],
+) -> Iterator[str]:
+    # Several ranges per worker keeps the pool busy when page costs are uneven
+    range_size = max(8, math.ceil(total / (workers * 4)))
+    tasks = [(file_path, start, min(start + range_size, total)) for start in range(0, total, range_size)]
+
+    # Sliding window of in-flight ranges: results come back in page order
+    # and at most ~2 ranges per worker are buffered at any time
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context()) as pool:
+        pending = deque()
+        next_task = 0
+        done_pages = 0
+        while next_task < len(tasks) or pending:
+            while next_task < len(tasks) and len(pending) < workers * 2:
+                pending.append((tasks[next_task], pool.submit(_extract_page_range, tasks[next_task])))
+                next_task += 1
+            (_, start, end), future = pending.popleft()
+            yield from future.result()
+            done_pages += end - start
+            if on_progress is not None:
+                on_progress(done_pages, total)
+
+
+def iter_pdf_pages(
+    file_path: str,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    workers: Optional[int] = None,
+) -> Iterator[str]:
+    """
+    Yield the non-empty text of each PDF page in page order.
+
+    With workers > 1 and at least PARALLEL_MIN_PAGES pages, page ranges are
+    extracted in a process pool (each worker opens its own fitz document);
+    otherwise pages are read sequentially, one page in memory at a time.
+    """
+    workers = PDF_WORKERS if workers is None else workers
+    doc = fitz.open(file_path)
+    total = doc.page_count
+
+    if workers > 1 and total >= PARALLEL_MIN_PAGES:
+        doc.close()
+        yield from _iter_pdf_pages_parallel(file_path, total, min(workers, total), on_progress)
+        return
+
+    try:
+        for page_no, page in enumerate(doc, 1):
             text = page.get_text("text").strip()
             if text:
-                full_text += text + "\n\n"
+                yield text
+            if on_progress is not None:
+                on_progress(page_no, total)
+    finally:
         doc.close()
 
-        if not full_text.strip():
-            return []
 
-        # Simple overlapping chunking
-        chunks = []
-        start = 0
-        while start < len(full_text):
-            end = start + chunk_size
-            chunks.append(full_text[start:end])
-            start = end - chunk_overlap
-        return chunks
+def iter_chunks(pieces: Iterable[str], chunk_size: int = 1000, chunk_overlap: int = 200) -> Iterator[str]:
+    """
+    Streaming fixed-size chunker with overlap.
+
+    Produces exactly the chunks of slicing "".join(pieces) every
+    (chunk_size - chunk_overlap) characters, while holding at most about one
+    chunk plus one piece in memory.
+    """
+    step = chunk_size - chunk_overlap
+    if step <= 0:
+        raise ValueError(f"chunk_overlap ({chunk_overlap}) must be smaller than chunk_size ({chunk_size})")
+
+    buffer = ""
+    for piece in pieces:
+        buffer += piece
+        while len(buffer) >= chunk_size:
+            yield buffer[:chunk_size]
+            buffer = buffer[step:]
+
+    start = 0
+    while start < len(buffer):
+        yield buffer[start:start + chunk_size]
+        start += step
 
+
+def iter_pdf_chunks(
+    file_path: str,
+    chunk_size: int = 1000,
+    chunk_overlap: int = 200,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    workers: Optional[int] = None,
+) -> Iterator[str]:
+    try:
+        pages = timed_iter(iter_pdf_pages(file_path, on_progress=on_progress, workers=workers), "parse", file_type=".pdf")
+        yield from timed_iter(
+            iter_chunks((text + "\n\n" for text in pages), chunk_size, chunk_overlap),
+            "chunk", exclude=pages,                   # chunking time only, not page extraction
+        )
     except Exception as e:
         raise ValueError(f"Failed to parse PDF {file_path}: {str(e)}")
 
 
+def parse_pdf(
+    file_path: str,
+    chunk_size: int = 1000,
+    chunk_overlap: int = 200,
+    workers: Optional[int] = None,
+) -> list[str]:
+    """Extract text from PDF using PyMuPDF (fitz) - much faster & more reliable than PyPDF2"""
+    return list(iter_pdf_chunks(file_path, chunk_size, chunk_overlap, workers=workers))
+
+
 def parse_docx(file_path: str) -> list[str]:
     """Extract paragraphs from .docx"""
     try:
@@ -43,12 +169,9 @@ def parse_docx(file_path: str) -> list[str]:
         raise ValueError(f"Failed to parse DOCX {file_path}: {str(e)}")
 
 
-def parse_txt_or_md(file_path: str, is_markdown: bool = False) -> list[str]:
-    """Handle .txt and .md files uniformly"""
+def iter_txt_or_md(file_path: str, is_markdown: bool = False) -> Iterator[str]:
+    """Handle .txt and .md files uniformly, reading line by line"""
     try:
-        with open(file_path, "r", encoding="utf-8", errors="replace") as f:
-            content = f.read()
-
         if is_markdown:
             # Optional: convert markdown to plain text if you want
             # html = markdown.markdown(content)
@@ -56,24 +179,40 @@ def parse_txt_or_md(file_path: str, is_markdown: bool = False) -> list[str]:
             pass
 
         # Split into non-empty lines or paragraphs
-        lines = [line.strip() for line in content.splitlines() if line.strip()]
-        return lines
+        with open(file_path, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield line
 
     except Exception as e:
         raise ValueError(f"Failed to parse text/markdown file {file_path}: {str(e)}")
 
 
-def parse_csv(file_path: str) -> list[str]:
-    """Convert CSV rows to readable strings"""
+def parse_txt_or_md(file_path: str, is_markdown: bool = False) -> list[str]:
+    return list(iter_txt_or_md(file_path, is_markdown))
+
+
+CSV_READ_ROWS = 10_000      # rows per pandas block when streaming a CSV
+
+
+def iter_csv(file_path: str) -> Iterator[str]:
+    """Convert CSV rows to readable strings, one block of rows at a time"""
     try:
-        df = pd.read_csv(file_path, dtype=str, keep_default_na=False)
-        # Join columns with | separator
-        rows = [" | ".join(row.astype(str).tolist()) for _, row in df.iterrows()]
-        return [row for row in rows if row.strip()]
+        for df in pd.read_csv(file_path, dtype=str, keep_default_na=False, chunksize=CSV_READ_ROWS):
+            # Join columns with | separator
+            for values in df.itertuples(index=False, name=None):
+                row = " | ".join(values)
+                if row.strip():
+                    yield row
     except Exception as e:
         raise ValueError(f"Failed to parse CSV {file_path}: {str(e)}")
 
 
+def parse_csv(file_path: str) -> list[str]:
+    return list(iter_csv(file_path))
+
+
 def parse_pptx(file_path: str) -> list[str]:
     """Extract text from PowerPoint slides"""
     try:
@@ -94,25 +233,53 @@ def parse_pptx(file_path: str) -> list[str]:
         raise ValueError(f"Failed to parse PPTX {file_path}: {str(e)}")
 
 
-def parse_document(file_path: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> list[str]:
+def _deferred(factory: Callable[[], Iterable[str]]) -> Iterator[str]:
+    # docx / pptx parse the whole file up front: start that on the first next()
+    yield from factory()
+
+
+def iter_document_chunks(
+    file_path: str,
+    chunk_size: int = 1000,
+    chunk_overlap: int = 200,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    pdf_workers: Optional[int] = None,
+) -> Iterator[str]:
     """
-    Main entry point - returns list of text chunks/paragraphs depending on file type
+    Streaming entry point - yields text chunks/paragraphs depending on file type.
+    on_progress(done, total) is called as PDF pages are extracted;
+    pdf_workers sets the PDF extraction process count (1 = sequential).
     """
     ext = os.path.splitext(file_path)[1].lower()
 
     parsers = {
-        ".pdf":  lambda: parse_pdf(file_path, chunk_size, chunk_overlap),
-        ".docx": lambda: parse_docx(file_path),
-        ".txt":  lambda: parse_txt_or_md(file_path, is_markdown=False),
-        ".md":   lambda: parse_txt_or_md(file_path, is_markdown=True),
-        ".csv":  lambda: parse_csv(file_path),
-        ".pptx": lambda: parse_pptx(file_path),
+        ".pdf":  lambda: iter_pdf_chunks(file_path, chunk_size, chunk_overlap, on_progress, pdf_workers),
+        ".docx": lambda: iter(parse_docx(file_path)),
+        ".txt":  lambda: iter_txt_or_md(file_path, is_markdown=False),
+        ".md":   lambda: iter_txt_or_md(file_path, is_markdown=True),
+        ".csv":  lambda: iter_csv(file_path),
+        ".pptx": lambda: iter(parse_pptx(file_path)),
     }
 
     if ext not in parsers:
         raise ValueError(f"Unsupported file extension: {ext}")
 
-    return parsers[ext]()
+    if ext == ".pdf":
+        return parsers[ext]()                   # times its parse / chunk stages itself
+    # the other formats yield paragraphs / rows / slides directly: parsing is the only stage
+    return timed_iter(_deferred(parsers[ext]), "parse", file_type=ext)
+
+
+def parse_document(
+    file_path: str,
+    chunk_size: int = 1000,
+    chunk_overlap: int = 200,
+    pdf_workers: Optional[int] = None,
+) -> list[str]:
+    """
+    Main entry point - returns list of text chunks/paragraphs depending on file type
+    """
+    return list(iter_document_chunks(file_path, chunk_size, chunk_overlap, pdf_workers=pdf_workers))
 
 
 # Optional: small test helper (can be removed later)
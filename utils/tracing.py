@@ -0,0 +1,446 @@
+import os
+import json
+import time
+import threading
+import contextvars
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# ────────────────────────────────────────────────
+#  Tracing
+#
+#  Spans time the pipeline stages (parse, chunk, embed, index_write,
+#  index_load, query_embed, search, prompt_build, llm_generate, ...) and are
+#  linked by the MCP trace_id of the request they belong to:
+#
+#      with trace_context(message.get("trace_id")):
+#          with span("search", doc_id=doc_id):
+#              ...
+#
+#  Finished spans go to a JSONL file (one span per line) and into per-stage
+#  latency histograms, served in Prometheus text format by
+#  start_metrics_server() (p50/p95/p99 as quantile gauges).
+#
+#  Spans finished in another process (ingestion job workers) are collected
+#  there with capture_spans() and folded into this process's histograms with
+#  merge_spans(), so one /metrics endpoint covers every stage.
+#
+#  Disabled (the default), span() / trace_context() return a shared no-op
+#  context manager and timed_iter() returns its iterable unchanged — one
+#  flag check per call.
+# ────────────────────────────────────────────────
+
+TRACING_ENABLED = os.environ.get("RAG_TRACING", "0") == "1"
+TRACE_FILE = os.environ.get("RAG_TRACE_FILE", "data/traces.jsonl")     # "" → no JSONL export
+METRICS_PORT = int(os.environ.get("RAG_METRICS_PORT", 0))             # 0 → no endpoint
+
+# Histogram bucket upper bounds (ms) — covers query embeds to long ingestions
+LATENCY_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 300000)
+QUANTILES = (0.5, 0.95, 0.99)
+QUANTILE_WINDOW = 2048          # recent samples per stage used for the quantiles
+
+_enabled = TRACING_ENABLED
+_trace_file: Optional[str] = TRACE_FILE
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("rag_trace_id", default=None)
+_current_span: contextvars.ContextVar = contextvars.ContextVar("rag_span_id", default=None)
+_capture: contextvars.ContextVar = contextvars.ContextVar("rag_span_capture", default=None)
+
+
+def _new_id() -> str:
+    return os.urandom(8).hex()
+
+
+class _NoopSpan:
+    """Returned while tracing is disabled"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+# ────────────────────────────────────────────────
+#  Span sink: JSONL + histograms
+# ────────────────────────────────────────────────
+
+class _StageStats:
+    __slots__ = ("buckets", "count", "sum_ms", "errors", "recent")
+
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS_MS)
+        self.count = 0
+        self.sum_ms = 0.0
+        self.errors = 0
+        self.recent: Deque[float] = deque(maxlen=QUANTILE_WINDOW)
+
+
+_stats: Dict[str, _StageStats] = {}
+_stats_lock = threading.Lock()
+_file_lock = threading.Lock()
+_file = None
+_file_path: Optional[str] = None
+
+
+def _write_jsonl(record: Dict[str, Any]) -> None:
+    global _file, _file_path
+    path = _trace_file
+    if not path:
+        return
+    line = json.dumps(record, default=str) + "\n"
+    with _file_lock:
+        if _file is None or _file_path != path:
+            if _file is not None:
+                _file.close()
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            _file, _file_path = open(path, "a", encoding="utf-8"), path
+        _file.write(line)
+        _file.flush()
+
+
+def _observe(record: Dict[str, Any]) -> None:
+    duration = record["duration_ms"]
+    with _stats_lock:
+        stats = _stats.get(record["name"])
+        if stats is None:
+            stats = _stats[record["name"]] = _StageStats()
+        stats.count += 1
+        stats.sum_ms += duration
+        stats.recent.append(duration)
+        if record["status"] != "ok":
+            stats.errors += 1
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if duration <= bound:
+                stats.buckets[i] += 1
+                break
+
+
+def _finish(record: Dict[str, Any]) -> None:
+    _observe(record)
+    captured = _capture.get()
+    if captured is not None:
+        captured.append(record)
+    try:
+        _write_jsonl(record)
+    except OSError:
+        logger.exception("Could not write trace span")
+
+
+# ────────────────────────────────────────────────
+#  Spans
+# ────────────────────────────────────────────────
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attrs", "_start", "_wall", "_tokens")
+
+    def __init__(self, name: str, attrs: Dict[str, Any]):
+        self.name = name
+        self.trace_id = _current_trace.get() or _new_id()
+        self.parent_id = _current_span.get()
+        self.span_id = _new_id()
+        self.attrs = attrs
+        self._tokens = None
+
+    def set(self, **attrs) -> None:
+        """Attach attributes known only while the span runs (counts, sizes, ...)"""
+        self.attrs.update(attrs)
+
+    def __enter__(self) -> "Span":
+        self._tokens = (_current_trace.set(self.trace_id), _current_span.set(self.span_id))
+        self._wall = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        duration_ms = (time.perf_counter() - self._start) * 1000
+        _current_span.reset(self._tokens[1])
+        _current_trace.reset(self._tokens[0])
+        record = {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self._wall,
+            "duration_ms": round(duration_ms, 3),
+            "status": "ok" if exc_type is None else "error",
+            "attrs": self.attrs,
+        }
+        if exc_type is not None:
+            record["error"] = f"{exc_type.__name__}: {exc}"
+        _finish(record)
+        return False
+
+
+def span(name: str, **attrs):
+    """Context manager timing one stage; nested spans become children"""
+    if not _enabled:
+        return _NOOP
+    return Span(name, attrs)
+
+
+class _TraceContext:
+    __slots__ = ("trace_id", "_token")
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+
+    def __enter__(self):
+        self._token = _current_trace.set(self.trace_id)
+        return self
+
+    def __exit__(self, *exc):
+        _current_trace.reset(self._token)
+        return False
+
+
+def trace_context(trace_id: Optional[str]):
+    """Spans opened inside belong to trace_id (typically the MCP message's)"""
+    if not _enabled or not trace_id:
+        return _NOOP
+    return _TraceContext(trace_id)
+
+
+class _SpanCapture:
+    __slots__ = ("spans", "_token")
+
+    def __enter__(self) -> List[Dict[str, Any]]:
+        self.spans: List[Dict[str, Any]] = []
+        self._token = _capture.set(self.spans)
+        return self.spans
+
+    def __exit__(self, *exc):
+        _capture.reset(self._token)
+        return False
+
+
+def capture_spans() -> _SpanCapture:
+    """Also collect the span records finished inside (e.g. to hand them to another process)"""
+    return _SpanCapture()
+
+
+def merge_spans(records: Iterable[Dict[str, Any]]) -> None:
+    """
+    Add span records finished in another process to this process's stage
+    histograms. Not written to JSONL again – the other process did that.
+    """
+    for record_ in records:
+        _observe(record_)
+
+
+def current_trace_id() -> Optional[str]:
+    return _current_trace.get()
+
+
+def record(name: str, duration_ms: float, status: str = "ok", **attrs) -> None:
+    """
+    Emit a span whose duration was measured by the caller — for stages that
+    run in many short slices (e.g. embedding batch after batch), reported once.
+    """
+    if not _enabled:
+        return
+    _finish({
+        "trace_id": _current_trace.get() or _new_id(),
+        "span_id": _new_id(),
+        "parent_id": _current_span.get(),
+        "name": name,
+        "start": time.time() - duration_ms / 1000,
+        "duration_ms": round(duration_ms, 3),
+        "status": status,
+        "attrs": attrs,
+    })
+
+
+class _TimedIterator:
+    """
+    Accumulates the time spent producing items; reports one span when exhausted.
+    Time spent inside ``exclude`` (an upstream timed iterator) is subtracted,
+    so stacked stages (parse → chunk) each report their own share.
+    """
+
+    def __init__(self, iterable: Iterable, name: str, attrs: Dict[str, Any], exclude: Any = None):
+        self._it = iter(iterable)
+        self.name = name
+        self.attrs = attrs
+        self.exclude = exclude if isinstance(exclude, _TimedIterator) else None
+        self.seconds = 0.0
+        self.items = 0
+        self._trace_id = _current_trace.get() or _new_id()
+        self._parent_id = _current_span.get()
+        self._done = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        upstream = self.exclude.seconds if self.exclude is not None else 0.0
+        started = time.perf_counter()
+        try:
+            item = next(self._it)
+        except StopIteration:
+            self._account(started, upstream)
+            self._report("ok")
+            raise
+        except Exception as e:
+            self._account(started, upstream)
+            self._report("error", f"{type(e).__name__}: {e}")
+            raise
+        self._account(started, upstream)
+        self.items += 1
+        return item
+
+    def _account(self, started: float, upstream: float) -> None:
+        inner = (self.exclude.seconds - upstream) if self.exclude is not None else 0.0
+        self.seconds += time.perf_counter() - started - inner
+
+    def _report(self, status: str, error: Optional[str] = None) -> None:
+        if self._done:
+            return
+        self._done = True
+        record_ = {
+            "trace_id": self._trace_id,
+            "span_id": _new_id(),
+            "parent_id": self._parent_id,
+            "name": self.name,
+            "start": time.time() - self.seconds,
+            "duration_ms": round(self.seconds * 1000, 3),
+            "status": status,
+            "attrs": {**self.attrs, "items": self.items},
+        }
+        if error:
+            record_["error"] = error
+        _finish(record_)
+
+
+def timed_iter(iterable: Iterable, name: str, exclude: Any = None, **attrs) -> Iterable:
+    """Wrap a streaming stage (see _TimedIterator); the iterable itself when disabled"""
+    if not _enabled:
+        return iterable
+    return _TimedIterator(iterable, name, attrs, exclude)
+
+
+# ────────────────────────────────────────────────
+#  Configuration + metrics export
+# ────────────────────────────────────────────────
+
+def configure_tracing(enabled: Optional[bool] = None, trace_file: Optional[str] = None) -> None:
+    """Switch tracing on/off or redirect the JSONL export ("" disables it) at runtime"""
+    global _enabled, _trace_file
+    if enabled is not None:
+        _enabled = enabled
+    if trace_file is not None:
+        _trace_file = trace_file
+
+
+def tracing_enabled() -> bool:
+    return _enabled
+
+
+def get_trace_file() -> Optional[str]:
+    return _trace_file
+
+
+def reset_metrics() -> None:
+    with _stats_lock:
+        _stats.clear()
+
+
+def _quantile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def stage_summary() -> Dict[str, Dict[str, Any]]:
+    """Per stage: count, errors, mean and p50/p95/p99 (ms) over recent spans"""
+    with _stats_lock:
+        snapshot = {name: (s.count, s.errors, s.sum_ms, list(s.recent)) for name, s in _stats.items()}
+    summary = {}
+    for name, (count, errors, sum_ms, recent) in sorted(snapshot.items()):
+        summary[name] = {
+            "count": count,
+            "errors": errors,
+            "mean_ms": round(sum_ms / count, 3) if count else None,
+            **{f"p{int(q * 100)}_ms": round(_quantile(recent, q), 3) if recent else None for q in QUANTILES},
+        }
+    return summary
+
+
+def render_prometheus() -> str:
+    """Stage latency histograms + quantiles in Prometheus text exposition format"""
+    with _stats_lock:
+        snapshot = {
+            name: (list(s.buckets), s.count, s.sum_ms, s.errors, list(s.recent))
+            for name, s in _stats.items()
+        }
+
+    lines = [
+        "# HELP rag_stage_duration_ms Pipeline stage latency in milliseconds",
+        "# TYPE rag_stage_duration_ms histogram",
+    ]
+    for name, (buckets, count, sum_ms, _, _) in sorted(snapshot.items()):
+        cumulative = 0
+        for bound, n in zip(LATENCY_BUCKETS_MS, buckets):
+            cumulative += n
+            lines.append(f'rag_stage_duration_ms_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+        lines.append(f'rag_stage_duration_ms_bucket{{stage="{name}",le="+Inf"}} {count}')
+        lines.append(f'rag_stage_duration_ms_sum{{stage="{name}"}} {sum_ms:.3f}')
+        lines.append(f'rag_stage_duration_ms_count{{stage="{name}"}} {count}')
+
+    lines += [
+        "# HELP rag_stage_duration_quantile_ms Recent pipeline stage latency quantiles in milliseconds",
+        "# TYPE rag_stage_duration_quantile_ms gauge",
+    ]
+    for name, (_, _, _, _, recent) in sorted(snapshot.items()):
+        for q in QUANTILES:
+            if recent:
+                lines.append(f'rag_stage_duration_quantile_ms{{stage="{name}",quantile="{q}"}} {_quantile(recent, q):.3f}')
+
+    lines += [
+        "# HELP rag_stage_errors_total Spans that ended with an exception",
+        "# TYPE rag_stage_errors_total counter",
+    ]
+    for name, (_, _, _, errors, _) in sorted(snapshot.items()):
+        lines.append(f'rag_stage_errors_total{{stage="{name}"}} {errors}')
+    return "\n".join(lines) + "\n"
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = "0.0.0.0"):
+    """Serve render_prometheus() at http://host:port/metrics (once per process)"""
+    global _server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+            logger.info(f"Metrics endpoint on http://{host}:{_server.server_address[1]}/metrics")
+        return _server
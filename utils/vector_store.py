@@ -1,37 +1,709 @@
 import os
+import json
+import hashlib
+import time
+import shutil
 import pickle
+import threading
 import numpy as np
 import faiss
 import logging
-from typing import List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.cache import LRUCache
+from utils.collection import get_collection
+from utils.embedding_engine import get_engine
+from utils.metadata_store import MetadataStore, MetadataWriter, bitmap_selector
+from utils.index_types import (
+    VECTOR_CODECS,
+    build_index,
+    bytes_per_vector,
+    choose_index_type,
+    reconstruct_vectors,
+    search_params,
+)
+from utils.tracing import span
 
 logger = logging.getLogger(__name__)
 
 VECTOR_STORE_DIR = "data/vector_store"
 os.makedirs(VECTOR_STORE_DIR, exist_ok=True)
 
+# Memory budget for indexes kept resident between queries (bytes)
+INDEX_CACHE_MAX_BYTES = int(os.environ.get("RAG_INDEX_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+# Vector storage for new stores: "float32", "float16" or "int8" (see utils.index_types).
+# With RAG_RESCORE=1 the float32 vectors are also kept on disk (vectors.f32) and the
+# top RESCORE_FACTOR × k candidates of the compressed search are re-ranked exactly.
+VECTOR_CODEC = os.environ.get("RAG_VECTOR_CODEC", "float32")
+RESCORE = os.environ.get("RAG_RESCORE", "0") == "1"
+RESCORE_FACTOR = int(os.environ.get("RAG_RESCORE_FACTOR", 4))
+
+# A new version of a document (StoreWriter replaces=...) updates the previous
+# version's index in place when at least this share of its chunks are the
+# previous version's leading chunks, unchanged; otherwise the index is rebuilt
+INCREMENTAL_MIN_SHARED = float(os.environ.get("RAG_INCREMENTAL_MIN_SHARED", 0.5))
+
+# ────────────────────────────────────────────────
+#  On-disk layout (format v2)
+#
+#  {VECTOR_STORE_DIR}/{doc_id}/
+#      header.json    format version, dim, count, normalization, index type,
+#                     vector storage (written last)
+#      index.faiss    native FAISS index, opened memory-mapped
+#      chunks.bin     UTF-8 chunk texts, concatenated
+#      offsets.npy    uint64[count + 1] byte offsets into chunks.bin
+#      vectors.f32    optional float32[count, dim], kept for exact rescoring
+#      metadata/      columnar per-chunk metadata + per-field indexes (utils.metadata_store)
+#
+#  Legacy stores ({doc_id}.faiss.pkl) are migrated on first load.
+# ────────────────────────────────────────────────
+
+STORE_FORMAT_VERSION = 2
+
+HEADER_FILE = "header.json"
+INDEX_FILE = "index.faiss"
+CHUNKS_FILE = "chunks.bin"
+OFFSETS_FILE = "offsets.npy"
+FULL_VECTORS_FILE = "vectors.f32"
+LEGACY_SUFFIX = ".faiss.pkl"
+
+
+def _store_dir(doc_id: str) -> str:
+    return os.path.join(VECTOR_STORE_DIR, doc_id)
+
+
+def _legacy_path(doc_id: str) -> str:
+    return os.path.join(VECTOR_STORE_DIR, f"{doc_id}{LEGACY_SUFFIX}")
+
+
+def _mmap_read_flags() -> List[int]:
+    """Read flags to try, most zero-copy first (older faiss builds lack IO_FLAG_MMAP_IFC)"""
+    flags = []
+    if hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+        flags.append(faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+    flags.append(faiss.IO_FLAG_MMAP)
+    return flags
+
+
+class ChunkReader:
+    """
+    Random access to the chunk texts of one stored document.
+
+    Both the offsets table and the text blob are memory-mapped, so only the
+    chunks actually requested are read and decoded.
+    """
+
+    def __init__(self, store_dir: str):
+        self._offsets = np.load(os.path.join(store_dir, OFFSETS_FILE), mmap_mode="r")
+        chunks_path = os.path.join(store_dir, CHUNKS_FILE)
+        if os.path.getsize(chunks_path) > 0:
+            self._blob = np.memmap(chunks_path, dtype=np.uint8, mode="r")
+        else:
+            self._blob = np.zeros(0, dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        if i < 0 or i >= len(self):
+            raise IndexError(f"chunk index {i} out of range")
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        return self._blob[start:end].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class DocumentStore:
+    """A loaded (memory-mapped) per-document store"""
+
+    def __init__(self, doc_id: str, header: Dict[str, Any], index: faiss.Index,
+                 chunks: ChunkReader, mmapped: bool, version: Tuple[int, int]):
+        self.doc_id = doc_id
+        self.header = header
+        self.index = index
+        self.chunks = chunks
+        self.mmapped = mmapped
+        self.version = version
+        self._full_vectors: Optional[np.ndarray] = None
+        self._metadata: Optional[MetadataStore] = None
+
+    @property
+    def normalized(self) -> bool:
+        return bool(self.header.get("normalized", False))
+
+    @property
+    def codec(self) -> str:
+        return self.header.get("storage", {}).get("codec", "float32")
+
+    @property
+    def can_rescore(self) -> bool:
+        return bool(self.header.get("storage", {}).get("rescore", False))
+
+    @property
+    def full_vectors(self) -> Optional[np.ndarray]:
+        """Memory-mapped float32 vectors (only when the store was written with rescore)"""
+        if self._full_vectors is None and self.can_rescore:
+            self._full_vectors = np.memmap(
+                os.path.join(_store_dir(self.doc_id), FULL_VECTORS_FILE), dtype=np.float32,
+                mode="r", shape=(int(self.header["count"]), int(self.header["dim"])),
+            )
+        return self._full_vectors
+
+    @property
+    def metadata(self) -> MetadataStore:
+        """Per-chunk metadata (document-level fields come from the header)"""
+        if self._metadata is None:
+            self._metadata = MetadataStore(_store_dir(self.doc_id), len(self.chunks), self.header.get("metadata"))
+        return self._metadata
+
+    def nbytes(self) -> int:
+        """Heap memory attributable to this store (mapped pages are not counted)"""
+        offsets = len(self.chunks) * 8
+        if self.mmapped:
+            return offsets + 4096
+        codec = self.codec if self.codec in VECTOR_CODECS else "float32"
+        return offsets + self.index.ntotal * bytes_per_vector(self.index.d, codec)
+
+
+def _new_tmp_dir(doc_id: str) -> str:
+    tmp_dir = f"{_store_dir(doc_id)}.tmp-{os.getpid()}-{threading.get_ident()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    return tmp_dir
+
+
+def _swap_into_place(tmp_dir: str, doc_id: str) -> str:
+    """Atomically replace the store of doc_id with the finished tmp_dir"""
+    final_dir = _store_dir(doc_id)
+    old_dir = None
+    if os.path.isdir(final_dir):
+        old_dir = f"{final_dir}.old-{os.getpid()}-{threading.get_ident()}"
+        os.replace(final_dir, old_dir)
+    os.replace(tmp_dir, final_dir)
+    if old_dir:
+        shutil.rmtree(old_dir, ignore_errors=True)
+    return final_dir
+
+
+def _write_header(store_dir: str, header: Dict[str, Any]) -> None:
+    with open(os.path.join(store_dir, HEADER_FILE), "w", encoding="utf-8") as f:
+        json.dump(header, f)
+
+
+def _write_store(doc_id: str, index: faiss.Index, chunks: List[str], header: Dict[str, Any]) -> str:
+    """
+    Write a v2 store from an in-memory index + chunks (used by migration).
+    Written into a temp directory and swapped into place so that readers
+    never observe a half-written store.
+    """
+    tmp_dir = _new_tmp_dir(doc_id)
+    try:
+        offsets = np.zeros(len(chunks) + 1, dtype=np.uint64)
+        with open(os.path.join(tmp_dir, CHUNKS_FILE), "wb") as f:
+            pos = 0
+            for i, chunk in enumerate(chunks):
+                data = chunk.encode("utf-8")
+                f.write(data)
+                pos += len(data)
+                offsets[i + 1] = pos
+        np.save(os.path.join(tmp_dir, OFFSETS_FILE), offsets)
+
+        faiss.write_index(index, os.path.join(tmp_dir, INDEX_FILE))
+        _write_header(tmp_dir, header)
+        return _swap_into_place(tmp_dir, doc_id)
+
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+class StoreWriter:
+    """
+    Incremental writer for one document store.
+
+    Chunks and vectors are appended batch by batch and spooled straight to
+    files in a temp directory, so the caller never holds more than one batch.
+    commit() builds the index from the memory-mapped vector spool, swaps the
+    store into place and registers the document in the collection.
+
+    With ``replaces`` (an earlier version of the same document), the leading
+    chunks both versions share are tracked while adding; commit() then
+    updates the earlier version's index in place – rows past the shared
+    prefix dropped, the new tail added, nothing re-encoded or retrained –
+    instead of building a new one (see _update_previous_index).
+
+        with StoreWriter(doc_id) as writer:
+            for chunks, vectors, metadatas in batches:
+                writer.add(chunks, vectors, metadatas)
+            writer.commit()
+    """
+
+    VECTOR_SPOOL = FULL_VECTORS_FILE        # kept as-is when rescoring is enabled
+    OFFSET_SPOOL = "offsets.u64"
+
+    def __init__(
+        self,
+        doc_id: str,
+        normalize: bool = True,
+        index_type: str = "auto",
+        replaces: Optional[str] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        codec: Optional[str] = None,
+        rescore: Optional[bool] = None,
+    ):
+        self.doc_id = doc_id
+        self.normalize = normalize
+        self.index_type = index_type
+        self.codec = codec or VECTOR_CODEC
+        if self.codec not in VECTOR_CODECS:
+            raise ValueError(f"Unknown vector codec '{self.codec}' (expected one of {VECTOR_CODECS})")
+        self.rescore = RESCORE if rescore is None else rescore
+        self.replaces = replaces
+        self.metadata = metadata or {}
+
+        self.count = 0
+        self.dim: Optional[int] = None
+        self._bytes_written = 0
+        self._tmp_dir = _new_tmp_dir(doc_id)
+        self._chunks_file = open(os.path.join(self._tmp_dir, CHUNKS_FILE), "wb")
+        self._offsets_file = open(os.path.join(self._tmp_dir, self.OFFSET_SPOOL), "wb")
+        self._vectors_file = open(os.path.join(self._tmp_dir, self.VECTOR_SPOOL), "wb")
+        self._offsets_file.write(np.zeros(1, dtype=np.uint64).tobytes())
+        self._metadata = MetadataWriter()
+        self._closed = False
+        self.index_info: Optional[Dict[str, Any]] = None     # set by commit()
+
+        # Previous version: its chunks are compared while adding (shared prefix)
+        self._previous: Optional[DocumentStore] = None
+        self._shared = 0
+        if replaces and replaces != doc_id:
+            try:
+                self._previous = _load_store(replaces)
+            except Exception:
+                logger.warning(f"Previous version {replaces} not loadable – its index will not be reused")
+
+    def __enter__(self) -> "StoreWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if not self._closed:
+            self.abort()
+
+    def add(self, chunks: List[str], embeddings, metadatas: Optional[List[Dict[str, Any]]] = None) -> None:
+        if len(chunks) != len(embeddings):
+            raise ValueError(
+                f"Length mismatch: {len(chunks)} chunks vs {len(embeddings)} embeddings "
+                f"for document '{self.doc_id}'"
+            )
+        if metadatas is not None and len(metadatas) != len(chunks):
+            raise ValueError(
+                f"Length mismatch: {len(chunks)} chunks vs {len(metadatas)} metadata rows "
+                f"for document '{self.doc_id}'"
+            )
+        if not chunks:
+            return
+
+        emb_array = np.array(embeddings, dtype=np.float32)   # private copy, normalized in place
+        if emb_array.ndim != 2 or emb_array.shape[1] <= 0:
+            raise ValueError(f"Invalid embedding shape {emb_array.shape} for document '{self.doc_id}'")
+        if self.dim is None:
+            self.dim = int(emb_array.shape[1])
+        elif emb_array.shape[1] != self.dim:
+            raise ValueError(f"Embedding dimension changed mid-document: {emb_array.shape[1]} vs {self.dim}")
+
+        if self.normalize:
+            faiss.normalize_L2(emb_array)  # in-place normalization (good for cosine similarity)
+        self._vectors_file.write(emb_array.tobytes())
+
+        previous = self._previous
+        if previous is not None and self._shared == self.count:          # prefix still unbroken
+            old_chunks = previous.chunks
+            for chunk in chunks:
+                if self._shared >= len(old_chunks) or old_chunks[self._shared] != chunk:
+                    break
+                self._shared += 1
+
+        offsets = np.empty(len(chunks), dtype=np.uint64)
+        for i, chunk in enumerate(chunks):
+            data = chunk.encode("utf-8")
+            self._chunks_file.write(data)
+            self._bytes_written += len(data)
+            offsets[i] = self._bytes_written
+        self._offsets_file.write(offsets.tobytes())
+        self._metadata.add(metadatas if metadatas is not None else ({} for _ in chunks))
+
+        self.count += len(chunks)
+
+    def commit(self) -> str:
+        """Build the index, write the header and publish the store. Returns its path."""
+        for f in (self._chunks_file, self._offsets_file, self._vectors_file):
+            f.close()
+        self._closed = True
+
+        try:
+            if self.count == 0:
+                raise ValueError(f"No chunks provided for document '{self.doc_id}'")
+
+            offsets = np.fromfile(os.path.join(self._tmp_dir, self.OFFSET_SPOOL), dtype=np.uint64)
+            np.save(os.path.join(self._tmp_dir, OFFSETS_FILE), offsets)
+            os.remove(os.path.join(self._tmp_dir, self.OFFSET_SPOOL))
+
+            vectors = np.memmap(os.path.join(self._tmp_dir, self.VECTOR_SPOOL), dtype=np.float32,
+                                mode="r", shape=(self.count, self.dim))
+
+            # In-place update of the previous version's index, else exact flat
+            # index for small documents, ANN (trained here) for large ones
+            updated = self._update_previous_index(vectors)
+            if updated is not None:
+                index, index_info = updated
+            else:
+                index, index_info = build_index(vectors, index_type=self.index_type, codec=self.codec)
+            self.index_info = index_info
+            faiss.write_index(index, os.path.join(self._tmp_dir, INDEX_FILE))
+            del index
+
+            del vectors
+            # Full-precision copy only pays off when the index itself is lossy
+            rescore = self.rescore and index_info["codec"] != "float32"
+
+            self._metadata.write(self._tmp_dir)
+
+            _write_header(self._tmp_dir, {
+                "format_version": STORE_FORMAT_VERSION,
+                "dim": self.dim,
+                "count": self.count,
+                "normalized": self.normalize,
+                "index": index_info,
+                "storage": {"codec": index_info["codec"], "rescore": rescore},
+                "metadata": self.metadata,
+                "created_at": time.time(),
+            })
+            store_dir = _swap_into_place(self._tmp_dir, self.doc_id)
+
+        except Exception:
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+            raise
+
+        # Register in the collection only once the store is published: a failure
+        # here leaves a store that sync_collection() adds later, never a
+        # collection entry without a store. The float32 spool (now in store_dir)
+        # feeds the collection and is dropped afterwards unless kept for rescoring.
+        vectors_path = os.path.join(store_dir, self.VECTOR_SPOOL)
+        try:
+            vectors = np.memmap(vectors_path, dtype=np.float32, mode="r", shape=(self.count, self.dim))
+            get_collection().add_document(self.doc_id, vectors, normalized=self.normalize, replaces=self.replaces)
+            del vectors
+        finally:
+            if not rescore and os.path.isfile(vectors_path):
+                os.remove(vectors_path)
+
+        if self.replaces and self.replaces != self.doc_id:
+            _delete_store_files(self.replaces)
+
+        # Legacy pickle for the same doc_id would otherwise be listed twice
+        if os.path.isfile(_legacy_path(self.doc_id)):
+            os.remove(_legacy_path(self.doc_id))
+
+        _index_cache.pop(self.doc_id)
+        logger.info(f"Saved FAISS store: {self.doc_id} | {self.count} chunks | dim={self.dim} | path={store_dir}")
+        return store_dir
+
+    def _update_previous_index(self, vectors: np.ndarray) -> Optional[Tuple[faiss.Index, Dict[str, Any]]]:
+        """
+        The previous version's index with its rows past the shared prefix
+        removed and this version's remaining vectors appended – row i is still
+        chunk i. None when it cannot stand in for a fresh build: another model,
+        dimension, normalization, index type or codec; too little shared; or
+        an HNSW graph that would have to drop nodes (FAISS HNSW has no
+        remove_ids, so only pure appends are updated in place). IVF / PQ
+        indexes keep their trained centroids and codebooks.
+        """
+        previous = self._previous
+        if previous is None or self._shared < max(1, INCREMENTAL_MIN_SHARED * self.count):
+            return None
+
+        info = dict(previous.header.get("index") or {})
+        index_type = choose_index_type(self.count) if self.index_type == "auto" else self.index_type
+        codec = "pq" if index_type == "ivf_pq" else self.codec
+        if (
+            info.get("index_type") != index_type
+            or info.get("codec", "float32") != codec
+            or int(previous.header.get("dim", -1)) != self.dim
+            or previous.normalized != self.normalize
+            or (previous.header.get("metadata") or {}).get("embedding_model") != self.metadata.get("embedding_model")
+        ):
+            return None
+
+        # Private, writable copy (the cached one may be memory-mapped / in use by readers)
+        index = faiss.read_index(os.path.join(_store_dir(previous.doc_id), INDEX_FILE))
+        if index.ntotal > self._shared:
+            if isinstance(index, faiss.IndexHNSW):
+                return None
+            index.remove_ids(faiss.IDSelectorRange(self._shared, index.ntotal))
+        if index.ntotal != self._shared:
+            return None
+        index.add(np.ascontiguousarray(vectors[self._shared:], dtype=np.float32))
+
+        info.update({"updated_from": previous.doc_id, "reused_vectors": self._shared})
+        logger.info(f"Updated index of {previous.doc_id[:8]}… in place for {self.doc_id[:8]}… | "
+                    f"kept {self._shared} vectors, added {self.count - self._shared}")
+        return index, info
+
+    def abort(self) -> None:
+        for f in (self._chunks_file, self._offsets_file, self._vectors_file):
+            f.close()
+        self._closed = True
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+
+
+def _open_store(doc_id: str, version: Tuple[int, int]) -> DocumentStore:
+    store_dir = _store_dir(doc_id)
+    with open(os.path.join(store_dir, HEADER_FILE), "r", encoding="utf-8") as f:
+        header = json.load(f)
+
+    if header.get("format_version") != STORE_FORMAT_VERSION:
+        raise RuntimeError(
+            f"Unsupported vector store format {header.get('format_version')} for doc_id '{doc_id}'"
+        )
+
+    index_path = os.path.join(store_dir, INDEX_FILE)
+    index, mmapped = None, False
+    for flags in _mmap_read_flags():
+        try:
+            index = faiss.read_index(index_path, flags)
+            mmapped = True
+            break
+        except RuntimeError:
+            continue
+    if index is None:
+        index = faiss.read_index(index_path)
+
+    return DocumentStore(doc_id, header, index, ChunkReader(store_dir), mmapped, version)
+
+
+# ────────────────────────────────────────────────
+#  Legacy (pickle) migration
+# ────────────────────────────────────────────────
+
+def migrate_legacy_store(doc_id: str, remove_legacy: bool = True) -> str:
+    """
+    Convert a legacy {doc_id}.faiss.pkl store to the v2 layout.
+
+    Returns:
+        Path of the new store directory
+    """
+    legacy_path = _legacy_path(doc_id)
+    with open(legacy_path, "rb") as f:
+        data = pickle.load(f)
+
+    index: faiss.Index = data["index"]
+    chunks: List[str] = data["chunks"]
+    header = {
+        "format_version": STORE_FORMAT_VERSION,
+        "dim": int(data.get("dim", index.d)),
+        "count": len(chunks),
+        "normalized": bool(data.get("normalized", False)),
+        "index": {"index_type": "flat"},
+        "created_at": time.time(),
+        "migrated_from": os.path.basename(legacy_path),
+    }
+    store_dir = _write_store(doc_id, index, chunks, header)
+
+    if remove_legacy:
+        os.remove(legacy_path)
+    logger.info(f"Migrated legacy vector store {doc_id} → {store_dir}")
+    return store_dir
+
+
+def migrate_legacy_stores(remove_legacy: bool = True) -> List[str]:
+    """One-shot migration of every legacy pickle store. Returns migrated doc_ids."""
+    migrated = []
+    for name in os.listdir(VECTOR_STORE_DIR):
+        if not name.endswith(LEGACY_SUFFIX):
+            continue
+        doc_id = name[: -len(LEGACY_SUFFIX)]
+        try:
+            migrate_legacy_store(doc_id, remove_legacy=remove_legacy)
+            migrated.append(doc_id)
+        except Exception:
+            logger.exception(f"Migration failed for legacy store {name}")
+    return migrated
+
+
+# ────────────────────────────────────────────────
+#  Resident index cache
+# ────────────────────────────────────────────────
+
+_index_cache = LRUCache(INDEX_CACHE_MAX_BYTES, sizeof=lambda store: store.nbytes())
+_index_cache_invalidations = 0
+_load_locks: Dict[str, threading.Lock] = {}
+_load_locks_guard = threading.Lock()
+
+
+def _doc_load_lock(doc_id: str) -> threading.Lock:
+    with _load_locks_guard:
+        lock = _load_locks.get(doc_id)
+        if lock is None:
+            lock = _load_locks[doc_id] = threading.Lock()
+        return lock
+
+
+def _store_version(doc_id: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat_result = os.stat(os.path.join(_store_dir(doc_id), HEADER_FILE))
+    except FileNotFoundError:
+        return None
+    return (stat_result.st_mtime_ns, stat_result.st_size)
+
+
+def _load_store(doc_id: str) -> DocumentStore:
+    """
+    Return the opened store for doc_id, touching disk only when it is not
+    cached or the header on disk changed since it was cached (mtime/size).
+    """
+    global _index_cache_invalidations
+
+    version = _store_version(doc_id)
+    if version is None:
+        if not os.path.isfile(_legacy_path(doc_id)):
+            _index_cache.pop(doc_id)
+            raise FileNotFoundError(f"No vector store found for doc_id '{doc_id}' in {VECTOR_STORE_DIR}")
+        with _doc_load_lock(doc_id):
+            if _store_version(doc_id) is None:
+                migrate_legacy_store(doc_id)
+        version = _store_version(doc_id)
+
+    cached = _index_cache.peek(doc_id)
+    if cached is not None and cached.version != version:
+        _index_cache.pop(doc_id)
+        _index_cache_invalidations += 1
+
+    store = _index_cache.get(doc_id)
+    if store is not None:
+        return store
+
+    with _doc_load_lock(doc_id):
+        # Another thread may have loaded it while we were waiting
+        store = _index_cache.peek(doc_id)
+        if store is not None and store.version == version:
+            return store
+
+        with span("index_load", doc_id=doc_id) as load_span:
+            store = _open_store(doc_id, version)
+            load_span.set(mmapped=store.mmapped, count=len(store.chunks))
+        _index_cache.put(doc_id, store)
+        logger.debug(f"Opened vector store {doc_id[:8]}… (mmap={store.mmapped})")
+        return store
+
+
+def _delete_store_files(doc_id: str) -> None:
+    _index_cache.pop(doc_id)
+    shutil.rmtree(_store_dir(doc_id), ignore_errors=True)
+    if os.path.isfile(_legacy_path(doc_id)):
+        os.remove(_legacy_path(doc_id))
+
+
+def delete_document(doc_id: str) -> bool:
+    """Remove a document from the collection and delete its store. Returns False if unknown."""
+    in_collection = get_collection().remove_document(doc_id)
+    on_disk = _store_version(doc_id) is not None or os.path.isfile(_legacy_path(doc_id))
+    _delete_store_files(doc_id)
+    return in_collection or on_disk
+
+
+def get_store_header(doc_id: str) -> Optional[Dict[str, Any]]:
+    """Header of the stored index for doc_id, or None if there is none"""
+    try:
+        return _load_store(doc_id).header
+    except FileNotFoundError:
+        return None
+
+
+def resolve_chunk_refs(chunks: List[Any]) -> List[Any]:
+    """
+    Fill in the text of chunk references ({"ref": [doc_id, chunk_index], ...},
+    see utils.mcp.chunk_refs_payload) from the stored chunks. Other chunks
+    are returned as they are.
+    """
+    resolved = []
+    for chunk in chunks:
+        if isinstance(chunk, dict) and "ref" in chunk and "text" not in chunk:
+            doc_id, chunk_index = chunk["ref"]
+            chunk = {k: v for k, v in chunk.items() if k != "ref"}
+            chunk["text"] = _load_store(doc_id).chunks[int(chunk_index)]
+        resolved.append(chunk)
+    return resolved
+
+
+def get_index_version(doc_id: Optional[str] = None) -> str:
+    """
+    Opaque token that changes whenever the searched index changes: the store of
+    doc_id, or (doc_id=None) the set of documents in the collection.
+    """
+    if doc_id:
+        header = get_store_header(doc_id)
+        return "missing" if header is None else str(header.get("created_at"))
+    docs = get_collection().manifest()["docs"]
+    members = sorted((d, entry["ordinal"]) for d, entry in docs.items())
+    return hashlib.sha256(json.dumps(members).encode("utf-8")).hexdigest()[:16]
+
+
+def get_index_cache_stats() -> Dict[str, Any]:
+    """Hit/miss/eviction counters for the resident index cache"""
+    stats = _index_cache.stats()
+    stats["invalidations"] = _index_cache_invalidations
+    return stats
+
+
+def configure_index_cache(max_bytes: int) -> None:
+    """Change the memory budget; evicts immediately if now over budget"""
+    _index_cache.resize(max_bytes)
+
+
+def clear_index_cache() -> None:
+    _index_cache.clear()
+
+
+# ────────────────────────────────────────────────
+#  Public API
+# ────────────────────────────────────────────────
 
 def save_embeddings(
     doc_id: str,
     chunks: List[str],
     embeddings: List[List[float]],
     normalize: bool = True,
+    index_type: str = "auto",
+    replaces: Optional[str] = None,
+    metadatas: Optional[List[Dict[str, Any]]] = None,
+    codec: Optional[str] = None,
+    rescore: Optional[bool] = None,
 ) -> str:
     """
-    Save text chunks + FAISS index to disk using pickle.
-    
+    Save text chunks + FAISS index to disk (format v2, see top of module).
+
     Args:
         doc_id:      Unique document identifier
         chunks:      List of text strings (chunks)
         embeddings:  List of embedding vectors (same length as chunks)
         normalize:   Whether to normalize vectors before indexing (recommended for cosine-like similarity)
-    
+        index_type:  "flat", "ivf_flat", "ivf_pq", "hnsw" or "auto" (see utils.index_types)
+        replaces:    doc_id of a previous version; its vectors are swapped out of the
+                     collection in place and its per-document store is deleted
+        metadatas:   optional per-chunk metadata dicts (same length as chunks), stored
+                     column-wise and usable as search filters
+        codec:       "float32", "float16" or "int8" vector storage (default RAG_VECTOR_CODEC)
+        rescore:     keep float32 vectors on disk for exact re-ranking (default RAG_RESCORE)
+
     Returns:
-        Full path to the saved file
+        Path of the saved store directory
     """
     if not chunks:
         raise ValueError(f"No chunks provided for document '{doc_id}'")
-    if not embeddings:
+    if embeddings is None or len(embeddings) == 0:
         raise ValueError(f"No embeddings provided for document '{doc_id}'")
     if len(chunks) != len(embeddings):
         raise ValueError(
@@ -39,38 +711,83 @@ def save_embeddings(
             f"for document '{doc_id}'"
         )
 
-    # Convert to numpy array
-    emb_array = np.array(embeddings, dtype=np.float32)
+    try:
+        with StoreWriter(doc_id, normalize=normalize, index_type=index_type, replaces=replaces,
+                         codec=codec, rescore=rescore) as writer:
+            writer.add(chunks, embeddings, metadatas)
+            return writer.commit()
 
-    if normalize:
-        faiss.normalize_L2(emb_array)  # in-place normalization (good for cosine similarity)
+    except Exception as e:
+        logger.exception(f"Failed to save vector store for {doc_id}")
+        raise RuntimeError(f"Could not save vector store: {str(e)}")
 
-    dim = emb_array.shape[1]
-    if dim <= 0:
-        raise ValueError(f"Invalid embedding dimension: {dim}")
 
-    # Create simple exact L2 index (good for < 100k vectors)
-    index = faiss.IndexFlatL2(dim)
-    index.add(emb_array)
+def _embed_query(query: str, normalize: bool) -> np.ndarray:
+    # Same engine (model/settings) as ingestion, served from its query cache
+    with span("query_embed"):
+        query_vec = np.array(get_engine().embed_query(query), dtype=np.float32).reshape(1, -1)
+        if normalize:
+            faiss.normalize_L2(query_vec)
+    return query_vec
 
-    file_path = os.path.join(VECTOR_STORE_DIR, f"{doc_id}.faiss.pkl")
 
-    try:
-        with open(file_path, "wb") as f:
-            pickle.dump({
-                "index": index,
-                "chunks": chunks,
-                "dim": dim,
-                "count": len(chunks),
-                "normalized": normalize,
-            }, f, protocol=pickle.HIGHEST_PROTOCOL)
-
-        logger.info(f"Saved FAISS store: {doc_id} | {len(chunks)} chunks | dim={dim} | path={file_path}")
-        return file_path
+def _embed_queries(queries: List[str], normalize: bool) -> np.ndarray:
+    # One batched encode for all cache misses → (n, dim) matrix
+    with span("query_embed", queries=len(queries)):
+        query_vecs = np.array(get_engine().embed_queries(queries), dtype=np.float32)
+        if normalize:
+            faiss.normalize_L2(query_vecs)
+    return query_vecs
 
-    except Exception as e:
-        logger.exception(f"Failed to save vector store for {doc_id}")
-        raise RuntimeError(f"Could not save vector store: {str(e)}")
+
+def _rescore(full_vectors: np.ndarray, query_vec: np.ndarray, ids: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Exact squared-L2 re-ranking of candidate ids against float32 vectors → (distances, ids), best k"""
+    ids = ids[ids >= 0]
+    if len(ids) == 0:
+        return np.zeros(0, dtype=np.float32), ids
+    candidates = np.asarray(full_vectors[np.sort(ids)], dtype=np.float32)   # sorted → sequential page reads
+    dists = ((candidates - query_vec) ** 2).sum(axis=1)
+    order = np.argsort(dists, kind="stable")[:k]
+    return dists[order], np.sort(ids)[order]
+
+
+def _rescore_hits(query_vec: np.ndarray, hits: List[Tuple[float, str, int]], k: int) -> List[Tuple[float, str, int]]:
+    rescored = []
+    for dist, hit_doc_id, chunk_index in hits:
+        full_vectors = _load_store(hit_doc_id).full_vectors
+        if full_vectors is not None:
+            dist = float(((np.asarray(full_vectors[chunk_index]) - query_vec) ** 2).sum())
+        rescored.append((dist, hit_doc_id, chunk_index))
+    rescored.sort(key=lambda hit: hit[0])
+    return rescored[:k]
+
+
+def _doc_selector(store: DocumentStore, metadata_filter: Optional[Dict[str, Any]]) -> Tuple[bool, Any]:
+    """(any row can match, FAISS ID selector or None) for a metadata filter on one store"""
+    mask = store.metadata.match(metadata_filter)
+    if mask is None:
+        return True, None
+    if not mask.any():
+        return False, None
+    return True, None if mask.all() else bitmap_selector(mask)
+
+
+def _doc_results(store: DocumentStore, distances: np.ndarray, indices: np.ndarray,
+                 min_distance: Optional[float], with_metadata: bool) -> List[Tuple]:
+    """One query's search row → (chunk_text, distance[, metadata]) tuples"""
+    chunks = store.chunks
+    results = []
+    for dist, idx in zip(distances, indices):
+        if idx < 0 or idx >= len(chunks):
+            continue
+        if min_distance is not None and dist > min_distance:
+            continue
+        if with_metadata:
+            meta = {**store.metadata.row(int(idx)), "doc_id": store.doc_id, "chunk_index": int(idx)}
+            results.append((chunks[int(idx)], float(dist), meta))
+        else:
+            results.append((chunks[int(idx)], float(dist)))
+    return results
 
 
 def search_similar_chunks(
@@ -78,51 +795,51 @@ def search_similar_chunks(
     query: str,
     k: int = 5,
     min_distance: float = None,          # optional threshold
-) -> List[Tuple[str, float]]:
+    nprobe: Optional[int] = None,        # IVF indexes: inverted lists to visit
+    ef_search: Optional[int] = None,     # HNSW indexes: candidate list size
+    rescore: Optional[bool] = None,      # None → whenever the store kept float32 vectors
+    metadata_filter: Optional[Dict[str, Any]] = None,
+    with_metadata: bool = False,
+) -> List[Tuple]:
     """
     Retrieve top-k most similar chunks for a query.
-    
+
+    nprobe / ef_search trade recall for latency on ANN indexes and are
+    ignored by exact (flat) indexes. On float16 / int8 stores written with
+    rescore, the top RESCORE_FACTOR × k candidates are re-ranked exactly.
+
+    metadata_filter (see utils.metadata_store) is evaluated against the
+    per-field indexes and applied inside the FAISS search as an ID selector.
+
     Returns:
-        List of (chunk_text, distance) tuples, sorted by similarity (smallest distance first)
+        List of (chunk_text, distance) tuples — (chunk_text, distance, metadata)
+        with with_metadata — sorted by similarity (smallest distance first)
     """
-    from utils.embedding import get_embeddings   # ← use the same function as ingestion
-
-    file_path = os.path.join(VECTOR_STORE_DIR, f"{doc_id}.faiss.pkl")
-    if not os.path.isfile(file_path):
-        raise FileNotFoundError(f"No vector store found for doc_id '{doc_id}' at {file_path}")
+    store = _load_store(doc_id)
 
     try:
-        with open(file_path, "rb") as f:
-            data = pickle.load(f)
-
-        index: faiss.Index = data["index"]
-        chunks: List[str] = data["chunks"]
-        dim: int = data["dim"]
-        normalized: bool = data.get("normalized", False)
+        index: faiss.Index = store.index
+        chunks: ChunkReader = store.chunks
 
         if len(chunks) == 0 or index.ntotal == 0:
             return []
 
-        # Generate query embedding (same model/settings as during ingestion!)
-        query_emb_list = get_embeddings([query.strip()])
-        if not query_emb_list or len(query_emb_list) == 0:
-            raise ValueError("Failed to generate query embedding")
+        matches, sel = _doc_selector(store, metadata_filter)
+        if not matches:
+            return []
 
-        query_vec = np.array(query_emb_list[0], dtype=np.float32).reshape(1, -1)
+        query_vec = _embed_query(query, normalize=store.normalized)
 
-        if normalized:
-            faiss.normalize_L2(query_vec)
+        # Search (over-fetch when re-ranking against full-precision vectors)
+        rescore = store.can_rescore if rescore is None else (rescore and store.can_rescore)
+        with span("search", doc_id=doc_id, k=k, rescore=rescore, filtered=sel is not None):
+            params = search_params(index, nprobe=nprobe, ef_search=ef_search, sel=sel)
+            distances, indices = index.search(query_vec, k * RESCORE_FACTOR if rescore else k, params=params)
+            distances, indices = distances[0], indices[0]
+            if rescore:
+                distances, indices = _rescore(store.full_vectors, query_vec[0], indices, k)
 
-        # Search
-        distances, indices = index.search(query_vec, k)
-
-        results = []
-        for dist, idx in zip(distances[0], indices[0]):
-            if idx < 0 or idx >= len(chunks):
-                continue
-            if min_distance is not None and dist > min_distance:
-                continue
-            results.append((chunks[idx], float(dist)))
+        results = _doc_results(store, distances, indices, min_distance, with_metadata)
 
         logger.debug(f"Retrieved {len(results)} chunks for query in doc {doc_id[:8]}…")
 
@@ -133,8 +850,253 @@ def search_similar_chunks(
         raise RuntimeError(f"Vector search failed: {str(e)}")
 
 
+def _collection_scope(
+    manifest: Dict[str, Any],
+    doc_ids: Optional[List[str]],
+    metadata_filter: Optional[Dict[str, Any]],
+) -> Tuple[Optional[List[str]], Optional[Dict[str, np.ndarray]]]:
+    """
+    Resolve a metadata filter per document into (doc_ids, doc_rows) for
+    Collection.search: documents with any match, and the allowed chunk rows of
+    those that match only partly. An empty doc_ids list means nothing matches.
+    """
+    if not metadata_filter:
+        return doc_ids, None
+    candidates = doc_ids if doc_ids is not None else list(manifest["docs"])
+    doc_ids, doc_rows = [], {}
+    for candidate in candidates:
+        if candidate not in manifest["docs"]:
+            continue
+        mask = _load_store(candidate).metadata.match(metadata_filter)
+        if mask.all():
+            doc_ids.append(candidate)
+        elif mask.any():
+            doc_ids.append(candidate)
+            doc_rows[candidate] = np.flatnonzero(mask)
+    return doc_ids, doc_rows
+
+
+def _collection_results(hits: List[Tuple[float, str, int]], min_distance: Optional[float]) -> List[Tuple]:
+    """One query's collection hits → (chunk_text, distance, metadata) tuples"""
+    results = []
+    for dist, hit_doc_id, chunk_index in hits:
+        if min_distance is not None and dist > min_distance:
+            continue
+        store = _load_store(hit_doc_id)
+        meta = {**store.metadata.row(chunk_index), "doc_id": hit_doc_id, "chunk_index": chunk_index}
+        results.append((store.chunks[chunk_index], dist, meta))
+    return results
+
+
+def search_collection(
+    query: str,
+    k: int = 5,
+    doc_ids: Optional[List[str]] = None,
+    min_distance: float = None,
+    rescore: Optional[bool] = None,      # None → when the collection stores float16
+    metadata_filter: Optional[Dict[str, Any]] = None,
+) -> List[Tuple[str, float, Dict[str, Any]]]:
+    """
+    Corpus-wide search over the collection index (optionally restricted to doc_ids).
+
+    metadata_filter is resolved per document into allowed chunk rows, which
+    become the ID selector of the shard searches.
+
+    On a float16 collection the top RESCORE_FACTOR × k hits are re-ranked
+    against the float32 vectors of stores that kept them (others keep their
+    float16 distance).
+
+    Returns:
+        List of (chunk_text, distance, metadata) tuples, best first; metadata
+        holds doc_id, chunk_index and the stored document / chunk fields
+    """
+    collection = get_collection()
+    manifest = collection.manifest()
+    if not manifest["docs"]:
+        return []
+
+    try:
+        doc_ids, doc_rows = _collection_scope(manifest, doc_ids, metadata_filter)
+        if doc_ids is not None and not doc_ids:
+            return []
+
+        query_vec = _embed_query(query, normalize=bool(manifest["normalized"]))
+        if rescore is None:
+            rescore = (manifest.get("codec") or "float32") != "float32"
+        with span("search", scope="collection", k=k, rescore=rescore, filtered=doc_rows is not None):
+            hits = collection.search(query_vec, k=k * RESCORE_FACTOR if rescore else k,
+                                     doc_ids=doc_ids, doc_rows=doc_rows)[0]
+            if rescore:
+                hits = _rescore_hits(query_vec[0], hits, k)
+
+        results = _collection_results(hits, min_distance)
+
+        logger.debug(f"Retrieved {len(results)} chunks from collection ({len(manifest['docs'])} docs)")
+        return results
+
+    except Exception as e:
+        logger.exception("Collection search failed")
+        raise RuntimeError(f"Vector search failed: {str(e)}")
+
+
+def search_similar_chunks_batch(
+    doc_id: str,
+    queries: List[str],
+    k: int = 5,
+    min_distance: float = None,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+    rescore: Optional[bool] = None,
+    metadata_filter: Optional[Dict[str, Any]] = None,
+    with_metadata: bool = False,
+) -> List[List[Tuple]]:
+    """
+    search_similar_chunks for many queries against one document: the store is
+    opened once, the queries are embedded in one batch and searched with a
+    single (n, dim) index.search.
+
+    Returns:
+        One result list per query, in order (same tuples as search_similar_chunks)
+    """
+    if not queries:
+        return []
+    store = _load_store(doc_id)
+
+    try:
+        index: faiss.Index = store.index
+        if len(store.chunks) == 0 or index.ntotal == 0:
+            return [[] for _ in queries]
+
+        matches, sel = _doc_selector(store, metadata_filter)
+        if not matches:
+            return [[] for _ in queries]
+
+        query_vecs = _embed_queries(queries, normalize=store.normalized)
+
+        rescore = store.can_rescore if rescore is None else (rescore and store.can_rescore)
+        with span("search", doc_id=doc_id, k=k, queries=len(queries), rescore=rescore, filtered=sel is not None):
+            params = search_params(index, nprobe=nprobe, ef_search=ef_search, sel=sel)
+            distances, indices = index.search(query_vecs, k * RESCORE_FACTOR if rescore else k, params=params)
+            rows = list(zip(distances, indices))
+            if rescore:
+                rows = [_rescore(store.full_vectors, query_vecs[qi], ids, k) for qi, (_, ids) in enumerate(rows)]
+
+        return [_doc_results(store, dists, ids, min_distance, with_metadata) for dists, ids in rows]
+
+    except Exception as e:
+        logger.exception(f"Batch search failed for doc_id {doc_id}")
+        raise RuntimeError(f"Vector search failed: {str(e)}")
+
+
+def search_collection_batch(
+    queries: List[str],
+    k: int = 5,
+    doc_ids: Optional[List[str]] = None,
+    min_distance: float = None,
+    rescore: Optional[bool] = None,
+    metadata_filter: Optional[Dict[str, Any]] = None,
+) -> List[List[Tuple[str, float, Dict[str, Any]]]]:
+    """
+    search_collection for many queries: one batched embed, then one
+    (n, dim) search per collection shard (optionally restricted to doc_ids).
+
+    Returns:
+        One result list per query, in order (same tuples as search_collection)
+    """
+    if not queries:
+        return []
+    collection = get_collection()
+    manifest = collection.manifest()
+    if not manifest["docs"]:
+        return [[] for _ in queries]
+
+    try:
+        doc_ids, doc_rows = _collection_scope(manifest, doc_ids, metadata_filter)
+        if doc_ids is not None and not doc_ids:
+            return [[] for _ in queries]
+
+        query_vecs = _embed_queries(queries, normalize=bool(manifest["normalized"]))
+        if rescore is None:
+            rescore = (manifest.get("codec") or "float32") != "float32"
+        with span("search", scope="collection", k=k, queries=len(queries), rescore=rescore,
+                  filtered=doc_rows is not None):
+            per_query = collection.search(query_vecs, k=k * RESCORE_FACTOR if rescore else k,
+                                          doc_ids=doc_ids, doc_rows=doc_rows)
+            if rescore:
+                per_query = [_rescore_hits(query_vecs[qi], hits, k) for qi, hits in enumerate(per_query)]
+
+        return [_collection_results(hits, min_distance) for hits in per_query]
+
+    except Exception as e:
+        logger.exception("Collection batch search failed")
+        raise RuntimeError(f"Vector search failed: {str(e)}")
+
+
+# Stores that failed to sync, so a persistent failure is logged once, not on every listing
+_sync_failures = set()
+_synced_dir_version = None
+_sync_guard = threading.RLock()
+
+
+def _store_dir_version():
+    try:
+        return (VECTOR_STORE_DIR, os.stat(VECTOR_STORE_DIR).st_mtime_ns)
+    except FileNotFoundError:
+        return None
+
+
+def sync_collection() -> List[str]:
+    """
+    Register per-document stores that are missing from the collection
+    (e.g. stores written before the collection existed). Returns added doc_ids.
+    """
+    global _synced_dir_version
+    collection = get_collection()
+    added = []
+    with _sync_guard:
+        # Taken before the scan: a store landing mid-scan triggers another sync
+        _synced_dir_version = _store_dir_version()
+        for doc_id in _list_store_ids():
+            if doc_id in collection:
+                continue
+            try:
+                store = _load_store(doc_id)
+                vectors = reconstruct_vectors(store.index)
+                collection.add_document(doc_id, vectors, normalized=store.normalized)
+                added.append(doc_id)
+                _sync_failures.discard(doc_id)
+            except Exception:
+                if doc_id in _sync_failures:
+                    logger.debug(f"Still cannot add {doc_id} to the collection")
+                else:
+                    _sync_failures.add(doc_id)
+                    logger.exception(f"Could not add {doc_id} to the collection")
+    return added
+
+
+def _sync_collection_if_changed() -> None:
+    """sync_collection(), skipped while the store directory is unchanged since the last sync"""
+    with _sync_guard:
+        if _synced_dir_version is None or _store_dir_version() != _synced_dir_version:
+            sync_collection()
+
+
+def _list_store_ids() -> List[str]:
+    """doc_ids with a per-document store on disk (v2 or not-yet-migrated legacy)"""
+    doc_ids = set()
+    for name in os.listdir(VECTOR_STORE_DIR):
+        path = os.path.join(VECTOR_STORE_DIR, name)
+        if ".tmp-" in name or ".old-" in name:
+            continue    # store being swapped in by _write_store
+        if os.path.isfile(os.path.join(path, HEADER_FILE)):
+            doc_ids.add(name)
+        elif name.endswith(LEGACY_SUFFIX):
+            doc_ids.add(name[: -len(LEGACY_SUFFIX)])
+    return sorted(doc_ids)
+
+
 # Optional: helper to list all stored documents
 def list_stored_documents() -> List[str]:
-    """Return list of doc_ids that have a stored index"""
-    files = [f for f in os.listdir(VECTOR_STORE_DIR) if f.endswith(".faiss.pkl")]
-    return [os.path.splitext(f)[0] for f in files]
+    """Return list of doc_ids that have a stored index (a view over the collection)"""
+    _sync_collection_if_changed()
+    return get_collection().list_documents()